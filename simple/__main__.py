@@ -2,6 +2,7 @@ import logging
 import time
 
 try:
+    from simple.startup_report import startup_report
     from simple.app_args import setup_argparse, AppArgs, app_args
 
     app_args.data_dir.mkdir(exist_ok=True, parents=True)
@@ -11,7 +12,8 @@ try:
 
     setup_logging_config(None if is_running_in_windows and not is_running_in_pyinstaller_bundle else app_args.data_dir)
 
-    from simple.dns_server import do_action_dns_server
+    with startup_report.stage("imports"):
+        from simple.dns_server import do_action_dns_server
 
     do_action_dns_server(app_args)
 except Exception as e:
@@ -0,0 +1,191 @@
+import hmac
+import http.server
+import json
+import logging
+import socket
+import threading
+from pathlib import Path
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from simple.happy_eyeballs import family_health
+from simple.models import DnsServerConfig
+from simple.profiler import profile_requests, profile_stacks
+from simple.rate_limit import rate_limiter
+from simple.temp_rules import change_temp_rule, list_temp_rules
+
+logger = logging.getLogger(__name__)
+
+Route = Callable[["AdminServer", dict[str, str], Any], tuple[int, Any]]
+
+__routes__: dict[tuple[str, str], Route] = dict()
+
+
+def route(method: str, path: str) -> Callable[[Route], Route]:
+    def decorator(func: Route) -> Route:
+        __routes__[(method, path)] = func
+        return func
+
+    return decorator
+
+
+def _float(query: dict[str, str], key: str, default: float, low: float, high: float) -> float:
+    try:
+        value = float(query.get(key, default))
+    except ValueError:
+        raise ValueError(f"{key}: should be a number") from None
+
+    if not low <= value <= high:
+        raise ValueError(f"{key}: {value} should be between {low} and {high}")
+
+    return value
+
+
+class AdminServer(http.server.ThreadingHTTPServer):
+    """
+    small json api for the running server, only listens on the address of `admin` in config.json (127.0.0.1 by default).
+    a web page can still reach that address: every request needs the token, the `Host` of that address and json bodies
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address: tuple[str, int], config: DnsServerConfig, data_dir: Path):
+        self.config = config
+        self.data_dir = data_dir
+        self.profile_lock = threading.Lock()
+        if ":" in server_address[0]:
+            self.address_family = socket.AF_INET6
+
+        super().__init__(server_address, _AdminRequestHandler)
+        host, port = self.server_address[:2]
+        # a page of a dns rebinding attack sends its own name
+        self.host_header = f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+class _AdminRequestHandler(http.server.BaseHTTPRequestHandler):
+    server: AdminServer
+
+    def _refused(self) -> Optional[tuple[int, str]]:
+        if self.headers.get("Host", "").lower() != self.server.host_header:
+            return 403, "Host: should be " + self.server.host_header
+
+        token = self.server.config.admin.token
+        if token is None or not hmac.compare_digest(self.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+            return 401, "Authorization: should be Bearer <admin -> token of config.json>"
+
+        return None
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if (refused := self._refused()) is not None:
+            self._send(refused[0], {"error": refused[1]})
+            return
+
+        if (func := __routes__.get((method, url.path))) is None:
+            self._send(404, {"error": f"{method} {url.path} not found"})
+            return
+
+        try:
+            body = None
+            if (length := int(self.headers.get("Content-Length", "0"))) > 0:
+                # a form or text/plain post of a web page needs no cors preflight, json does
+                if self.headers.get_content_type() != "application/json":
+                    self._send(415, {"error": "Content-Type: should be application/json"})
+                    return
+
+                body = json.loads(self.rfile.read(length))
+
+            status, result = func(self.server, query, body)
+        except ValueError as e:
+            status, result = 400, {"error": str(e)}
+        except Exception as e:
+            logger.error(f"admin: {method} {url.path}", exc_info=e)
+            status, result = 500, {"error": f"{type(e).__name__}: {e}"}
+
+        self._send(status, result)
+
+    def _send(self, status: int, result: Any):
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+def _profile(server: AdminServer, func: Callable[[], dict]) -> tuple[int, Any]:
+    if not server.profile_lock.acquire(blocking=False):
+        return 409, {"error": "a profile is already running"}
+
+    try:
+        return 200, func()
+    finally:
+        server.profile_lock.release()
+
+
+@route("POST", "/profile/stacks")
+def _profile_stacks(server: AdminServer, query: dict[str, str], body: Any) -> tuple[int, Any]:
+    """?seconds=10&interval_ms=5&threads=all"""
+    seconds = _float(query, "seconds", 10, 0.1, 600)
+    interval = _float(query, "interval_ms", 5, 1, 1000) / 1000
+    directory = server.data_dir.joinpath("temp", "profiles")
+    return _profile(server, lambda: profile_stacks(directory, seconds, interval, query.get("threads") == "all"))
+
+
+@route("POST", "/profile/requests")
+def _profile_requests(server: AdminServer, query: dict[str, str], body: Any) -> tuple[int, Any]:
+    """?seconds=10&fraction=0.1"""
+    seconds = _float(query, "seconds", 10, 0.1, 600)
+    fraction = _float(query, "fraction", 0.1, 0.001, 1)
+    directory = server.data_dir.joinpath("temp", "profiles")
+    return _profile(server, lambda: profile_requests(directory, seconds, fraction))
+
+
+def _temp_rule(server: AdminServer, body: Any, add: bool) -> tuple[int, Any]:
+    if not isinstance(body, dict):
+        raise ValueError('body: should be {"kind": ..., "rule": ..., "persist": false}')
+
+    # only reached with the token (see _AdminRequestHandler._refused), still never silent: it changes answers for every client
+    result = change_temp_rule(server.config, server.data_dir, body.get("kind"), body.get("rule"), add, body.get("persist") is True)
+    logger.warning(f"admin: {'added' if add else 'removed'} {result['kind']} temp rule {', '.join(result['rules'])}, file {result['file']}")
+    return 200, result
+
+
+@route("GET", "/rules/temp")
+def _get_temp_rules(server: AdminServer, query: dict[str, str], body: Any) -> tuple[int, Any]:
+    return 200, list_temp_rules()
+
+
+@route("POST", "/rules/temp")
+def _add_temp_rule(server: AdminServer, query: dict[str, str], body: Any) -> tuple[int, Any]:
+    """{"kind": "blocked_names", "rule": "ads.example.com", "persist": false}"""
+    return _temp_rule(server, body, True)
+
+
+@route("DELETE", "/rules/temp")
+def _remove_temp_rule(server: AdminServer, query: dict[str, str], body: Any) -> tuple[int, Any]:
+    return _temp_rule(server, body, False)
+
+
+@route("GET", "/rate-limit")
+def _rate_limit(server: AdminServer, query: dict[str, str], body: Any) -> tuple[int, Any]:
+    return 200, rate_limiter.report()
+
+
+@route("GET", "/upstreams")
+def _upstreams(server: AdminServer, query: dict[str, str], body: Any) -> tuple[int, Any]:
+    """smoothed latency and failures of every upstream by address family"""
+    return 200, family_health.report()
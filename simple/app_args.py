@@ -21,6 +21,7 @@ def setup_argparse() -> AppArgs:
     parser.add_argument(
         "--service", type=str, choices=["install", "start", "stop", "remove", "restart", "run"], help="windows only. manage windows service"
     )
+    parser.add_argument("--startup-report", action="store_true", help="start, answer one query, print how long every step took and exit")
     args, _ = parser.parse_known_args()
     args = vars(args)
     result = AppArgs(**args)
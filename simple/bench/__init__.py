@@ -0,0 +1,56 @@
+import math
+import os
+import sys
+from typing import Optional
+
+
+def percentile(sorted_values: list[float], p: float) -> Optional[float]:
+    """nearest-rank percentile, `sorted_values` must be sorted ascending"""
+    if len(sorted_values) == 0:
+        return None
+
+    k = max(0, min(len(sorted_values) - 1, math.ceil(round(p * len(sorted_values) / 100, 9)) - 1))
+    return sorted_values[k]
+
+
+def process_rss_bytes() -> tuple[Optional[int], Optional[int]]:
+    """(current rss, peak rss) of this process in bytes, None if unknown on this platform"""
+    if sys.platform == "win32":
+        import ctypes
+        import ctypes.wintypes
+
+        # noinspection PyPep8Naming
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", ctypes.wintypes.DWORD),
+                ("PageFaultCount", ctypes.wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None, None
+
+        return counters.WorkingSetSize, counters.PeakWorkingSetSize
+
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak if sys.platform == "darwin" else peak * 1024
+    current = None
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return current, peak
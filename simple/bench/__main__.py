@@ -0,0 +1,164 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import sys
+import time
+from pathlib import Path
+
+from simple.app_args import app_args
+from simple.app_logging import setup_logging_config
+from simple.bench import process_rss_bytes
+from simple.bench.fake_upstream import FakeUpstreamOptions, generate_self_signed_cert, run_fake_upstream
+from simple.bench.load import LoadOptions, run_load
+from simple.models import AppArgs, DnsServerUpstreamProtocol
+
+logger = logging.getLogger(__name__)
+
+__bench_marker__ = "bench.json"
+
+
+def setup_bench_argparse() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m simple.bench", description="end-to-end load benchmark against a local fake upstream")
+    parser.add_argument("--data-dir", type=Path, required=True, help="an empty directory (or one created by a previous bench run)")
+    parser.add_argument("--port", type=int, default=5354, help="port of the server under test, default: 5354")
+    parser.add_argument(
+        "--protocol", type=str, choices=[x.value for x in DnsServerUpstreamProtocol], default="udp", help="upstream protocol"
+    )
+    parser.add_argument("--latency-ms", type=float, default=0, help="fake upstream latency")
+    parser.add_argument("--loss", type=float, default=0, help="fake upstream loss ratio, 0 ~ 1")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--queries", type=int, default=10000, help="measured queries")
+    parser.add_argument("--warmup", type=int, default=200, help="queries before measuring")
+    parser.add_argument("--hit-ratio", type=float, default=0.8, help="share of upstream queries repeating the hot names")
+    parser.add_argument("--hot-names", type=int, default=100, help="size of the hot name set")
+    parser.add_argument("--blocked-share", type=float, default=0.1, help="share of queries for blocked names")
+    parser.add_argument("--cloaked-share", type=float, default=0.1, help="share of queries for cloaked names")
+    parser.add_argument("--tcp-share", type=float, default=0.1, help="share of queries sent over tcp")
+    parser.add_argument("--blocked-rules", type=int, default=10000, help="generated blocked_names rules")
+    parser.add_argument("--cloaking-rules", type=int, default=100, help="generated cloaking_rules")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="also write the json report to this file")
+    args, _ = parser.parse_known_args()
+    return args
+
+
+def prepare_data_dir(data_dir: Path, args: argparse.Namespace, upstream: dict) -> tuple[list[str], list[str], list[str]]:
+    config_file = data_dir.joinpath("config.json")
+    marker_file = data_dir.joinpath(__bench_marker__)
+    if data_dir.exists() and any(data_dir.iterdir()) and not marker_file.exists():
+        raise ValueError(f"refusing to use {data_dir}, not made by a bench run, pass --data-dir pointing at an empty directory")
+
+    data_dir.mkdir(exist_ok=True, parents=True)
+    marker_file.write_text(json.dumps({"created_by": "simple.bench"}))
+    for w in ["data.sqlite3", "data.sqlite3-wal", "data.sqlite3-shm"]:
+        data_dir.joinpath(w).unlink(missing_ok=True)
+
+    blocked_names = ["b{:07d}.ads.bench".format(x) for x in range(args.blocked_rules)]
+    cloaked_names = ["c{:05d}.cloak.bench".format(x) for x in range(args.cloaking_rules)]
+    hot_names = ["h{:05d}.hot.bench".format(x) for x in range(args.hot_names)]
+    data_dir.joinpath("blocked-names.txt").write_text("\n".join(blocked_names))
+    cloaking_lines = ["{}    10.{}.{}.{}".format(x, i >> 16 & 255, i >> 8 & 255, i & 255) for i, x in enumerate(cloaked_names)]
+    data_dir.joinpath("cloaking-rules.txt").write_text("\n".join(cloaking_lines))
+
+    config = {
+        "ipv6": True,
+        "default": ["bench"],
+        "upstream": {"bench": upstream},
+        "rules": {"blocked_names": "blocked-names.txt", "cloaking_rules": "cloaking-rules.txt"},
+    }
+    config_file.write_text(json.dumps(config, indent=2))
+    return hot_names, blocked_names, cloaked_names
+
+
+def run_bench(args: argparse.Namespace) -> dict:
+    from simple.db import TheDbJob
+    from simple.dns_server import start_server
+
+    # data.sqlite3, the request logs and the temp files follow the global app_args, parsed from the same --data-dir
+    data_dir = args.data_dir
+    if data_dir.resolve() != app_args.data_dir.resolve():
+        raise ValueError(f"--data-dir: {data_dir} is not the data dir of the server, {app_args.data_dir}")
+
+    protocol = DnsServerUpstreamProtocol(args.protocol)
+    cert_file, key_file = None, None
+    if protocol in (DnsServerUpstreamProtocol.TLS, DnsServerUpstreamProtocol.HTTPS):
+        cert_file, key_file = generate_self_signed_cert(data_dir.joinpath("temp", "bench"))
+
+    # the fake upstream and the clients run in their own processes, so cpu and rss below belong to the server alone
+    context = multiprocessing.get_context("spawn")
+    upstream_connection, upstream_connection_child = context.Pipe()
+    upstream_options = FakeUpstreamOptions(latency_ms=args.latency_ms, loss=args.loss, cert_file=cert_file, key_file=key_file)
+    upstream_process = context.Process(
+        target=run_fake_upstream, args=(upstream_options, [protocol], upstream_connection_child), daemon=True
+    )
+    upstream_process.start()
+    upstream_port = upstream_connection.recv()[protocol.value]
+
+    upstream = {"ip": ["127.0.0.1"], "preferred_protocol": protocol.value, "port": upstream_port}
+    if cert_file is not None:
+        upstream["ca_file"] = cert_file
+
+    hot_names, blocked_names, cloaked_names = prepare_data_dir(data_dir, args, upstream)
+    load_options = LoadOptions(
+        port=args.port,
+        clients=args.clients,
+        queries=args.queries,
+        warmup=args.warmup,
+        hit_ratio=args.hit_ratio,
+        blocked_share=args.blocked_share,
+        cloaked_share=args.cloaked_share,
+        tcp_share=args.tcp_share,
+        seed=args.seed,
+        hot_names=hot_names,
+        blocked_names=blocked_names,
+        cloaked_names=cloaked_names,
+    )
+
+    try:
+        with start_server(AppArgs(data_dir=data_dir, port=args.port)):
+            load_connection, load_connection_child = context.Pipe()
+            load_process = context.Process(target=run_load, args=(load_options, load_connection_child), daemon=True)
+            load_process.start()
+            load_connection.recv()
+            TheDbJob.request_log_queue.join()
+
+            cpu_start = time.process_time()
+            load_connection.send("go")
+            result = load_connection.recv()
+            TheDbJob.request_log_queue.join()
+            cpu_seconds = time.process_time() - cpu_start
+            rss, rss_peak = process_rss_bytes()
+            load_process.join()
+    finally:
+        upstream_connection.send("stop")
+        upstream_process.join(timeout=5)
+
+    answered = result["answered"]
+    result["cpu_ms_per_query"] = round(cpu_seconds * 1000 / answered, 4) if answered > 0 else None
+    result["cpu_s"] = round(cpu_seconds, 3)
+    result["rss_bytes"] = rss
+    result["rss_peak_bytes"] = rss_peak
+    result["options"] = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}
+    result["python"] = platform.python_version()
+    return result
+
+
+def main():
+    args = setup_bench_argparse()
+    setup_logging_config(console=False)
+    result = run_bench(args)
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if args.output is not None:
+        args.output.write_text(text)
+
+    print(text)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"{type(e).__name__}: {e}", file=sys.stderr)
+        sys.exit(1)
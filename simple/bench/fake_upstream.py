@@ -0,0 +1,243 @@
+import datetime
+import hashlib
+import http.server
+import ipaddress
+import random
+import socket
+import socketserver
+import ssl
+import struct
+import threading
+import time
+from contextlib import contextmanager, ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, cast, Optional
+
+import dns.message
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+
+from simple.models import DnsServerUpstreamProtocol
+
+
+@dataclass(kw_only=True, frozen=True)
+class FakeUpstreamOptions:
+    latency_ms: float = 0
+    loss: float = 0
+    cert_file: Optional[str] = None
+    key_file: Optional[str] = None
+
+
+def make_fake_response(data: bytes) -> bytes:
+    """
+    answer every A / AAAA question with a stable address derived from the name,
+    198.18.0.0/15 and 2001:2::/48 are reserved for benchmarking (rfc 2544, rfc 5180)
+    """
+    request_message = dns.message.from_wire(data)
+    response_message = dns.message.make_response(request_message)
+    question: dns.rrset.RRset = request_message.question[0]
+    digest = hashlib.blake2s(question.name.to_text().lower().encode(), digest_size=4).digest()
+    if question.rdtype == dns.rdatatype.A:
+        address = "198.{}.{}.{}".format(18 + (digest[0] & 1), digest[1], digest[2])
+    elif question.rdtype == dns.rdatatype.AAAA:
+        address = "2001:2::{:x}:{:x}".format(digest[0] << 8 | digest[1], digest[2] << 8 | digest[3])
+    else:
+        address = None
+
+    if address is not None:
+        rdata = dns.rdata.from_text(dns.rdataclass.IN, question.rdtype, address)
+        response_message.answer.append(dns.rrset.from_rdata_list(question.name, 300, [rdata]))
+
+    return response_message.to_wire()
+
+
+def generate_self_signed_cert(directory: Path) -> tuple[str, str]:
+    """self-signed certificate for 127.0.0.1 and ::1, also used as the ca_file of the upstream"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "LocalDnsServer bench upstream")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1")), x509.IPAddress(ipaddress.ip_address("::1"))]),
+            critical=False,
+        )
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(key.public_key()), critical=False)
+        .add_extension(
+            x509.KeyUsage(
+                digital_signature=True,
+                content_commitment=False,
+                key_encipherment=False,
+                data_encipherment=False,
+                key_agreement=False,
+                key_cert_sign=True,
+                crl_sign=False,
+                encipher_only=False,
+                decipher_only=False,
+            ),
+            critical=True,
+        )
+        .add_extension(x509.ExtendedKeyUsage([x509.oid.ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+
+    directory.mkdir(exist_ok=True, parents=True)
+    cert_file = directory.joinpath("bench-upstream.crt")
+    key_file = directory.joinpath("bench-upstream.key")
+    cert_file.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_file.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return str(cert_file), str(key_file)
+
+
+class _FakeUpstreamMixin:
+    options: FakeUpstreamOptions
+    ssl_context: Optional[ssl.SSLContext]
+
+    def answer(self, data: bytes) -> Optional[bytes]:
+        """None means the query is lost"""
+        if self.options.latency_ms > 0:
+            time.sleep(self.options.latency_ms / 1000)
+
+        if self.options.loss > 0 and random.random() < self.options.loss:
+            return None
+
+        try:
+            return make_fake_response(data)
+        except Exception:
+            return None
+
+
+class _FakeUdpHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, connection = cast(tuple[bytes, socket.socket], self.request)
+        if (response_data := cast(_FakeUpstreamMixin, self.server).answer(data)) is not None:
+            connection.sendto(response_data, self.client_address)
+
+
+class _FakeTcpHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        if (ssl_context := cast(_FakeUpstreamMixin, self.server).ssl_context) is not None:
+            self.request = ssl_context.wrap_socket(self.request, server_side=True)
+
+    def _recv_exactly(self, length: int) -> Optional[bytes]:
+        data = b""
+        while len(data) < length:
+            if not (new_data := self.request.recv(length - len(data))):
+                return None
+            data += new_data
+
+        return data
+
+    def handle(self):
+        connection = cast(socket.socket, self.request)
+        while (prefix := self._recv_exactly(2)) is not None:
+            if (data := self._recv_exactly(struct.unpack("!H", prefix)[0])) is None:
+                break
+
+            if (response_data := cast(_FakeUpstreamMixin, self.server).answer(data)) is None:
+                break
+
+            connection.sendall(struct.pack("!H", len(response_data)) + response_data)
+
+
+class _FakeHttpsHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        self.request = cast(_FakeUpstreamMixin, self.server).ssl_context.wrap_socket(self.request, server_side=True)
+        super().setup()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        data = self.rfile.read(length)
+        if self.path.split("?")[0] != "/dns-query" or (response_data := cast(_FakeUpstreamMixin, self.server).answer(data)) is None:
+            self.close_connection = True
+            self.send_error(503)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/dns-message")
+        self.send_header("Content-Length", str(len(response_data)))
+        self.end_headers()
+        self.wfile.write(response_data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class _FakeUdpServer(_FakeUpstreamMixin, socketserver.ThreadingUDPServer):
+    daemon_threads = True
+
+
+class _FakeTcpServer(_FakeUpstreamMixin, socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _FakeHttpsServer(_FakeUpstreamMixin, http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def _ssl_context(options: FakeUpstreamOptions, alpn: str) -> ssl.SSLContext:
+    if options.cert_file is None or options.key_file is None:
+        raise ValueError("cert_file and key_file are required for tls / https")
+
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(options.cert_file, options.key_file)
+    ssl_context.set_alpn_protocols([alpn])
+    return ssl_context
+
+
+@contextmanager
+def start_fake_upstream(options: FakeUpstreamOptions, protocols: list[DnsServerUpstreamProtocol], host: str = "127.0.0.1"):
+    """yield the port each protocol is listening on"""
+    ports: dict[DnsServerUpstreamProtocol, int] = dict()
+    with ExitStack() as stack:
+        for protocol in protocols:
+            match protocol:
+                case DnsServerUpstreamProtocol.UDP:
+                    server = _FakeUdpServer((host, 0), _FakeUdpHandler)
+                    server.ssl_context = None
+                case DnsServerUpstreamProtocol.TCP:
+                    server = _FakeTcpServer((host, 0), _FakeTcpHandler)
+                    server.ssl_context = None
+                case DnsServerUpstreamProtocol.TLS:
+                    server = _FakeTcpServer((host, 0), _FakeTcpHandler)
+                    server.ssl_context = _ssl_context(options, "dot")
+                case DnsServerUpstreamProtocol.HTTPS:
+                    server = _FakeHttpsServer((host, 0), _FakeHttpsHandler)
+                    server.ssl_context = _ssl_context(options, "http/1.1")
+                case _:
+                    raise ValueError(protocol)
+
+            server.options = options
+            server_thread = threading.Thread(target=server.serve_forever, name=f"fake_upstream_{protocol.value}", daemon=True)
+            server_thread.start()
+            stack.callback(server.server_close)
+            stack.callback(server.shutdown)
+            ports[protocol] = server.server_address[1]
+
+        yield ports
+
+
+def run_fake_upstream(options: FakeUpstreamOptions, protocols: list[DnsServerUpstreamProtocol], connection: Any):
+    """entry point of the fake upstream process, send ports back and serve until asked to stop"""
+    with start_fake_upstream(options, protocols) as ports:
+        connection.send({k.value: v for k, v in ports.items()})
+        connection.recv()
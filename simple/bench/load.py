@@ -0,0 +1,145 @@
+import itertools
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+import dns.exception
+import dns.message
+import dns.query
+import dns.rcode
+import dns.rdatatype
+
+from simple.bench import percentile
+
+
+@dataclass(kw_only=True, frozen=True)
+class LoadOptions:
+    port: int
+    host: str = "127.0.0.1"
+    clients: int = 16
+    queries: int = 10000
+    warmup: int = 200
+    timeout: float = 5
+    hit_ratio: float = 0.8
+    blocked_share: float = 0.1
+    cloaked_share: float = 0.1
+    tcp_share: float = 0.1
+    seed: int = 1
+    hot_names: list[str] = field(default_factory=list)
+    blocked_names: list[str] = field(default_factory=list)
+    cloaked_names: list[str] = field(default_factory=list)
+
+
+class QueryMix:
+    """
+    blocked / cloaked names are answered locally, the rest goes upstream,
+    `hit_ratio` of those repeat a small hot set while the others are unique names
+    """
+
+    def __init__(self, options: LoadOptions, rnd: random.Random):
+        self.options = options
+        self.rnd = rnd
+
+    def next(self) -> tuple[str, str]:
+        options = self.options
+        x = self.rnd.random()
+        if x < options.blocked_share and len(options.blocked_names) > 0:
+            return "blocked", self.rnd.choice(options.blocked_names)
+
+        if x < options.blocked_share + options.cloaked_share and len(options.cloaked_names) > 0:
+            return "cloaked", self.rnd.choice(options.cloaked_names)
+
+        if self.rnd.random() < options.hit_ratio and len(options.hot_names) > 0:
+            return "hit", self.rnd.choice(options.hot_names)
+
+        return "miss", "m{}.miss.bench".format(uuid.UUID(int=self.rnd.getrandbits(128)).hex[:16])
+
+
+def _query(options: LoadOptions, name: str, use_tcp: bool) -> dns.message.Message:
+    request_message = dns.message.make_query(name, dns.rdatatype.A)
+    if use_tcp:
+        return dns.query.tcp(request_message, where=options.host, port=options.port, timeout=options.timeout)
+
+    return dns.query.udp(request_message, where=options.host, port=options.port, timeout=options.timeout)
+
+
+def _run_queries(options: LoadOptions, count: int, seed: int) -> dict[str, Any]:
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies: list[float] = []
+    kinds: Counter[str] = Counter()
+    rcodes: Counter[str] = Counter()
+    errors: Counter[str] = Counter()
+
+    def worker(index: int):
+        rnd = random.Random(seed * 7919 + index)
+        mix = QueryMix(options, rnd)
+        local_latencies = []
+        while next(counter) < count:
+            kind, name = mix.next()
+            use_tcp = rnd.random() < options.tcp_share
+            start = time.perf_counter()
+            try:
+                response_message = _query(options, name, use_tcp)
+            except dns.exception.Timeout:
+                with lock:
+                    errors["timeout"] += 1
+                continue
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] += 1
+                continue
+
+            local_latencies.append((time.perf_counter() - start) * 1000)
+            with lock:
+                kinds[kind] += 1
+                rcodes[dns.rcode.Rcode(response_message.rcode()).name] += 1
+
+        with lock:
+            latencies.extend(local_latencies)
+
+    threads = [threading.Thread(target=worker, args=(x,), name=f"bench_client_{x}") for x in range(options.clients)]
+    start_time = time.perf_counter()
+    for w in threads:
+        w.start()
+
+    for w in threads:
+        w.join()
+
+    elapsed = time.perf_counter() - start_time
+    latencies.sort()
+    answered = len(latencies)
+
+    def ms(value: float | None) -> float | None:
+        return None if value is None else round(value, 3)
+
+    return {
+        "queries": count,
+        "answered": answered,
+        "elapsed_s": round(elapsed, 3),
+        "qps": round(answered / elapsed, 1) if elapsed > 0 else None,
+        "latency_ms": {
+            "mean": ms(sum(latencies) / answered) if answered > 0 else None,
+            "p50": ms(percentile(latencies, 50)),
+            "p99": ms(percentile(latencies, 99)),
+            "p999": ms(percentile(latencies, 99.9)),
+            "max": ms(latencies[-1]) if answered > 0 else None,
+        },
+        "kinds": dict(kinds),
+        "rcodes": dict(rcodes),
+        "errors": dict(errors),
+    }
+
+
+def run_load(options: LoadOptions, connection: Any):
+    """entry point of the load process: warm up, wait for the go signal, then report the measured run"""
+    if options.warmup > 0:
+        _run_queries(options, options.warmup, options.seed + 1)
+
+    connection.send("ready")
+    connection.recv()
+    connection.send(_run_queries(options, options.queries, options.seed))
@@ -0,0 +1,342 @@
+import argparse
+import importlib
+import json
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Protocol
+
+from simple.bench import process_rss_bytes
+from simple.models import (
+    AllowedIpItem,
+    AllowedNameItem,
+    BlockedIpItem,
+    BlockedNameItem,
+    CloakingItem,
+    DnsServerRules,
+    ForwardingItem,
+)
+from simple.parse_rules import (
+    parse_allowed_ips,
+    parse_allowed_names,
+    parse_blocked_ips,
+    parse_blocked_names,
+    parse_cloaking_rules,
+    parse_forwarding_rules,
+)
+
+
+class RulesMatcher(Protocol):
+    """the lookups a rule engine must answer exactly like `TheDbJob` does"""
+
+    def block_names_ex(self, client_ip: str, name: str) -> AllowedNameItem | BlockedNameItem | None: ...
+
+    def block_ips_ex(self, client_ip: str, ip: str) -> AllowedIpItem | BlockedIpItem | None: ...
+
+    def cloaking_rules_ex(self, name: str) -> list[CloakingItem]: ...
+
+    def forwarding_rules(self, name: str) -> Optional[ForwardingItem]: ...
+
+
+@dataclass(kw_only=True, frozen=True)
+class RulesDataset:
+    rules: DnsServerRules
+    names: list[str]
+    client_ips: list[str]
+    ips: list[str]
+
+
+__labels__ = ["ads", "api", "cdn", "img", "m", "mail", "static", "track", "video", "www", "x", "login", "pixel", "edge", "s1"]
+__tlds__ = ["com", "net", "org", "io", "co", "cn", "de", "jp"]
+__client_groups__ = ["192.168.1.10", "192.168.1.2?", "192.168.2.*", "10.0.0.[1-5]"]
+
+
+def _random_domain(rnd: random.Random, i: int) -> str:
+    labels = [rnd.choice(__labels__) for _ in range(rnd.randint(0, 2))]
+    return ".".join(labels + ["d{:x}".format(i), rnd.choice(__tlds__)])
+
+
+def _random_glob(rnd: random.Random, domain: str) -> str:
+    match rnd.randint(0, 3):
+        case 0:
+            return "{}*.{}".format(rnd.choice(__labels__), domain)
+        case 1:
+            return "*.{}".format(domain)
+        case 2:
+            return "[a-m]*.{}".format(domain)
+        case _:
+            return "{}.{}?".format(domain.rsplit(".", 1)[0], domain.rsplit(".", 1)[1][0])
+
+
+def _random_name_rule(rnd: random.Random, i: int, glob_share: float) -> str:
+    domain = _random_domain(rnd, i)
+    x = rnd.random()
+    if x < glob_share:
+        return _random_glob(rnd, domain)
+
+    return "=" + domain if x < glob_share + (1 - glob_share) * 0.1 else domain
+
+
+def _random_ip_rule(rnd: random.Random, glob_share: float) -> str:
+    a, b, c, d = rnd.randint(1, 223), rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255)
+    if rnd.random() < glob_share:
+        return rnd.choice(["{}.{}.{}.*", "{}.{}.*.*", "{}.{}.{}.[0-9]*"]).format(a, b, c)
+
+    return "{}.{}.{}.{}".format(a, b, c, d)
+
+
+def _random_group(rnd: random.Random) -> str:
+    x = rnd.random()
+    if x < 0.8:
+        return "default"
+
+    return "temp" if x < 0.85 else rnd.choice(__client_groups__)
+
+
+def _parse_grouped(rnd: random.Random, lines: list[str], parse_func: Callable[[str, str], list]) -> list:
+    grouped: dict[str, list[str]] = dict()
+    for line in lines:
+        grouped.setdefault(_random_group(rnd), []).append(line)
+
+    return [item for group, value in grouped.items() for item in parse_func(group, "\n".join(value))]
+
+
+def generate_rules_dataset(size: int, glob_share: float = 0.05, seed: int = 1, samples: int = 1000) -> RulesDataset:
+    """
+    `size` blocked names and blocked ips, allowed lists are 1 / 20 of that, forwarding and cloaking rules 1 / 10,
+    rule files go through the same parse functions as the real ones
+    """
+    rnd = random.Random(seed)
+    blocked_names_lines = [_random_name_rule(rnd, i, glob_share) for i in range(size)]
+    blocked_names = _parse_grouped(rnd, blocked_names_lines, parse_blocked_names)
+    allowed_names = _parse_grouped(rnd, rnd.sample(blocked_names_lines, k=max(1, size // 20)), parse_allowed_names)
+    blocked_ips_lines = [_random_ip_rule(rnd, glob_share) for _ in range(size)]
+    blocked_ips = _parse_grouped(rnd, blocked_ips_lines, parse_blocked_ips)
+    allowed_ips = _parse_grouped(rnd, rnd.sample(blocked_ips_lines, k=max(1, size // 20)), parse_allowed_ips)
+
+    forwarding_lines: dict[str, list[str]] = {"google": [], "cloudflare": []}
+    cloaking_lines = []
+    cloaking_names = []
+    for i in range(max(1, size // 10)):
+        forwarding_lines[rnd.choice(["google", "cloudflare"])].append(_random_name_rule(rnd, i, glob_share))
+
+        name = _random_name_rule(rnd, size + i, glob_share)
+        use_glob = any(c in name for c in "*?[]")
+        if not use_glob and rnd.random() < 0.2 and len(cloaking_names) > 0:
+            cloaking_lines.append("{} {}".format(name, rnd.choice(cloaking_names)))
+        else:
+            for _ in range(rnd.randint(1, 3)):
+                cloaking_lines.append("{} 10.{}.{}.{}".format(name, rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(1, 254)))
+
+        if not use_glob:
+            cloaking_names.append(name.lstrip("="))
+
+    forwarding_rules = [item for group, value in forwarding_lines.items() for item in parse_forwarding_rules(group, "\n".join(value))]
+    cloaking_rules = parse_cloaking_rules("default", "\n".join(cloaking_lines))
+    rules = DnsServerRules(
+        allowed_ips=allowed_ips,
+        allowed_names=allowed_names,
+        blocked_ips=blocked_ips,
+        blocked_names=blocked_names,
+        cloaking_rules=cloaking_rules,
+        forwarding_rules=forwarding_rules,
+    )
+
+    # names around the rules: the rule itself, a subdomain, the parent, a case variant, glob expansions and misses
+    rule_names = [x.name for x in blocked_names] + [x.name for x in forwarding_rules] + [x.name for x in cloaking_rules]
+    names = []
+    for _ in range(samples):
+        rule_name = rnd.choice(rule_names).lstrip("=")
+        rule_name = rule_name.replace("[a-m]", rnd.choice("abmz")).replace("*", rnd.choice(["", "x", "ads1"])).replace("?", "o")
+        match rnd.randint(0, 5):
+            case 0:
+                names.append(rule_name)
+            case 1:
+                names.append("{}.{}".format(rnd.choice(__labels__), rule_name))
+            case 2:
+                names.append(rule_name.split(".", 1)[-1])
+            case 3:
+                names.append(rule_name.upper())
+            case 4:
+                names.append("x" + rule_name)
+            case _:
+                names.append(_random_domain(rnd, rnd.randint(0, size * 2)))
+
+    rule_ips = [x.ip for x in blocked_ips]
+    ips = []
+    for _ in range(samples):
+        rule_ip = rnd.choice(rule_ips).replace("[0-9]*", str(rnd.randint(0, 99))).replace("*", str(rnd.randint(0, 255)))
+        ips.append(rule_ip if rnd.random() < 0.5 else _random_ip_rule(rnd, 0))
+
+    client_ips = ["192.168.1.10", "192.168.1.20", "192.168.1.99", "192.168.2.7", "10.0.0.3", "10.0.0.9", "127.0.0.1"]
+    return RulesDataset(rules=rules, names=names, client_ips=client_ips, ips=ips)
+
+
+def load_matcher_factory(spec: str) -> Callable[[DnsServerRules], RulesMatcher]:
+    """`package.module:callable`, the callable receives the rules and returns a matcher"""
+    module_name, _, attr = spec.partition(":")
+    if not module_name or not attr:
+        raise ValueError(f"matcher should be module:callable, got {spec}")
+
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def reference_matcher(rules: DnsServerRules) -> RulesMatcher:
+    """sql only"""
+    from simple.db import TheDbJob
+
+    db_job = TheDbJob(in_memory=True)
+    db_job.init_db(rules, in_memory_rules=False)
+    return db_job
+
+
+def server_matcher(rules: DnsServerRules) -> RulesMatcher:
+    """what the server runs, sql plus the in-memory rule indexes"""
+    from simple.db import TheDbJob
+
+    db_job = TheDbJob(in_memory=True)
+    db_job.init_db(rules)
+    return db_job
+
+
+def _cloaking_key(result: list[CloakingItem]) -> list[tuple[str, str, str, str]]:
+    # cloaking rows come back in random order
+    return sorted((x.group, x.name, str(x.record_type), x.mapped) for x in result)
+
+
+def check_conformance(dataset: RulesDataset, reference: RulesMatcher, candidate: RulesMatcher, limit: int = 20) -> dict[str, Any]:
+    """run every lookup against both matchers, report how many differ and the first few differences"""
+    checks: list[tuple[str, Callable[[RulesMatcher], Any]]] = []
+    for name in dataset.names:
+        checks.append((f"forwarding_rules({name!r})", lambda m, n=name: m.forwarding_rules(n)))
+        checks.append((f"cloaking_rules_ex({name!r})", lambda m, n=name: _cloaking_key(m.cloaking_rules_ex(n))))
+        for client_ip in dataset.client_ips:
+            checks.append((f"block_names_ex({client_ip!r}, {name!r})", lambda m, c=client_ip, n=name: m.block_names_ex(c, n)))
+
+    for ip in dataset.ips:
+        for client_ip in dataset.client_ips:
+            checks.append((f"block_ips_ex({client_ip!r}, {ip!r})", lambda m, c=client_ip, i=ip: m.block_ips_ex(c, i)))
+
+    mismatches = []
+    count = 0
+    for description, check in checks:
+        expected = check(reference)
+        actual = check(candidate)
+        if expected != actual:
+            # equal length names tie in `max`, and cloaking rows are ordered by random(), so ask the reference again
+            if any(check(reference) == actual for _ in range(3)):
+                continue
+
+            count += 1
+            if len(mismatches) < limit:
+                mismatches.append({"lookup": description, "expected": repr(expected), "actual": repr(actual)})
+
+    return {"checks": len(checks), "mismatches": count, "examples": mismatches}
+
+
+def measure_lookups(matcher: RulesMatcher, dataset: RulesDataset, lookups: int, max_seconds: float) -> dict[str, Optional[float]]:
+    """lookups per second of each operation, stops early after `max_seconds` so big datasets stay usable"""
+    rnd = random.Random(2)
+    operations: dict[str, Callable[[], Any]] = {
+        "block_names_ex": lambda: matcher.block_names_ex(rnd.choice(dataset.client_ips), rnd.choice(dataset.names)),
+        "block_ips_ex": lambda: matcher.block_ips_ex(rnd.choice(dataset.client_ips), rnd.choice(dataset.ips)),
+        "cloaking_rules_ex": lambda: matcher.cloaking_rules_ex(rnd.choice(dataset.names)),
+        "forwarding_rules": lambda: matcher.forwarding_rules(rnd.choice(dataset.names)),
+    }
+    result = dict()
+    for key, operation in operations.items():
+        count = 0
+        start = time.perf_counter()
+        deadline = start + max_seconds
+        while count < lookups:
+            operation()
+            count += 1
+            if time.perf_counter() > deadline:
+                break
+
+        elapsed = time.perf_counter() - start
+        result[key] = round(count / elapsed, 1) if elapsed > 0 else None
+
+    return result
+
+
+def _rules_count(rules: DnsServerRules) -> int:
+    return sum(
+        len(x)
+        for x in [
+            rules.allowed_ips,
+            rules.allowed_names,
+            rules.blocked_ips,
+            rules.blocked_names,
+            rules.cloaking_rules,
+            rules.forwarding_rules,
+        ]
+    )
+
+
+def bench_rules(size: int, glob_share: float, lookups: int, max_seconds: float, factory: Callable[[DnsServerRules], RulesMatcher]) -> dict:
+    dataset = generate_rules_dataset(size, glob_share=glob_share)
+    rules_count = _rules_count(dataset.rules)
+    rss_before, _ = process_rss_bytes()
+    start = time.perf_counter()
+    matcher = factory(dataset.rules)
+    load_seconds = time.perf_counter() - start
+    rss_after, _ = process_rss_bytes()
+
+    result: dict[str, Any] = {
+        "size": size,
+        "glob_share": glob_share,
+        "rules": rules_count,
+        "load_s": round(load_seconds, 3),
+        "lookups_per_s": measure_lookups(matcher, dataset, lookups, max_seconds),
+        "rss_bytes_per_rule": None if rss_before is None or rss_after is None else round((rss_after - rss_before) / rules_count, 1),
+    }
+
+    db = getattr(matcher, "db", None)
+    if db is not None:
+        page_count = db.execute("pragma page_count").fetchone()[0]
+        page_size = db.execute("pragma page_size").fetchone()[0]
+        result["db_bytes_per_rule"] = round(page_count * page_size / rules_count, 1)
+
+    return result
+
+
+def setup_bench_rules_argparse() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m simple.bench.rules", description="rule matching benchmark and conformance check")
+    parser.add_argument("--sizes", type=str, default="10000,100000", help="comma separated rule counts, default: 10000,100000")
+    parser.add_argument("--glob-share", type=float, default=0.05, help="share of glob rules, default: 0.05")
+    parser.add_argument("--lookups", type=int, default=2000, help="lookups per operation")
+    parser.add_argument("--max-seconds", type=float, default=5, help="time budget per operation")
+    parser.add_argument(
+        "--matcher", type=str, help="module:callable building an alternative matcher from DnsServerRules, default: the server's"
+    )
+    parser.add_argument("--conformance", action="store_true", help="compare --matcher with the sql only matcher instead of benchmarking")
+    parser.add_argument("--samples", type=int, default=1000, help="randomized names / ips for --conformance")
+    parser.add_argument("--seed", type=int, default=1)
+    args, _ = parser.parse_known_args()
+    return args
+
+
+def main():
+    args = setup_bench_rules_argparse()
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    factory = server_matcher if args.matcher is None else load_matcher_factory(args.matcher)
+
+    if args.conformance:
+        results = []
+        for size in sizes:
+            dataset = generate_rules_dataset(size, glob_share=args.glob_share, seed=args.seed, samples=args.samples)
+            report = check_conformance(dataset, reference_matcher(dataset.rules), factory(dataset.rules))
+            results.append({"size": size, "glob_share": args.glob_share, **report})
+
+        print(json.dumps(results, indent=2))
+        return 1 if any(x["mismatches"] > 0 for x in results) else 0
+
+    results = [bench_rules(size, args.glob_share, args.lookups, args.max_seconds, factory) for size in sizes]
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
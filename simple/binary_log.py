@@ -0,0 +1,277 @@
+import argparse
+import csv
+import re
+import sqlite3
+import struct
+import sys
+import uuid
+import zlib
+from dataclasses import asdict, fields
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from simple.models import RequestLog
+
+# segment file layout:
+#
+#     magic (8 bytes) | record count (uint64, little endian) | zlib stream
+#
+# the zlib stream is a sequence of
+#
+#     0x01 | length (uint16) | utf-8 bytes                  a string, gets the next id of the segment, starting at 1
+#     0x02 | request_id (16 bytes) | created (int64, epoch seconds) | ms (float32) |
+#            client_ip, name, cname, question_type, response_status, server, error (uint32 string ids, 0 is null)
+#
+# strings are dictionary encoded per segment so every segment can be read or dropped on its own,
+# the stream is sync-flushed after every batch so the open segment can be read too
+
+__magic__ = b"LDSQLOG1"
+__header__ = struct.Struct("<8sQ")
+__string__ = struct.Struct("<BH")
+__record__ = struct.Struct("<B16sqf7I")
+__tag_string__ = 1
+__tag_record__ = 2
+__segment_pattern__ = re.compile(r"^(\d{4}-\d{2}-\d{2})\.(\d{4})\.qlog$")
+__created_format__ = "%Y-%m-%d %H:%M:%S"
+
+
+def segment_files(directory: Path, day: Optional[str] = None) -> list[tuple[str, Path]]:
+    """(day, file) of every segment, oldest first"""
+    if not directory.is_dir():
+        return []
+
+    result = []
+    for w in directory.iterdir():
+        if (m := __segment_pattern__.match(w.name)) is not None and (day is None or m.group(1) == day) and w.is_file():
+            result.append((m.group(1), int(m.group(2)), w))
+
+    result.sort()
+    return [(x[0], x[2]) for x in result]
+
+
+def segment_record_count(path: Path) -> int:
+    with open(path, "rb") as f:
+        data = f.read(__header__.size)
+
+    if len(data) != __header__.size or (header := __header__.unpack(data))[0] != __magic__:
+        return 0
+
+    return header[1]
+
+
+class BinaryRequestLogWriter:
+    def __init__(self, directory: Path, max_segment_bytes: int = 64 * 1024 * 1024, level: int = 1):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.level = level
+        self._day: Optional[str] = None
+        self._file: Optional[BinaryIO] = None
+        self._compressor = None
+        self._strings: dict[str, int] = dict()
+        self._count = 0
+        self._created: tuple[str, int] = ("", 0)
+
+    def _open(self, day: str):
+        self.close()
+        self.directory.mkdir(exist_ok=True, parents=True)
+        existing = segment_files(self.directory, day)
+        index = 1 if len(existing) == 0 else int(existing[-1][1].name.split(".")[1]) + 1
+        self._file = open(self.directory.joinpath(f"{day}.{index:04d}.qlog"), "xb")
+        self._file.write(__header__.pack(__magic__, 0))
+        self._compressor = zlib.compressobj(self.level)
+        self._strings = dict()
+        self._count = 0
+        self._day = day
+
+    def _string_id(self, value: Optional[str], out: list[bytes]) -> int:
+        if value is None:
+            return 0
+
+        if (string_id := self._strings.get(value)) is None:
+            data = value.encode("utf-8")[:65535]
+            out.append(__string__.pack(__tag_string__, len(data)))
+            out.append(data)
+            string_id = self._strings[value] = len(self._strings) + 1
+
+        return string_id
+
+    def _epoch(self, created: str) -> int:
+        # every query of the same second shares the created string
+        if self._created[0] != created:
+            dt = datetime.strptime(created, __created_format__).replace(tzinfo=timezone.utc)
+            self._created = (created, int(dt.timestamp()))
+
+        return self._created[1]
+
+    def insert(self, *request_logs: RequestLog):
+        out: list[bytes] = []
+        for x in request_logs:
+            if (day := x.created[:10]) != self._day or self._file is None:
+                self._flush(out)
+                self._open(day)
+                out = []
+
+            try:
+                request_id = uuid.UUID(x.request_id).bytes
+            except ValueError:
+                request_id = bytes(16)
+
+            string_id = self._string_id
+            ids = (
+                string_id(x.client_ip, out),
+                string_id(x.name, out),
+                string_id(x.cname, out),
+                string_id(x.question_type, out),
+                string_id(x.response_status, out),
+                string_id(x.server, out),
+                string_id(x.error, out),
+            )
+            out.append(__record__.pack(__tag_record__, request_id, self._epoch(x.created), x.ms, *ids))
+            self._count += 1
+
+        self._flush(out)
+        if self._file is not None and self._file.tell() >= self.max_segment_bytes:
+            self.close()
+
+    def _flush(self, out: list[bytes]):
+        if self._file is None or self._compressor is None or len(out) == 0:
+            return
+
+        self._file.write(self._compressor.compress(b"".join(out)))
+        self._file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self._file.seek(0)
+        self._file.write(__header__.pack(__magic__, self._count))
+        self._file.seek(0, 2)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None and self._compressor is not None:
+            self._file.write(self._compressor.flush(zlib.Z_FINISH))
+            self._file.close()
+
+        self._file = None
+        self._compressor = None
+        self._day = None
+
+
+def read_segment(path: Path, chunk_size: int = 256 * 1024) -> Iterator[RequestLog]:
+    """a truncated tail (crash, or the segment still being written) ends the iteration quietly"""
+    with open(path, "rb") as f:
+        if f.read(__header__.size)[:8] != __magic__:
+            raise ValueError(f"{path} is not a query log segment")
+
+        decompressor = zlib.decompressobj()
+        strings: list[Optional[str]] = [None]
+        buffer = b""
+        while chunk := f.read(chunk_size):
+            try:
+                buffer += decompressor.decompress(chunk)
+            except zlib.error:
+                break
+
+            offset = 0
+            while offset < len(buffer):
+                tag = buffer[offset]
+                if tag == __tag_string__:
+                    if offset + __string__.size > len(buffer):
+                        break
+
+                    _, length = __string__.unpack_from(buffer, offset)
+                    end = offset + __string__.size + length
+                    if end > len(buffer):
+                        break
+
+                    strings.append(buffer[offset + __string__.size : end].decode("utf-8", errors="replace"))
+                    offset = end
+                elif tag == __tag_record__:
+                    if offset + __record__.size > len(buffer):
+                        break
+
+                    _, request_id, created, ms, *ids = __record__.unpack_from(buffer, offset)
+                    offset += __record__.size
+                    client_ip, name, cname, question_type, response_status, server, error = [strings[x] for x in ids]
+                    yield RequestLog(
+                        request_id=str(uuid.UUID(bytes=request_id)),
+                        client_ip=client_ip,
+                        name=name,
+                        cname=cname,
+                        question_type=question_type,
+                        response_status=response_status,
+                        server=server,
+                        ms=round(ms, 2),
+                        error=error,
+                        created=datetime.fromtimestamp(created, timezone.utc).strftime(__created_format__),
+                    )
+                else:
+                    raise ValueError(f"{path}: unknown record tag {tag}")
+
+            buffer = buffer[offset:]
+
+
+def read_request_logs(directory: Path, since: Optional[str] = None, until: Optional[str] = None) -> Iterator[RequestLog]:
+    """every record of the segments in `directory`, oldest first, `since` / `until` are inclusive days (yyyy-mm-dd)"""
+    for day, path in segment_files(directory):
+        if (since is not None and day < since) or (until is not None and day > until):
+            continue
+
+        yield from read_segment(path)
+
+
+def convert_to_sqlite(request_logs: Iterator[RequestLog], output: Path, batch: int = 10000) -> int:
+    from simple.request_logs import RequestLogStore
+
+    db = sqlite3.connect(output)
+    try:
+        RequestLogStore.init_partition(db)
+        sql = """
+            insert into request_logs
+                        ("request_id", "client_ip", "name", "cname", "response_status", "question_type", "server", "ms", "error", "created")
+                 values (:request_id, :client_ip, :name, :cname, :response_status, :question_type, :server, :ms, :error, :created)
+        """
+        count = 0
+        items = []
+        for x in request_logs:
+            items.append(asdict(x))
+            if len(items) >= batch:
+                db.executemany(sql, items)
+                count += len(items)
+                items.clear()
+
+        db.executemany(sql, items)
+        db.commit()
+        return count + len(items)
+    finally:
+        db.close()
+
+
+def convert_to_csv(request_logs: Iterator[RequestLog], output: Path) -> int:
+    count = 0
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([x.name for x in fields(RequestLog)])
+        for x in request_logs:
+            writer.writerow([getattr(x, w.name) for w in fields(RequestLog)])
+            count += 1
+
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simple.binary_log", description="convert binary query logs to sqlite or csv")
+    parser.add_argument("--data-dir", type=Path, help="directory for config files and temp files. default: data")
+    parser.add_argument("--to", type=str, choices=["sqlite", "csv"], required=True)
+    parser.add_argument("--output", type=Path, required=True)
+    parser.add_argument("--since", type=str, help="first day, yyyy-mm-dd")
+    parser.add_argument("--until", type=str, help="last day, yyyy-mm-dd")
+    args, _ = parser.parse_known_args()
+
+    from simple.request_logs import RequestLogStore
+
+    request_logs = read_request_logs(RequestLogStore().directory, args.since, args.until)
+    count = convert_to_sqlite(request_logs, args.output) if args.to == "sqlite" else convert_to_csv(request_logs, args.output)
+    print(f"{count} request logs written to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
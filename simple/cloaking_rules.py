@@ -0,0 +1,139 @@
+import logging
+import random
+import threading
+from typing import Optional
+
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+
+from simple.models import CloakingItem, CloakingItemRecordType
+from simple.sqlite_glob import glob_match
+
+logger = logging.getLogger(__name__)
+
+CloakingRecord = tuple[CloakingItem, Optional[dns.rdata.Rdata]]
+
+
+def cloaking_rdata(item: CloakingItem) -> Optional[dns.rdata.Rdata]:
+    """None for CNAME, it is followed instead of answered"""
+    if item.record_type == CloakingItemRecordType.CNAME:
+        return None
+
+    return dns.rdata.from_text(dns.rdataclass.IN, dns.rdatatype.from_text(item.record_type.value), item.mapped)
+
+
+class CloakingRules:
+    """
+    cloaking_rules compiled at load time: rule names are dictionary keys (exact, and every parent domain for prefix match),
+    globs are kept as a short list, CNAME chains are followed once here (at most 5 hops, cycles stop where they close),
+    every A / AAAA record carries its ready-made rdata.
+    `add` / `remove` drop the compiled records of the changed name and of the names with a CNAME, those are compiled again on lookup.
+    changes and compiles hold `_lock`, a lookup only takes it when the records of its name are not compiled (anymore)
+    """
+
+    def __init__(self, items: list[CloakingItem]):
+        self.by_name: dict[str, list[CloakingItem]] = dict()
+        for x in dict.fromkeys(items):
+            self.by_name.setdefault(x.name, []).append(x)
+
+        self.globs = [x for x in self.by_name if self.by_name[x][0].use_glob]
+        self.records: dict[str, list[CloakingRecord]] = dict()
+        # names with a CNAME, their chain may go through any other name
+        self._chained: set[str] = set()
+        self._lock = threading.Lock()
+        for name in self.by_name:
+            self._compile(name)
+
+    def _compile(self, name: str) -> list[CloakingRecord]:
+        if any(x.record_type == CloakingItemRecordType.CNAME for x in self.by_name.get(name, [])):
+            self._chained.add(name)
+
+        records = self.records[name] = [(x, cloaking_rdata(x)) for x in self._follow(name)]
+        return records
+
+    def _invalidate(self, name: str):
+        chained, self._chained = self._chained, set()
+        for x in [name, *chained]:
+            self.records.pop(x, None)
+
+    def add(self, item: CloakingItem) -> bool:
+        with self._lock:
+            if item in (items := self.by_name.get(item.name, [])):
+                return False
+
+            self.by_name[item.name] = [*items, item]
+            if item.use_glob and item.name not in self.globs:
+                self.globs = [*self.globs, item.name]
+
+            self._invalidate(item.name)
+            return True
+
+    def remove(self, item: CloakingItem) -> bool:
+        with self._lock:
+            if item not in (items := self.by_name.get(item.name, [])):
+                return False
+
+            if len(items := [x for x in items if x != item]) > 0:
+                self.by_name[item.name] = items
+            else:
+                del self.by_name[item.name]
+                self.globs = [x for x in self.globs if x != item.name]
+
+            self._invalidate(item.name)
+            return True
+
+    def _follow(self, name: str) -> list[CloakingItem]:
+        result = self.by_name.get(name, [])
+        # the chain in order for the warning, the set for the check
+        chain, visited = [name], {name}
+        for w in range(5):
+            if (cname := next((x for x in result if x.record_type == CloakingItemRecordType.CNAME), None)) is None:
+                break
+
+            if (key := self.rule_name(cname.mapped)) is None:
+                break
+
+            if key in visited:
+                logger.warning(f"cloaking_rules: cname loop {' -> '.join(chain)} -> {key}")
+                break
+
+            chain.append(key)
+            visited.add(key)
+            result = self.by_name.get(key, [])
+
+        return result
+
+    def rule_name(self, name: str) -> Optional[str]:
+        """same precedence as TheDbJob.cloaking_rules: =name, then the name itself, then the longest matching rule"""
+        if not name:
+            return None
+
+        name = name.lower()
+        if (key := "=" + name) in self.by_name:
+            return key
+
+        if name in self.by_name and not self.by_name[name][0].use_glob:
+            return name
+
+        candidates = []
+        labels = name.split(".")
+        for i in range(1, len(labels)):
+            if (parent := ".".join(labels[i:])) in self.by_name and not self.by_name[parent][0].use_glob:
+                candidates.append(parent)
+
+        candidates.extend(x for x in self.globs if glob_match(name, x) or glob_match(name, "*." + x))
+        return max(candidates, key=len) if len(candidates) > 0 else None
+
+    def lookup(self, name: str) -> list[CloakingRecord]:
+        """what TheDbJob.cloaking_rules_ex returns, with the rdata, at most 5 records picked at random"""
+        if (key := self.rule_name(name)) is None:
+            return []
+
+        if (records := self.records.get(key)) is None:
+            with self._lock:
+                # compiled by another lookup meanwhile, or against the rules of now
+                if (records := self.records.get(key)) is None:
+                    records = self._compile(key)
+
+        return records if len(records) <= 1 else random.sample(records, min(5, len(records)))
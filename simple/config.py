@@ -1,10 +1,12 @@
 import json
 import logging
+import logging.handlers
 from ipaddress import ip_address
-from typing import Optional, Callable
+from typing import Optional, Callable, TYPE_CHECKING
 
 from simple.app_args import AppArgs
 from simple.models import (
+    AdminConfig,
     AllowedIpItem,
     AllowedNameItem,
     BlockedIpItem,
@@ -15,7 +17,17 @@ from simple.models import (
     DnsServerRulesConfig,
     DnsServerUpstream,
     DnsServerUpstreamProtocol,
+    EcsConfig,
+    EcsMode,
     ForwardingItem,
+    RateLimitAction,
+    RateLimitConfig,
+    RequestLogPolicyConfig,
+    RequestLogsBackend,
+    RequestLogsConfig,
+    RequestLogSinkConfig,
+    RequestLogSinkType,
+    SubscriptionsConfig,
 )
 from simple.parse_rules import (
     parse_allowed_ips,
@@ -25,6 +37,10 @@ from simple.parse_rules import (
     parse_cloaking_rules,
     parse_forwarding_rules,
 )
+from simple.subscriptions import is_url, SubscriptionStore
+
+if TYPE_CHECKING:
+    import dns.zone
 
 logger = logging.getLogger(__name__)
 
@@ -64,6 +80,8 @@ def parse_config_from_object(o: dict) -> DnsServerConfig:
     # ///////////////////////////////////
     for key, value in o["upstream"].items():
         preferred_protocol = None
+        port = None
+        ca_file = None
         ip = []
         if isinstance(value, list):
             ip = [ip_address(x) for x in value]
@@ -79,13 +97,20 @@ def parse_config_from_object(o: dict) -> DnsServerConfig:
                 except ValueError:
                     message = f"upstream -> {key}: preferred_protocol {preferred_protocol_str} should be one of (udp, tcp, https, tls)"
                     raise ValueError(message) from None
+
+            if (port := value.get("port")) is not None:
+                if not isinstance(port, int) or isinstance(port, bool) or not 0 < port < 65536:
+                    raise ValueError("upstream -> {}: port {} should be between 1 and 65535".format(key, port))
+
+            if (ca_file := value.get("ca_file")) is not None:
+                ca_file = str(ca_file)
         else:
             raise ValueError("upstream -> {}: wrong value".format(key))
 
         if len(ip) == 0:
             raise ValueError("upstream -> {}: no ip set".format(key))
 
-        upstream_server[key] = DnsServerUpstream(name=key, ip=ip, preferred_protocol=preferred_protocol)
+        upstream_server[key] = DnsServerUpstream(name=key, ip=ip, preferred_protocol=preferred_protocol, port=port, ca_file=ca_file)
 
     if len(upstream_server) == 0:
         raise ValueError("no upstream server set")
@@ -124,9 +149,12 @@ def parse_config_from_object(o: dict) -> DnsServerConfig:
                 raise ValueError("rules -> {}: wrong value".format(w3))
 
         for key5, value5 in value3.items():
-            if not key5 or not value5 or not all(str(x).endswith(".txt") for x in value5):
+            if not key5 or not value5 or not all(str(x).endswith(".txt") or is_url(str(x)) for x in value5):
                 raise ValueError("rules -> {} -> {}: {}".format(w3, key5, value5))
 
+            if w3 == "forwarding_rules" and any(is_url(str(x)) for x in value5):
+                raise ValueError("rules -> {} -> {}: urls are not supported for forwarding_rules".format(w3, key5))
+
         dns_server_rules2.append(value3)
 
     allowed_ips, allowed_names, blocked_ips, blocked_names, cloaking_rules, forwarding_rules = dns_server_rules2
@@ -144,11 +172,324 @@ def parse_config_from_object(o: dict) -> DnsServerConfig:
         forwarding_rules=forwarding_rules,
     )
 
-    dns_server_config = DnsServerConfig(ipv6=ipv6, default=default_server_list, upstream=upstream_server, rules=rules)
+    # ///////////////////////////////////
+    request_logs = parse_request_logs_config(o.get("request_logs"))
+    admin = parse_admin_config(o.get("admin"))
+    rate_limit = parse_rate_limit_config(o.get("rate_limit"))
+    zones = parse_zones_config(o.get("zones"))
+    ecs = parse_ecs_config(o.get("ecs"))
+
+    subscriptions = parse_subscriptions_config(o.get("subscriptions"))
+
+    if not isinstance(minimal_responses := o.get("minimal_responses", False), bool):
+        raise ValueError("minimal_responses: {} should be true or false".format(minimal_responses))
+
+    if not isinstance(minimize_rules := o.get("minimize_rules", True), bool):
+        raise ValueError("minimize_rules: {} should be true or false".format(minimize_rules))
+
+    dns_server_config = DnsServerConfig(
+        ipv6=ipv6,
+        default=default_server_list,
+        upstream=upstream_server,
+        rules=rules,
+        request_logs=request_logs,
+        admin=admin,
+        rate_limit=rate_limit,
+        zones=zones,
+        ecs=ecs,
+        minimal_responses=minimal_responses,
+        minimize_rules=minimize_rules,
+        subscriptions=subscriptions,
+    )
 
     return dns_server_config
 
 
+def parse_zones_config(o: Optional[dict]) -> dict[str, list[str]]:
+    if o is None:
+        return dict()
+
+    if not isinstance(o, dict):
+        raise ValueError("zones: wrong value")
+
+    zones: dict[str, list[str]] = dict()
+    for key, value in o.items():
+        origin = str(key).strip().rstrip(".").lower()
+        if not origin:
+            raise ValueError("zones -> {}: wrong origin".format(key))
+
+        if isinstance(value, str):
+            value = [value]
+
+        if not isinstance(value, list) or len(value) == 0 or not all(isinstance(x, str) and x for x in value):
+            raise ValueError("zones -> {}: {} should be a zone file or a list of them".format(key, value))
+
+        zones[origin] = value
+
+    return zones
+
+
+def parse_ecs_config(o: Optional[dict]) -> EcsConfig:
+    default = EcsConfig()
+    if o is None:
+        return default
+
+    if not isinstance(o, dict):
+        raise ValueError("ecs: wrong value")
+
+    mode_str = str(o.get("mode", default.mode.value))
+    try:
+        mode = EcsMode(mode_str)
+    except ValueError:
+        raise ValueError(f"ecs -> mode: {mode_str} should be one of (strip, subnet)") from None
+
+    ipv4_prefix = _optional_positive_int(o, "ipv4_prefix", "ecs", default.ipv4_prefix)
+    ipv6_prefix = _optional_positive_int(o, "ipv6_prefix", "ecs", default.ipv6_prefix)
+    if ipv4_prefix is None or ipv6_prefix is None or ipv4_prefix > 32 or ipv6_prefix > 128:
+        raise ValueError(f"ecs -> ipv4_prefix / ipv6_prefix: {ipv4_prefix} / {ipv6_prefix} should be prefix lengths")
+
+    address = None
+    if mode == EcsMode.SUBNET:
+        try:
+            address = str(ip_address(o.get("address")))
+        except ValueError:
+            raise ValueError("ecs -> address: {} should be the ip address of our egress".format(o.get("address"))) from None
+
+    return EcsConfig(mode=mode, address=address, ipv4_prefix=ipv4_prefix, ipv6_prefix=ipv6_prefix)
+
+
+def parse_subscriptions_config(o: Optional[dict]) -> SubscriptionsConfig:
+    default = SubscriptionsConfig()
+    if o is None:
+        return default
+
+    if not isinstance(o, dict):
+        raise ValueError("subscriptions: wrong value")
+
+    refresh_minutes = _optional_positive_int(o, "refresh_minutes", "subscriptions", default.refresh_minutes)
+    timeout = _optional_positive_int(o, "timeout", "subscriptions", default.timeout)
+    if refresh_minutes is None or timeout is None:
+        raise ValueError("subscriptions -> refresh_minutes / timeout: should be positive integers")
+
+    return SubscriptionsConfig(refresh_minutes=refresh_minutes, timeout=timeout)
+
+
+def parse_admin_config(o: Optional[dict]) -> AdminConfig:
+    if o is None:
+        return AdminConfig()
+
+    if not isinstance(o, dict):
+        raise ValueError("admin: wrong value")
+
+    default = AdminConfig()
+    host = o.get("host", default.host)
+    try:
+        ip_address(host)
+    except ValueError:
+        raise ValueError(f"admin -> host: {host} should be an ip address") from None
+
+    port = _optional_positive_int(o, "port", "admin", default.port)
+    if port is not None and port > 65535:
+        raise ValueError(f"admin -> port: {port} should be a port number")
+
+    token = o.get("token", default.token)
+    if token is not None and (not isinstance(token, str) or len(token) < 16):
+        raise ValueError("admin -> token: should be a string of 16 characters at least")
+
+    if port is not None and token is None:
+        raise ValueError("admin -> token: required when port is set, every request has to send it")
+
+    return AdminConfig(host=host, port=port, token=token)
+
+
+def parse_rate_limit_config(o: Optional[dict]) -> RateLimitConfig:
+    if o is None:
+        return RateLimitConfig()
+
+    if not isinstance(o, dict):
+        raise ValueError("rate_limit: wrong value")
+
+    default = RateLimitConfig()
+    rates = dict()
+    for key in ["client_qps", "subnet_qps", "responses_per_second"]:
+        value = o.get(key)
+        if value is not None and (not isinstance(value, int | float) or isinstance(value, bool) or value <= 0):
+            raise ValueError(f"rate_limit -> {key}: {value} should be a positive number or null")
+
+        rates[key] = value
+
+    action = default.action
+    if (action_str := o.get("action")) is not None:
+        try:
+            action = RateLimitAction(str(action_str))
+        except ValueError:
+            raise ValueError(f"rate_limit -> action: {action_str} should be one of (drop, refused, truncate)") from None
+
+    ipv4_prefix = _optional_positive_int(o, "ipv4_prefix", "rate_limit", default.ipv4_prefix)
+    ipv6_prefix = _optional_positive_int(o, "ipv6_prefix", "rate_limit", default.ipv6_prefix)
+    if ipv4_prefix is None or ipv4_prefix > 32 or ipv6_prefix is None or ipv6_prefix > 128:
+        raise ValueError(f"rate_limit -> ipv4_prefix / ipv6_prefix: {ipv4_prefix} / {ipv6_prefix} should be prefix lengths")
+
+    slip = o.get("slip", default.slip)
+    if not isinstance(slip, int) or isinstance(slip, bool) or slip < 0:
+        raise ValueError(f"rate_limit -> slip: {slip} should be 0 (never) or a positive integer")
+
+    return RateLimitConfig(
+        client_qps=rates["client_qps"],
+        client_burst=_optional_positive_int(o, "client_burst", "rate_limit", default.client_burst),
+        subnet_qps=rates["subnet_qps"],
+        subnet_burst=_optional_positive_int(o, "subnet_burst", "rate_limit", default.subnet_burst),
+        ipv4_prefix=ipv4_prefix,
+        ipv6_prefix=ipv6_prefix,
+        action=action,
+        responses_per_second=rates["responses_per_second"],
+        slip=slip,
+        exempt_clients=_string_list(o, "exempt_clients", "rate_limit"),
+    )
+
+
+def _optional_positive_int(o: dict, key: str, path: str, default: Optional[int]) -> Optional[int]:
+    if key not in o:
+        return default
+
+    if (value := o[key]) is None:
+        return None
+
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise ValueError("{} -> {}: {} should be a positive integer or null".format(path, key, value))
+
+    return value
+
+
+def parse_request_logs_config(o: Optional[dict]) -> RequestLogsConfig:
+    if o is None:
+        return RequestLogsConfig()
+
+    if not isinstance(o, dict):
+        raise ValueError("request_logs: wrong value")
+
+    default = RequestLogsConfig()
+    backend = default.backend
+    if (backend_str := o.get("backend")) is not None:
+        try:
+            backend = RequestLogsBackend(str(backend_str))
+        except ValueError:
+            raise ValueError(f"request_logs -> backend: {backend_str} should be one of (sqlite, binary)") from None
+
+    rollups = o.get("rollups", default.rollups)
+    if not isinstance(rollups, bool):
+        raise ValueError("request_logs -> rollups: should be true or false")
+
+    return RequestLogsConfig(
+        backend=backend,
+        retention_days=_optional_positive_int(o, "retention_days", "request_logs", default.retention_days),
+        max_rows=_optional_positive_int(o, "max_rows", "request_logs", default.max_rows),
+        rollups=rollups,
+        policy=parse_request_log_policy_config(o.get("policy")),
+        slow_query_ms=_optional_positive_int(o, "slow_query_ms", "request_logs", default.slow_query_ms),
+        sinks=parse_request_log_sinks_config(o.get("sinks")),
+    )
+
+
+def parse_request_log_sinks_config(o: Optional[list]) -> list[RequestLogSinkConfig]:
+    if o is None:
+        return []
+
+    if not isinstance(o, list):
+        raise ValueError("request_logs -> sinks: should be an array")
+
+    result = []
+    for i, value in enumerate(o):
+        path = f"request_logs -> sinks -> {i}"
+        if not isinstance(value, dict):
+            raise ValueError(f"{path}: wrong value")
+
+        type_str = str(value.get("type"))
+        try:
+            sink_type = RequestLogSinkType(type_str)
+        except ValueError:
+            raise ValueError(f"{path} -> type: {type_str} should be one of ({', '.join(x.value for x in RequestLogSinkType)})") from None
+
+        default = RequestLogSinkConfig(type=sink_type)
+        buffer = _optional_positive_int(value, "buffer", path, default.buffer)
+        max_bytes = _optional_positive_int(value, "max_bytes", path, default.max_bytes)
+        if buffer is None or max_bytes is None:
+            raise ValueError(f"{path} -> buffer / max_bytes: should be positive integers")
+
+        if not isinstance(backups := value.get("backups", default.backups), int) or isinstance(backups, bool) or backups < 0:
+            raise ValueError(f"{path} -> backups: {backups} should be 0 or a positive integer")
+
+        if (file := value.get("path")) is not None and (not isinstance(file, str) or not file):
+            raise ValueError(f"{path} -> path: {file} should be a file name")
+
+        address, port = value.get("address"), value.get("port")
+        if address is not None and not isinstance(address, str):
+            raise ValueError(f"{path} -> address: {address} should be a string")
+
+        if port is not None and (not isinstance(port, int) or isinstance(port, bool) or not 0 < port < 65536):
+            raise ValueError(f"{path} -> port: {port} should be between 1 and 65535")
+
+        if sink_type in [RequestLogSinkType.UDP, RequestLogSinkType.TCP] and (not address or port is None):
+            raise ValueError(f"{path}: {type_str} needs an address and a port")
+
+        if (facility := value.get("facility", default.facility)) not in logging.handlers.SysLogHandler.facility_names:
+            raise ValueError(f"{path} -> facility: {facility} is not a syslog facility")
+
+        result.append(
+            RequestLogSinkConfig(
+                type=sink_type,
+                buffer=buffer,
+                path=file,
+                max_bytes=max_bytes,
+                backups=backups,
+                address=address,
+                port=port,
+                facility=facility,
+            )
+        )
+
+    return result
+
+
+def _string_list(o: dict, key: str, path: str) -> list[str]:
+    value = o.get(key, [])
+    if not isinstance(value, list) or not all(isinstance(x, str) and x for x in value):
+        raise ValueError("{} -> {}: should be an array of strings".format(path, key))
+
+    return [x.lower() for x in value]
+
+
+def parse_request_log_policy_config(o: Optional[dict]) -> RequestLogPolicyConfig:
+    if o is None:
+        return RequestLogPolicyConfig()
+
+    path = "request_logs -> policy"
+    if not isinstance(o, dict):
+        raise ValueError(f"{path}: wrong value")
+
+    default = RequestLogPolicyConfig()
+    sample = o.get("sample", {})
+    if not isinstance(sample, dict) or len(set(sample) - {"noerror", "blocked"}) > 0:
+        raise ValueError(f"{path} -> sample: keys should be noerror / blocked, errors are always logged")
+
+    for key, value in sample.items():
+        if not isinstance(value, int | float) or isinstance(value, bool) or not 0 <= value <= 1:
+            raise ValueError(f"{path} -> sample -> {key}: {value} should be between 0 and 1")
+
+    slow_ms = o.get("slow_ms", default.slow_ms)
+    if slow_ms is not None and (not isinstance(slow_ms, int | float) or isinstance(slow_ms, bool) or slow_ms <= 0):
+        raise ValueError(f"{path} -> slow_ms: {slow_ms} should be a positive number or null")
+
+    return RequestLogPolicyConfig(
+        sample_noerror=sample.get("noerror", default.sample_noerror),
+        sample_blocked=sample.get("blocked", default.sample_blocked),
+        slow_ms=slow_ms,
+        skip_clients=_string_list(o, "skip_clients", path),
+        skip_names=_string_list(o, "skip_names", path),
+        max_per_second=_optional_positive_int(o, "max_per_second", path, default.max_per_second),
+    )
+
+
 class ConfigFile:
     def __init__(self, app_args: AppArgs):
         self.app_args = app_args
@@ -167,8 +508,9 @@ class ConfigFile:
         return parse_config_from_object(o)
 
     def init_db_from_config(self, config: DnsServerConfig):
-        rules = self.read_dns_server_rules(config)
+        self.init_db_from_rules(self.read_dns_server_rules(config))
 
+    def init_db_from_rules(self, rules: DnsServerRules):
         from simple.db import TheDbJob
 
         db_job = TheDbJob()
@@ -184,10 +526,10 @@ class ConfigFile:
             result = []
             for key1, value1 in file1.items():
                 for value11 in value1:
-                    p = self.app_args.data_dir.joinpath(value11).resolve()
-                    if p.is_file():
-                        text = p.read_text()
+                    if (text := self.rule_text(value11)) is not None:
                         result.extend(parse_func(key1, text))
+                    elif is_url(value11):
+                        logger.warning(f"not downloaded yet {key1} -> {value11}")
                     else:
                         logger.warning(f"missing {key1} -> {value11}")
 
@@ -208,3 +550,39 @@ class ConfigFile:
             cloaking_rules=cloaking_rules,
             forwarding_rules=forwarding_rules,
         )
+
+    def rule_text(self, value: str) -> Optional[str]:
+        """a rule file in the data dir, or the last download of a url (see simple.subscriptions)"""
+        if is_url(value):
+            return SubscriptionStore(self.app_args.data_dir.joinpath("temp", "subscriptions")).read(value)
+
+        p = self.app_args.data_dir.joinpath(value).resolve()
+        return p.read_text() if p.is_file() else None
+
+    def read_zones(self, config: DnsServerConfig) -> list["dns.zone.Zone"]:
+        """the files of a zone are read one after the other, as if they were one"""
+        if len(config.zones) == 0:
+            return []
+
+        import dns.exception
+        import dns.zone
+
+        result = []
+        for origin, files in config.zones.items():
+            texts = []
+            for file in files:
+                p = self.app_args.data_dir.joinpath(file).resolve()
+                if p.is_file():
+                    texts.append(p.read_text())
+                else:
+                    logger.warning(f"missing zones -> {origin} -> {file}")
+
+            if len(texts) == 0:
+                continue
+
+            try:
+                result.append(dns.zone.from_text("\n".join(texts), origin=origin + ".", relativize=False))
+            except dns.exception.DNSException as e:
+                raise ValueError("zones -> {}: {}".format(origin, e)) from None
+
+        return result
@@ -4,6 +4,11 @@ from dataclasses import asdict, fields
 from typing import Optional
 
 from simple.app_args import app_args
+from simple.cloaking_rules import cloaking_rdata, CloakingRecord, CloakingRules
+from simple.ip_rules import IpRules
+from simple.name_filter import NameFilter
+from simple.request_log_policy import RequestLogPolicy
+from simple.request_logs import RequestLogStore
 from simple.models import (
     AllowedIpItem,
     AllowedNameItem,
@@ -18,12 +23,37 @@ from simple.models import (
 
 __pragma_user_version__ = 1
 
+__rule_columns__ = {
+    "allowed_ips": ("group", "use_glob", "ip"),
+    "allowed_names": ("group", "use_glob", "name"),
+    "blocked_ips": ("group", "use_glob", "ip"),
+    "blocked_names": ("group", "use_glob", "name"),
+    "cloaking_rules": ("group", "name", "use_glob", "record_type", "mapped"),
+}
+
+__rule_types__ = {
+    "allowed_ips": AllowedIpItem,
+    "allowed_names": AllowedNameItem,
+    "blocked_ips": BlockedIpItem,
+    "blocked_names": BlockedNameItem,
+    "cloaking_rules": CloakingItem,
+}
+
 
 # noinspection DuplicatedCode
 class TheDbJob:
     request_log_queue = queue.Queue()
+    # set while the request log writer runs, None logs everything
+    request_log_policy: Optional[RequestLogPolicy] = None
+    # built by init_db, shared by every (readonly) instance of the process, sql is used until then
+    allowed_ip_rules: Optional[IpRules[AllowedIpItem]] = None
+    blocked_ip_rules: Optional[IpRules[BlockedIpItem]] = None
+    cloaking: Optional[CloakingRules] = None
+    allowed_name_filter: Optional[NameFilter] = None
+    blocked_name_filter: Optional[NameFilter] = None
 
     def __init__(self, in_memory: bool = False, readonly: bool = False):
+        self.in_memory = in_memory
         if in_memory:
             connection_str = "file:db?mode=memory"
         else:
@@ -64,21 +94,6 @@ class TheDbJob:
     def __init_db_schema_2(self):
         sql = """
 
-        create table if not exists request_logs
-        (
-            "id"              integer primary key autoincrement,
-            "request_id"      text not null,
-            "client_ip"       text not null,
-            "name"            text not null,
-            "cname"           text null,
-            "question_type"   text not null,
-            "response_status" text null,
-            "server"          text null,
-            "ms"              real not null,
-            "error"           text null,
-            "created"         text not null default current_timestamp
-        );
-
         create table allowed_ips
         (
             "id"       integer primary key autoincrement,
@@ -180,14 +195,28 @@ class TheDbJob:
     def __init_db_upgrade_db_0_1(self):
         pass
 
-    def init_db(self, rules: DnsServerRules):
+    def __init_db_rules_in_memory(self, rules: Optional[DnsServerRules]):
+        # an in memory database keeps them to itself
+        target = self if self.in_memory else TheDbJob
+        target.allowed_ip_rules = None if rules is None else IpRules(rules.allowed_ips)
+        target.blocked_ip_rules = None if rules is None else IpRules(rules.blocked_ips)
+        target.cloaking = None if rules is None else CloakingRules(rules.cloaking_rules)
+        target.allowed_name_filter = None if rules is None else NameFilter(rules.allowed_names)
+        target.blocked_name_filter = None if rules is None else NameFilter(rules.blocked_names)
+
+    def init_db(self, rules: DnsServerRules, in_memory_rules: bool = True):
+        """`in_memory_rules=False` answers every lookup with sql only, the reference of `simple.bench.rules`"""
         self.__init_db_pragma()
         self.__init_db_schema_1()
         self.__init_db_schema_2()
         self.__init_db_dns_server_rules(rules)
         self.__init_db_upgrade()
+        self.__init_db_rules_in_memory(rules if in_memory_rules else None)
 
     def allowed_ips(self, client_ip: str, ip: str) -> Optional[AllowedIpItem]:
+        if self.allowed_ip_rules is not None:
+            return self.allowed_ip_rules.match(client_ip, ip)
+
         parameters = {"client_ip": client_ip, "ip": ip}
         sql = """
             select * from allowed_ips where (
@@ -207,7 +236,7 @@ class TheDbJob:
         return item
 
     def allowed_names(self, client_ip: str, name: str) -> Optional[AllowedNameItem]:
-        if not name:
+        if not name or (self.allowed_name_filter is not None and not self.allowed_name_filter.may_match(name)):
             return None
 
         parameters = {"client_ip": client_ip, "name": name.lower()}
@@ -230,6 +259,9 @@ class TheDbJob:
         return item
 
     def blocked_ips(self, client_ip: str, ip: str) -> Optional[BlockedIpItem]:
+        if self.blocked_ip_rules is not None:
+            return self.blocked_ip_rules.match(client_ip, ip)
+
         parameters = {"client_ip": client_ip, "ip": ip}
         sql = """
             select * from blocked_ips where (
@@ -249,7 +281,7 @@ class TheDbJob:
         return item
 
     def blocked_names(self, client_ip: str, name: str) -> Optional[BlockedNameItem]:
-        if not name:
+        if not name or (self.blocked_name_filter is not None and not self.blocked_name_filter.may_match(name)):
             return None
 
         parameters = {"client_ip": client_ip, "name": name.lower()}
@@ -275,6 +307,23 @@ class TheDbJob:
         result1 = self.allowed_ips(client_ip, ip)
         return result1 if result1 is not None else self.blocked_ips(client_ip, ip)
 
+    def has_ip_rules(self, client_ip: str) -> bool:
+        """False when no allowed_ips / blocked_ips group applies to this client, answers go out untouched then"""
+        if self.allowed_ip_rules is None or self.blocked_ip_rules is None:
+            return True
+
+        return self.allowed_ip_rules.applies_to(client_ip) or self.blocked_ip_rules.applies_to(client_ip)
+
+    def block_ips_many(self, client_ip: str, ips: list[str]) -> dict[str, AllowedIpItem | BlockedIpItem]:
+        """block_ips_ex for every address of an answer at once, addresses without a matching rule are left out"""
+        if self.allowed_ip_rules is None or self.blocked_ip_rules is None:
+            return {ip: item for ip in dict.fromkeys(ips) if (item := self.block_ips_ex(client_ip, ip)) is not None}
+
+        result: dict[str, AllowedIpItem | BlockedIpItem] = dict()
+        result.update(self.allowed_ip_rules.match_many(client_ip, ips))
+        result.update(self.blocked_ip_rules.match_many(client_ip, [x for x in ips if x not in result]))
+        return result
+
     def block_names_ex(self, client_ip: str, name: str) -> AllowedNameItem | BlockedNameItem | None:
         result1 = self.allowed_names(client_ip, name)
         return result1 if result1 is not None else self.blocked_names(client_ip, name)
@@ -298,7 +347,17 @@ class TheDbJob:
         item = item if item is not None else next((x for x in result), None)
         return [] if item is None else [x for x in result if x.name == item.name]
 
+    def cloaking_records(self, name: str) -> list[CloakingRecord]:
+        """cloaking_rules_ex with the rdata of every A / AAAA record"""
+        if self.cloaking is not None:
+            return self.cloaking.lookup(name)
+
+        return [(x, cloaking_rdata(x)) for x in self.cloaking_rules_ex(name)]
+
     def cloaking_rules_ex(self, name: str) -> list[CloakingItem]:
+        if self.cloaking is not None:
+            return [x for x, _ in self.cloaking.lookup(name)]
+
         result = self.cloaking_rules(name=name)
         for w in range(5):
             if (cname := next((x for x in result if x.record_type == CloakingItemRecordType.CNAME), None)) is None:
@@ -330,18 +389,92 @@ class TheDbJob:
         item = item if item is not None else next((x for x in result), None)
         return item
 
+    def add_rules(self, kind: str, items: list) -> int:
+        """
+        rules added at runtime (see `simple.temp_rules`), the row and the in memory index change in place, nothing is rebuilt.
+        the number of rules that were not there yet
+        """
+        columns = __rule_columns__[kind]
+        sql = """ insert into {} ({}) values ({}) """.format(
+            kind, ", ".join(f'"{x}"' for x in columns), ", ".join(f":{x}" for x in columns)
+        )
+        changed = 0
+        for item in items:
+            changed += self.db.execute(sql, asdict(item)).rowcount
+            self._rules_in_memory(kind, item, True)
+
+        self.db.commit()
+        return changed
+
+    def remove_rules(self, kind: str, items: list) -> int:
+        columns = [x for x in __rule_columns__[kind] if x != "use_glob"]
+        sql = """ delete from {} where {} """.format(kind, " and ".join(f'"{x}" = :{x}' for x in columns))
+        changed = 0
+        for item in items:
+            changed += self.db.execute(sql, {x: getattr(item, x) for x in columns}).rowcount
+            self._rules_in_memory(kind, item, False)
+
+        self.db.commit()
+        return changed
+
+    def rules_by_group(self, kind: str, group: str) -> list:
+        sql = """ select * from {} where "group" = :group order by id """.format(kind)
+        rows = self.db.execute(sql, {"group": group}).fetchall()
+        item_type = __rule_types__[kind]
+        return [item_type(**{field.name: field.type(row[field.name]) for field in fields(item_type)}) for row in rows]
+
+    def _rules_in_memory(self, kind: str, item, add: bool):
+        if kind == "cloaking_rules" and self.cloaking is not None:
+            if add:
+                self.cloaking.add(item)
+            else:
+                self.cloaking.remove(item)
+
+        name_filter = {"allowed_names": self.allowed_name_filter, "blocked_names": self.blocked_name_filter}.get(kind)
+        if name_filter is not None and add:
+            name_filter.add(item)
+
+        rules = {"allowed_ips": self.allowed_ip_rules, "blocked_ips": self.blocked_ip_rules}.get(kind)
+        if rules is not None:
+            if add:
+                rules.add(item)
+            else:
+                rules.remove(item.group, item.ip)
+
     def insert_request_log_into_queue(self, request_log: RequestLog):
         TheDbJob.request_log_queue.put_nowait(request_log)
 
-    def insert_request_log(self, *request_logs: RequestLog):
-        # sqlite3.OperationalError: database is locked
-        sql = """
-            insert into request_logs
-                        ("request_id", "client_ip", "name", "cname", "response_status", "question_type", "server", "ms", "error", "created")
-                 values (:request_id, :client_ip, :name, :cname, :response_status, :question_type, :server, :ms, :error, :created)
+    def migrate_legacy_request_logs(self, store: RequestLogStore, before: Optional[str] = None, chunk: int = 10000) -> Optional[int]:
         """
-        self.db.executemany(sql, [asdict(x) for x in request_logs])
-        self.db.commit()
+        request logs used to live in this database, move them to the day partitions of `store` a chunk at a time
+        (the ones older than `before`, past retention_days, are only deleted) and drop the table once empty,
+        None if there is no such table (anymore)
+        """
+        sql = """ select count(*) as "count" from sqlite_master where type = 'table' and name = 'request_logs' """
+        if self.db.execute(sql).fetchone()["count"] == 0:
+            return None
+
+        deleted = 0
+        if before is not None:
+            sql = (
+                """ delete from request_logs where id in (select id from request_logs where created < :before order by id limit :chunk) """
+            )
+            deleted = self.db.execute(sql, {"before": before, "chunk": chunk}).rowcount
+            self.db.commit()
+
+        if deleted == 0:
+            rows = self.db.execute(""" select * from request_logs order by id limit ? """, (chunk,)).fetchall()
+            if len(rows) > 0:
+                store.insert(*[RequestLog(**{x.name: row[x.name] for x in fields(RequestLog)}) for row in rows])
+                self.db.execute(""" delete from request_logs where id <= ? """, (rows[-1]["id"],))
+                self.db.commit()
+                deleted = len(rows)
+
+        if self.db.execute(""" select count(*) as "count" from (select id from request_logs limit 1) """).fetchone()["count"] == 0:
+            self.db.execute(""" drop table request_logs """)
+            self.db.commit()
+
+        return deleted
 
     @staticmethod
     def _max_len_by_name(x: ForwardingItem | AllowedNameItem | BlockedNameItem | CloakingItem) -> int:
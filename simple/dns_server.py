@@ -1,36 +1,46 @@
+import json
 import logging
 import queue
+import ssl
 import threading
 import time
-from contextlib import contextmanager
-from typing import Callable
-
-import dns.exception
-import dns.message
-import dns.query
-import dns.rdata
-import dns.rdtypes
-import dns.rdtypes.IN
-import dns.rdtypes.IN.A
-import dns.rdtypes.IN.AAAA
-import dns.resolver
-import httpx
+from contextlib import contextmanager, ExitStack
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, TYPE_CHECKING
 
 from simple import USER_AGENT
 from simple.app_args import AppArgs
 from simple.db import TheDbJob
+from simple.log_sinks import AsyncSink, request_log_sinks, RollupSink, sink_factory
+from simple.minimize_rules import minimize_rules, minimize_rules_summary
 from simple.models import DnsServerConfig
-from simple.threading_server import ThreadingDnsTCPServer, ThreadingDnsUDPServer
+from simple.rate_limit import rate_limiter
+from simple.request_log_policy import RequestLogPolicy
+from simple.request_logs import RequestLogStore
+from simple.rollups import prune_rollups, rollups_file, RollupStore
+from simple.rule_hits import rule_hits, rule_hits_file, RuleHitStore
+from simple.slow_queries import slow_query_log
+from simple.subscriptions import SubscriptionRefresher, subscriptions
+from simple.stopwatch import Stopwatch
+from simple.startup_report import load_protocols, startup_report, uses_https
+
+# protocol stacks are imported by start_server, for the upstream protocols in config.json only (see load_protocols)
+if TYPE_CHECKING:
+    import httpx
+
+    from simple.threading_server import ThreadingDnsTCPServer, ThreadingDnsUDPServer
 
 logger = logging.getLogger(__name__)
 
 
 @contextmanager
 def __start_threading_dns_server(
-    threading_server_class: Callable[[tuple[str, int], DnsServerConfig, httpx.Client], ThreadingDnsTCPServer | ThreadingDnsUDPServer],
+    threading_server_class: Callable[
+        [tuple[str, int], DnsServerConfig, Optional["httpx.Client"]], "ThreadingDnsTCPServer | ThreadingDnsUDPServer"
+    ],
     server_address: tuple[str, int],
     config: DnsServerConfig,
-    doh_client: httpx.Client,
+    doh_client: Optional["httpx.Client"],
 ):
     server = threading_server_class(server_address, config, doh_client)
     server_thread_name = "{}_{}".format(type(server).__name__, server_address)
@@ -46,31 +56,38 @@ def __start_threading_dns_server(
 
 
 @contextmanager
-def handle_request_log_queue():
+def handle_request_log_queue(config: DnsServerConfig):
+    """request logs go from the queue to every sink (see simple.log_sinks), a sink that falls behind drops, the others go on"""
     finished = threading.Event()
+    directory = RequestLogStore().directory
+    sinks = [AsyncSink(x.type.value, sink_factory(x, directory), x.buffer).start() for x in request_log_sinks(config.request_logs)]
+    if config.request_logs.rollups:
+        sinks.append(AsyncSink("rollups", lambda: RollupSink(RollupStore(rollups_file(directory)))).start())
 
     def handle_it():
-        try:
-            db = TheDbJob()
-            while True:
-                try:
-                    item = TheDbJob.request_log_queue.get(block=True, timeout=0.1)
-                except queue.Empty:
-                    if finished.is_set():
-                        break
-                else:
+        while True:
+            try:
+                items = [TheDbJob.request_log_queue.get(block=True, timeout=0.1)]
+            except queue.Empty:
+                if finished.is_set():
+                    break
+            else:
+                while len(items) < 500:
                     try:
-                        db.insert_request_log(item)
-                    except Exception as ee:
-                        logger.error("insert_request_log", exc_info=ee)
-                    finally:
-                        TheDbJob.request_log_queue.task_done()
-        except Exception as e:
-            logger.error("handle_request_log_queue", exc_info=e)
+                        items.append(TheDbJob.request_log_queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                for sink in sinks:
+                    sink.put(items)
+
+                for _ in items:
+                    TheDbJob.request_log_queue.task_done()
 
     request_log_thread = threading.Thread(target=handle_it, name="request_log_thread")
     request_log_thread.daemon = True
     request_log_thread.start()
+    TheDbJob.request_log_policy = RequestLogPolicy(config.request_logs.policy)
 
     try:
         yield
@@ -78,6 +95,178 @@ def handle_request_log_queue():
         TheDbJob.request_log_queue.join()
         finished.set()
         request_log_thread.join()
+        for sink in sinks:
+            sink.close()
+
+        TheDbJob.request_log_policy = None
+
+
+@contextmanager
+def handle_subscriptions(config: DnsServerConfig, app_args: AppArgs, interval: float = 60):
+    """downloads the rule lists of urls when they are due, and applies the changes, in the background"""
+    if len(subscriptions(config)) == 0:
+        yield
+        return
+
+    from simple.config import ConfigFile
+
+    finished = threading.Event()
+    refresher = SubscriptionRefresher(config, ConfigFile(app_args).rule_text)
+
+    def handle_it():
+        while not finished.is_set():
+            try:
+                refresher.run()
+            except Exception as e:
+                logger.error("handle_subscriptions", exc_info=e)
+
+            finished.wait(interval)
+
+    subscriptions_thread = threading.Thread(target=handle_it, name="subscriptions_thread")
+    subscriptions_thread.daemon = True
+    subscriptions_thread.start()
+
+    try:
+        yield
+    finally:
+        finished.set()
+        subscriptions_thread.join()
+
+
+@contextmanager
+def handle_rule_hits(interval: float = 60):
+    """the hits of the rules are counted while the server runs and added to temp/rule_hits.sqlite3 every `interval` seconds"""
+    finished = threading.Event()
+
+    def handle_it():
+        try:
+            store = RuleHitStore(rule_hits_file())
+        except Exception as e:
+            rule_hits.enabled = False
+            logger.error("handle_rule_hits", exc_info=e)
+            return
+
+        try:
+            while not finished.wait(interval):
+                try:
+                    rule_hits.flush(store)
+                except Exception as e:
+                    logger.error("handle_rule_hits", exc_info=e)
+
+            rule_hits.flush(store)
+        finally:
+            store.close()
+
+    rule_hits.enabled = True
+    rule_hits_thread = threading.Thread(target=handle_it, name="rule_hits_thread")
+    rule_hits_thread.daemon = True
+    rule_hits_thread.start()
+
+    try:
+        yield
+    finally:
+        rule_hits.enabled = False
+        finished.set()
+        rule_hits_thread.join()
+
+
+@contextmanager
+def handle_request_log_retention(config: DnsServerConfig, interval: float = 3600):
+    finished = threading.Event()
+
+    def handle_it():
+        while not finished.is_set():
+            try:
+                if config.request_logs.retention_days is not None:
+                    before = datetime.now(timezone.utc) - timedelta(days=config.request_logs.retention_days)
+                    before_str = before.strftime("%Y-%m-%d %H:%M:%S")
+                else:
+                    before_str = None
+
+                db = TheDbJob()
+                store = RequestLogStore()
+                try:
+                    while not finished.is_set():
+                        if not db.migrate_legacy_request_logs(store, before_str):
+                            break
+                finally:
+                    store.close()
+                    db.db.close()
+
+                dropped = RequestLogStore().prune(config.request_logs)
+                if len(dropped) > 0:
+                    logger.info(f"request_logs: dropped {', '.join(dropped)}")
+
+                if config.request_logs.rollups:
+                    prune_rollups(config.request_logs)
+
+                if len(dropped := slow_query_log.prune(config.request_logs.retention_days)) > 0:
+                    logger.info(f"slow_queries: dropped {', '.join(dropped)}")
+            except Exception as e:
+                logger.error("handle_request_log_retention", exc_info=e)
+
+            finished.wait(interval)
+
+    request_log_retention_thread = threading.Thread(target=handle_it, name="request_log_retention_thread")
+    request_log_retention_thread.daemon = True
+    request_log_retention_thread.start()
+
+    try:
+        yield
+    finally:
+        finished.set()
+        request_log_retention_thread.join()
+
+
+@contextmanager
+def handle_admin_server(config: DnsServerConfig, app_args: AppArgs):
+    if config.admin.port is None:
+        yield
+        return
+
+    from simple.admin_server import AdminServer
+
+    server = AdminServer((config.admin.host, config.admin.port), config, app_args.data_dir)
+    server_thread = threading.Thread(target=server.serve_forever, name="admin_server_thread")
+    server_thread.daemon = True
+    server_thread.start()
+    logger.info(f"admin api at http://{config.admin.host}:{config.admin.port}")
+
+    try:
+        yield
+    finally:
+        server.shutdown()
+        server.server_close()
+        server_thread.join()
+
+
+def _doh_client_verify(config: DnsServerConfig) -> ssl.SSLContext | bool:
+    ca_files = sorted({x.ca_file for x in config.upstream.values() if x.ca_file is not None})
+    if len(ca_files) == 0:
+        return True
+
+    import certifi
+
+    ssl_context = ssl.create_default_context(cafile=certifi.where())
+    for ca_file in ca_files:
+        ssl_context.load_verify_locations(cafile=ca_file)
+
+    return ssl_context
+
+
+@contextmanager
+def handle_doh_client(config: DnsServerConfig):
+    """None when no upstream uses https, httpx (and h2) are not imported then"""
+    if not uses_https(config):
+        yield None
+        return
+
+    import httpx
+
+    with httpx.Client(
+        http1=True, http2=True, headers={"User-Agent": USER_AGENT}, timeout=2, trust_env=False, verify=_doh_client_verify(config)
+    ) as doh_client:
+        yield doh_client
 
 
 @contextmanager
@@ -85,24 +274,70 @@ def start_server(app_args: AppArgs):
     from simple.config import ConfigFile
 
     config_file = ConfigFile(app_args)
-    config = config_file.read_config_from_config_file()
-    config_file.init_db_from_config(config)
+    with startup_report.stage("config"):
+        config = config_file.read_config_from_config_file()
+
+    with startup_report.stage("rules"):
+        rules = config_file.read_dns_server_rules(config)
+        if config.minimize_rules:
+            rules, report = minimize_rules(config, rules)
+            if (summary := minimize_rules_summary(report)) is not None:
+                logger.info(summary)
+
+        if len(config.zones) > 0:
+            from simple.local_zones import local_zones
+
+            local_zones.set_zones(config_file.read_zones(config))
+
+    with startup_report.stage("db"):
+        config_file.init_db_from_rules(rules)
+
+    rate_limiter.configure(config.rate_limit)
+    slow_query_log.configure(config.request_logs.slow_query_ms)
 
     server_address_ipv4 = ("0.0.0.0", app_args.port)
     server_address_ipv6 = ("::", app_args.port)
-    with (
-        httpx.Client(http1=True, http2=True, headers={"User-Agent": USER_AGENT}, timeout=2, trust_env=False) as doh_client,
-        handle_request_log_queue(),
-        __start_threading_dns_server(ThreadingDnsTCPServer, server_address_ipv4, config, doh_client),
-        __start_threading_dns_server(ThreadingDnsTCPServer, server_address_ipv6, config, doh_client),
-        __start_threading_dns_server(ThreadingDnsUDPServer, server_address_ipv4, config, doh_client),
-        __start_threading_dns_server(ThreadingDnsUDPServer, server_address_ipv6, config, doh_client),
-    ):
+    with ExitStack() as stack:
+        with startup_report.stage("protocols"):
+            load_protocols(config)
+            from simple.threading_server import ThreadingDnsTCPServer, ThreadingDnsUDPServer
+
+            doh_client = stack.enter_context(handle_doh_client(config))
+
+        with startup_report.stage("bind"):
+            stack.enter_context(handle_request_log_queue(config))
+            stack.enter_context(handle_request_log_retention(config))
+            stack.enter_context(handle_admin_server(config, app_args))
+            stack.enter_context(handle_subscriptions(config, app_args))
+            stack.enter_context(handle_rule_hits())
+            stack.enter_context(__start_threading_dns_server(ThreadingDnsTCPServer, server_address_ipv4, config, doh_client))
+            stack.enter_context(__start_threading_dns_server(ThreadingDnsTCPServer, server_address_ipv6, config, doh_client))
+            stack.enter_context(__start_threading_dns_server(ThreadingDnsUDPServer, server_address_ipv4, config, doh_client))
+            stack.enter_context(__start_threading_dns_server(ThreadingDnsUDPServer, server_address_ipv6, config, doh_client))
+
         logger.info("Local Dns Server at {} and {} is up and running".format(server_address_ipv4, server_address_ipv6))
         yield
 
 
+def first_answer(port: int) -> dict:
+    """one query to the server just started, for --startup-report"""
+    import dns.message
+    import dns.query
+    import dns.rcode
+
+    try:
+        with Stopwatch() as stopwatch:
+            response = dns.query.udp(dns.message.make_query("example.com", "A"), where="127.0.0.1", port=port, timeout=2)
+    except Exception as e:
+        return {"first_answer_ms": None, "first_answer_error": f"{type(e).__name__}: {e}"}
+
+    return {"first_answer_ms": stopwatch.elapsed_milliseconds, "first_answer_rcode": dns.rcode.to_text(response.rcode())}
+
+
 def query_input_loop(port: int):
+    import dns.message
+    import dns.query
+
     while True:
         try:
             query = input(">>> query: ")
@@ -142,5 +377,9 @@ def do_action_dns_server(app_args: AppArgs):
     with single_instance_locker(app_args) as running:
         if not running:
             with start_server(app_args):
+                if app_args.startup_report:
+                    print(json.dumps(startup_report.report(**first_answer(app_args.port)), indent=2))
+                    return
+
                 time.sleep(0.1)
                 query_input_loop(app_args.port)
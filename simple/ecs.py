@@ -0,0 +1,87 @@
+from functools import lru_cache
+from ipaddress import ip_network
+from typing import Optional
+
+import dns.edns
+import dns.message
+import dns.rrset
+
+from simple.models import EcsConfig, EcsMode
+
+# the payload size of the queries getting an opt record only because of the subnet, the dns flag day 2020 value
+__payload__ = 1232
+# udp answers to a query without an opt record (rfc 1035)
+__legacy_payload__ = 512
+
+
+def parse_request(data: bytes) -> dns.message.Message:
+    """
+    the question, and the opt record of the client when there is an additional record (arcount > 0):
+    upstream queries keep its payload and options, the answer has an opt record only when the query had one
+    """
+    if data[10:12] != b"\0\0":
+        try:
+            return dns.message.from_wire(data, one_rr_per_rrset=False)
+        except Exception:
+            # e.g. tsig without a keyring, the question still gets an answer
+            pass
+
+    return dns.message.from_wire(data, question_only=True, one_rr_per_rrset=False)
+
+
+def udp_payload(request_message: dns.message.Message) -> int:
+    """the largest udp answer the client takes, a larger one goes out truncated"""
+    return __legacy_payload__ if request_message.edns < 0 else max(__legacy_payload__, request_message.payload)
+
+
+@lru_cache(maxsize=8)
+def ecs_option(config: EcsConfig) -> Optional[dns.edns.ECSOption]:
+    """the one client subnet option every upstream query gets, None for none"""
+    if config.mode == EcsMode.STRIP or config.address is None:
+        return None
+
+    prefix = config.ipv4_prefix if ":" not in config.address else config.ipv6_prefix
+    return dns.edns.ECSOption(str(ip_network(f"{config.address}/{prefix}", strict=False).network_address), prefix)
+
+
+def upstream_query(request_message: dns.message.Message, config: EcsConfig) -> dns.message.Message:
+    """
+    the query sent upstream: no client subnet of its own, the configured one when there is one,
+    so the upstreams (and their caches) see every client of the lan as the same one
+    """
+    option = ecs_option(config)
+    options = [x for x in request_message.options if not isinstance(x, dns.edns.ECSOption)]
+    if option is None and len(options) == len(request_message.options):
+        return request_message
+
+    question: dns.rrset.RRset = request_message.question[0]
+    if option is not None:
+        options.append(option)
+
+    edns = request_message.edns >= 0 or len(options) > 0
+    return dns.message.make_query(
+        question.name,
+        question.rdtype,
+        question.rdclass,
+        use_edns=0 if edns else False,
+        ednsflags=request_message.ednsflags,
+        payload=request_message.payload if request_message.edns >= 0 else __payload__,
+        options=options,
+        id=request_message.id,
+        flags=request_message.flags,
+    )
+
+
+def client_response(request_message: dns.message.Message, response_message: dns.message.Message) -> dns.message.Message:
+    """
+    the scope of the upstream answer is about our subnet, not the client's one: it is not passed on.
+    an opt record only added for the subnet is dropped too, rfc 6891 7: none in the answer to a query without one
+    """
+    if request_message.edns < 0:
+        if response_message.edns >= 0:
+            response_message.use_edns(False)
+    elif any(isinstance(x, dns.edns.ECSOption) for x in response_message.options):
+        options = [x for x in response_message.options if not isinstance(x, dns.edns.ECSOption)]
+        response_message.use_edns(response_message.edns, response_message.ednsflags, response_message.payload, options=options)
+
+    return response_message
@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# rfc 8305 "connection attempt delay": 250 ms by default, never under 10 ms, 2 x the smoothed rtt when known
+__attempt_delay__ = 0.25
+__min_attempt_delay__ = 0.01
+__max_backoff__ = 300.0
+# timeouts follow the rtt distribution once there are enough samples: 4 x the p95, between 0.5 and 5 s, 2 s before that
+__rtt_samples__ = 64
+__min_rtt_samples__ = 8
+__timeout__ = 2.0
+__min_timeout__ = 0.5
+__max_timeout__ = 5.0
+
+
+def _timeout(p95: Optional[float]) -> float:
+    return __timeout__ if p95 is None else max(__min_timeout__, min(__max_timeout__, 4 * p95 / 1000))
+
+
+class FamilyHealth:
+    """
+    smoothed latency, recent rtt samples and failures of every upstream by address family (4 / 6),
+    shared by all the request threads
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (upstream, family) -> [srtt ms or None, consecutive failures, down until, recent rtt ms]
+        self._stats: dict[tuple[str, int], list] = dict()
+
+    def _get(self, upstream: str, family: int) -> list:
+        if (stats := self._stats.get((upstream, family))) is None:
+            stats = self._stats[(upstream, family)] = [None, 0, 0.0, deque(maxlen=__rtt_samples__)]
+
+        return stats
+
+    def success(self, upstream: str, family: int, ms: float):
+        with self._lock:
+            stats = self._get(upstream, family)
+            stats[0] = ms if stats[0] is None else stats[0] * 0.8 + ms * 0.2
+            stats[1] = 0
+            stats[2] = 0.0
+            stats[3].append(ms)
+
+    def failure(self, upstream: str, family: int, timeout: Optional[float] = None):
+        """`timeout` (seconds) when the attempt timed out: the rtt was at least that, the next timeouts grow with it"""
+        with self._lock:
+            stats = self._get(upstream, family)
+            stats[1] += 1
+            stats[2] = time.monotonic() + min(__max_backoff__, 2.0 ** (stats[1] - 1))
+            if timeout is not None:
+                stats[3].append(timeout * 1000)
+
+    def _p95(self, upstream: str, family: int) -> Optional[float]:
+        if (stats := self._stats.get((upstream, family))) is None or len(stats[3]) < __min_rtt_samples__:
+            return None
+
+        samples = sorted(stats[3])
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def timeout(self, upstream: str, family: int) -> float:
+        """seconds, a packet lost to a fast upstream costs little, a slow one is not cut off before it usually answers"""
+        with self._lock:
+            return _timeout(self._p95(upstream, family))
+
+    def order(self, upstream: str, families: list[int]) -> list[int]:
+        """families that are up first, then by smoothed latency, unknown ones keep the given order (ipv6 first)"""
+        now = time.monotonic()
+        with self._lock:
+            stats = {x: self._stats.get((upstream, x), [None, 0, 0.0])[:3] for x in families}
+
+        def key(family: int) -> tuple:
+            srtt, _, down_until = stats[family]
+            return down_until > now, 0 if srtt is None else 1, srtt or 0.0
+
+        # unknown before measured: a family is tried at least once, then ordered by what it did
+        return sorted(families, key=key)
+
+    def attempt_delay(self, upstream: str, families: list[int]) -> float:
+        """
+        when the next attempt (the other family, a hedge to another ip) starts: the p95 rtt of the first family, however long,
+        2 x its smoothed rtt while there are few samples, or of another family while the first is not measured yet (at most 250 ms)
+        """
+        with self._lock:
+            if (p95 := self._p95(upstream, families[0])) is not None:
+                return max(__min_attempt_delay__, p95 / 1000)
+
+            srtts = [x[0] for x in [self._stats.get((upstream, family)) for family in families] if x is not None and x[0] is not None]
+
+        if len(srtts) == 0:
+            return __attempt_delay__
+
+        return max(__min_attempt_delay__, min(__attempt_delay__, 2 * srtts[0] / 1000))
+
+    def report(self) -> dict[str, dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{upstream}/ipv{family}": {
+                    "srtt_ms": None if srtt is None else round(srtt, 2),
+                    "p95_ms": None if (p95 := self._p95(upstream, family)) is None else round(p95, 2),
+                    "timeout_ms": round(_timeout(p95) * 1000),
+                    "failures": failures,
+                    "down": down_until > now,
+                }
+                for (upstream, family), (srtt, failures, down_until, _) in self._stats.items()
+            }
+
+
+family_health = FamilyHealth()
+
+
+def happy_eyeballs(attempts: list[Callable[[], T]], delay: float) -> tuple[int, T]:
+    """
+    start attempts[0], the next one after `delay` or as soon as the previous one failed, the first success wins.
+    (index, result), the error of the last attempt when all of them failed. a single attempt runs in the calling thread
+    """
+    if len(attempts) == 1:
+        return 0, attempts[0]()
+
+    results: queue.Queue[tuple[int, Optional[T], Optional[BaseException]]] = queue.Queue()
+
+    def run(i: int):
+        try:
+            results.put((i, attempts[i](), None))
+        except BaseException as e:
+            results.put((i, None, e))
+
+    def start(i: int):
+        threading.Thread(target=run, args=(i,), name=f"happy_eyeballs_{i}", daemon=True).start()
+
+    started, failed = 1, 0
+    start(0)
+    while True:
+        try:
+            i, result, error = results.get(timeout=delay if started < len(attempts) else None)
+        except queue.Empty:
+            start(started)
+            started += 1
+            continue
+
+        if error is None:
+            return i, result
+
+        failed += 1
+        if failed == len(attempts):
+            raise error
+
+        if started < len(attempts) and failed == started:
+            start(started)
+            started += 1
@@ -0,0 +1,203 @@
+import re
+from dataclasses import dataclass, field
+from ipaddress import ip_address, ip_network, IPv4Network, IPv6Network
+from typing import Callable, Generic, Iterable, Optional, TypeVar
+
+from simple.models import AllowedIpItem, BlockedIpItem
+from simple.sqlite_glob import glob_match
+
+T = TypeVar("T", AllowedIpItem, BlockedIpItem)
+V = TypeVar("V")
+
+__octets_glob_pattern__ = re.compile(r"^((?:\d{1,3}\.){1,3})\*$")
+
+
+def rule_network(text: str, use_glob: bool) -> Optional[IPv4Network | IPv6Network]:
+    """the prefix of an exact address, a cidr or a whole octet glob, None for other globs"""
+    if use_glob:
+        if (m := __octets_glob_pattern__.match(text)) is None:
+            return None
+
+        octets = m.group(1).rstrip(".").split(".")
+        text = ".".join(octets + ["0"] * (4 - len(octets))) + f"/{8 * len(octets)}"
+
+    try:
+        return ip_network(text, strict=False)
+    except ValueError:
+        return None
+
+
+@dataclass
+class _Node(Generic[V]):
+    prefix: int
+    length: int
+    values: list[V] = field(default_factory=list)
+    children: list[Optional["_Node[V]"]] = field(default_factory=lambda: [None, None])
+
+
+class RadixTree(Generic[V]):
+    """
+    binary patricia tree of prefixes (address as int, prefix length), one per address family,
+    `lookup` walks at most `bits` nodes and returns the values of every prefix containing the address, shortest first
+    """
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.root: _Node[V] = _Node(0, 0)
+
+    def _bit(self, value: int, index: int) -> int:
+        return (value >> (self.bits - 1 - index)) & 1
+
+    def _mask(self, value: int, length: int) -> int:
+        return value & ~((1 << (self.bits - length)) - 1) if length > 0 else 0
+
+    def insert(self, prefix: int, length: int, value: V):
+        prefix = self._mask(prefix, length)
+        node = self.root
+        while True:
+            if node.length == length:
+                node.values.append(value)
+                return
+
+            bit = self._bit(prefix, node.length)
+            if (child := node.children[bit]) is None:
+                node.children[bit] = _Node(prefix, length, [value])
+                return
+
+            common = min(child.length, length, self.bits - (child.prefix ^ prefix).bit_length())
+            if common == child.length:
+                node = child
+                continue
+
+            middle: _Node[V] = _Node(self._mask(prefix, common), common)
+            middle.children[self._bit(child.prefix, common)] = child
+            node.children[bit] = middle
+            if common == length:
+                middle.values.append(value)
+            else:
+                middle.children[self._bit(prefix, common)] = _Node(prefix, length, [value])
+
+            return
+
+    def remove(self, prefix: int, length: int, predicate: Callable[[V], bool]) -> bool:
+        """drop the matching values of this exact prefix, the (now maybe empty) node stays"""
+        prefix = self._mask(prefix, length)
+        node: Optional[_Node[V]] = self.root
+        while node is not None and node.length <= length and self._mask(prefix, node.length) == node.prefix:
+            if node.length == length:
+                values = [x for x in node.values if not predicate(x)]
+                removed = len(values) != len(node.values)
+                node.values = values
+                return removed
+
+            node = node.children[self._bit(prefix, node.length)]
+
+        return False
+
+    def lookup(self, address: int) -> list[V]:
+        result = list(self.root.values)
+        node = self.root
+        while node.length < self.bits and (node := node.children[self._bit(address, node.length)]) is not None:
+            if self._mask(address, node.length) != node.prefix:
+                break
+
+            result.extend(node.values)
+
+        return result
+
+
+@dataclass
+class _GroupRules(Generic[T]):
+    ipv4: RadixTree[tuple[int, T]] = field(default_factory=lambda: RadixTree(32))
+    ipv6: RadixTree[tuple[int, T]] = field(default_factory=lambda: RadixTree(128))
+    texts: dict[str, list[tuple[int, T]]] = field(default_factory=dict)
+    globs: list[tuple[int, str, T]] = field(default_factory=list)
+
+
+class IpRules(Generic[T]):
+    """
+    allowed_ips / blocked_ips in memory, rules are grouped by client group then by address family,
+    exact addresses, cidr and whole octet globs (192.168.1.*) are prefixes of the radix trees, other globs are matched one by one.
+    `match` has the same precedence as the sql it replaces: same text as the address, then a client group, then the first rule
+    """
+
+    def __init__(self, items: list[T]):
+        self.groups: dict[str, _GroupRules[T]] = dict()
+        self._seen: set[tuple[str, str]] = set()
+        self._order = 0
+        for x in items:
+            self.add(x)
+
+    def add(self, x: T) -> bool:
+        # constraint "group_ip" unique ("group", "ip") on conflict ignore
+        if (x.group, x.ip) in self._seen:
+            return False
+
+        self._seen.add((x.group, x.ip))
+        self._order += 1
+        rules = self.groups.setdefault(x.group, _GroupRules())
+        if (network := rule_network(x.ip, x.use_glob)) is None:
+            if x.use_glob:
+                rules.globs = [*rules.globs, (self._order, x.ip, x)]
+            else:
+                rules.texts[x.ip] = [*rules.texts.get(x.ip, []), (self._order, x)]
+        else:
+            tree = rules.ipv4 if network.version == 4 else rules.ipv6
+            tree.insert(int(network.network_address), network.prefixlen, (self._order, x))
+
+        return True
+
+    def remove(self, group: str, ip: str) -> bool:
+        if (group, ip) not in self._seen:
+            return False
+
+        self._seen.discard((group, ip))
+        rules = self.groups[group]
+        rules.globs = [w for w in rules.globs if w[1] != ip]
+        rules.texts.pop(ip, None)
+        for network in [rule_network(ip, True), rule_network(ip, False)]:
+            if network is not None:
+                tree = rules.ipv4 if network.version == 4 else rules.ipv6
+                tree.remove(int(network.network_address), network.prefixlen, lambda w: w[1].ip == ip)
+
+        return True
+
+    def _groups(self, client_ip: str) -> list[_GroupRules[T]]:
+        return [rules for group, rules in self.groups.items() if group in ["default", "temp"] or glob_match(client_ip, group)]
+
+    def applies_to(self, client_ip: str) -> bool:
+        return len(self._groups(client_ip)) > 0
+
+    def match(self, client_ip: str, ip: str) -> Optional[T]:
+        return self._match(self._groups(client_ip), ip)
+
+    def match_many(self, client_ip: str, ips: Iterable[str]) -> dict[str, T]:
+        """the client groups are resolved once for every address of the answer"""
+        if len(groups := self._groups(client_ip)) == 0:
+            return dict()
+
+        return {ip: item for ip in dict.fromkeys(ips) if (item := self._match(groups, ip)) is not None}
+
+    @staticmethod
+    def _match(groups: list[_GroupRules[T]], ip: str) -> Optional[T]:
+        try:
+            address = ip_address(ip)
+        except ValueError:
+            address = None
+
+        result: list[tuple[int, T]] = []
+        for rules in groups:
+            if address is not None:
+                result.extend((rules.ipv4 if address.version == 4 else rules.ipv6).lookup(int(address)))
+
+            result.extend(rules.texts.get(ip, []))
+            result.extend((order, x) for order, pattern, x in rules.globs if glob_match(ip, pattern))
+
+        if len(result) == 0:
+            return None
+
+        result.sort(key=lambda x: x[0])
+        items = [x for _, x in result]
+        item = next((x for x in items if x.ip == ip), None)
+        item = item if item is not None else next((x for x in items if x.group not in ["default", "temp"]), None)
+        return item if item is not None else items[0]
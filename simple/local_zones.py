@@ -0,0 +1,142 @@
+import threading
+from typing import Optional, TYPE_CHECKING
+
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+if TYPE_CHECKING:
+    import dns.zone
+
+# cname chains inside the local zones, longer ones are answered as far as they got
+__max_cname_chain__ = 8
+
+
+class LocalZone:
+    """one zone file as a name -> rdtype -> rrset index, with the names that only exist because of their children"""
+
+    def __init__(self, zone: "dns.zone.Zone"):
+        self.origin: dns.name.Name = zone.origin
+        self.nodes: dict[dns.name.Name, dict[int, dns.rrset.RRset]] = dict()
+        # every owner name and its ancestors up to the origin, an empty non-terminal is NODATA and not NXDOMAIN
+        self.names: set[dns.name.Name] = set()
+        self.delegations: set[dns.name.Name] = set()
+        for name, rdataset in zone.iterate_rdatasets():
+            name = name.derelativize(self.origin)
+            rrset = dns.rrset.RRset(name, rdataset.rdclass, rdataset.rdtype)
+            rrset.update(rdataset)
+            self.nodes.setdefault(name, dict())[rdataset.rdtype] = rrset
+            if rdataset.rdtype == dns.rdatatype.NS and name != self.origin:
+                self.delegations.add(name)
+
+            while name != self.origin and name not in self.names:
+                self.names.add(name)
+                name = name.parent()
+
+        self.names.add(self.origin)
+        if (soa := self.nodes.get(self.origin, {}).get(dns.rdatatype.SOA)) is None:
+            raise ValueError(f"{self.origin}: no soa")
+
+        # rfc 2308: the negative ttl is the smaller one of the soa ttl and its minimum
+        self.soa = dns.rrset.RRset(self.origin, soa.rdclass, soa.rdtype)
+        self.soa.update(soa)
+        self.soa.ttl = min(soa.ttl, soa[0].minimum)
+
+    def delegated(self, name: dns.name.Name) -> bool:
+        while name != self.origin:
+            if name in self.delegations:
+                return True
+
+            name = name.parent()
+
+        return False
+
+    def find(self, name: dns.name.Name) -> Optional[dict[int, dns.rrset.RRset]]:
+        """the records of the name, a wildcard below its closest encloser, {} for NODATA, None for NXDOMAIN"""
+        if (node := self.nodes.get(name)) is not None:
+            return node
+
+        if name in self.names:
+            return dict()
+
+        encloser = name.parent()
+        while encloser not in self.names:
+            encloser = encloser.parent()
+
+        if (wildcard := self.nodes.get(dns.name.Name((b"*", *encloser.labels)))) is None:
+            return None
+
+        result = dict()
+        for rdtype, rrset in wildcard.items():
+            result[rdtype] = dns.rrset.RRset(name, rrset.rdclass, rdtype)
+            result[rdtype].update(rrset)
+
+        return result
+
+
+class LocalZones:
+    """zones answered authoritatively from memory, names below a delegation (ns not at the origin) are left to the upstreams"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.zones: dict[dns.name.Name, LocalZone] = dict()
+
+    def set_zones(self, zones: list["dns.zone.Zone"]):
+        local_zones = {x.origin: x for x in (LocalZone(zone) for zone in zones)}
+        with self._lock:
+            self.zones = local_zones
+
+    def zone_of(self, name: dns.name.Name) -> Optional[LocalZone]:
+        zones = self.zones
+        if len(zones) == 0:
+            return None
+
+        origin = name
+        while True:
+            if (zone := zones.get(origin)) is not None:
+                return None if zone.delegated(name) else zone
+
+            if origin == dns.name.root:
+                return None
+
+            origin = origin.parent()
+
+    def answer(self, request_message: dns.message.Message) -> Optional[dns.message.Message]:
+        """
+        the authoritative response, None when the name is not in a local zone. a cname leaving the local zones
+        is the last answer record, the caller can resolve the rest
+        """
+        question: dns.rrset.RRset = request_message.question[0]
+        if (zone := self.zone_of(question.name)) is None:
+            return None
+
+        response_message = dns.message.make_response(request_message)
+        response_message.flags |= dns.flags.AA
+        name = question.name
+        for _ in range(__max_cname_chain__):
+            if (node := zone.find(name)) is None:
+                # NXDOMAIN is about the last name of the chain, so is the soa
+                response_message.set_rcode(dns.rcode.NXDOMAIN)
+                response_message.authority.append(zone.soa)
+                break
+
+            if (rrset := node.get(question.rdtype)) is not None:
+                response_message.answer.append(rrset)
+                break
+
+            if (cname := node.get(dns.rdatatype.CNAME)) is None:
+                response_message.authority.append(zone.soa)
+                break
+
+            response_message.answer.append(cname)
+            name = cname[0].target
+            if (zone := self.zone_of(name)) is None:
+                break
+
+        return response_message
+
+
+local_zones = LocalZones()
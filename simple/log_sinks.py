@@ -0,0 +1,222 @@
+import json
+import logging
+import logging.handlers
+import queue
+import socket
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Optional, Protocol
+
+from simple.binary_log import BinaryRequestLogWriter
+from simple.models import RequestLog, RequestLogsBackend, RequestLogsConfig, RequestLogSinkConfig, RequestLogSinkType
+from simple.request_logs import RequestLogStore
+from simple.rollups import RollupStore
+
+logger = logging.getLogger(__name__)
+
+__batch__ = 500
+
+
+class LogSink(Protocol):
+    """where request logs go, `insert` gets a batch, always from the one thread of its AsyncSink"""
+
+    def insert(self, *request_logs: RequestLog): ...
+
+    def close(self): ...
+
+
+def _json_line(request_log: RequestLog) -> str:
+    return json.dumps(asdict(request_log), ensure_ascii=False, separators=(",", ":"))
+
+
+class JsonLinesSink:
+    """one json per line, `requests.jsonl` is renamed to `requests.jsonl.1` (and so on) once it reaches `max_bytes`"""
+
+    def __init__(self, path: Path, max_bytes: int = 64 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = None
+
+    def _rotate(self):
+        self.close()
+        for i in range(self.backups - 1, 0, -1):
+            if (source := self.path.with_name(f"{self.path.name}.{i}")).is_file():
+                source.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+
+        if self.backups > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+    def insert(self, *request_logs: RequestLog):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+        self._file.write("".join(_json_line(x) + "\n" for x in request_logs))
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SyslogSink:
+    """one syslog message (the json of the log) per request, to the local syslog socket or a syslog server over udp"""
+
+    def __init__(self, address: str | tuple[str, int], facility: str = "user"):
+        self.handler = logging.handlers.SysLogHandler(address, facility=logging.handlers.SysLogHandler.facility_names[facility])
+        self.handler.setFormatter(logging.Formatter("simple-dns: %(message)s"))
+
+    def insert(self, *request_logs: RequestLog):
+        for x in request_logs:
+            self.handler.emit(logging.makeLogRecord({"msg": _json_line(x), "levelno": logging.INFO, "levelname": "INFO"}))
+
+    def close(self):
+        self.handler.close()
+
+
+class StreamSink:
+    """json lines to a collector: one datagram per log over udp, newline separated over tcp (connected again after an error)"""
+
+    def __init__(self, host: str, port: int, tcp: bool = False):
+        self.address = (host, port)
+        self.tcp = tcp
+        self._socket: Optional[socket.socket] = None
+
+    def _connect(self) -> socket.socket:
+        if self._socket is None:
+            if self.tcp:
+                self._socket = socket.create_connection(self.address, timeout=5)
+            else:
+                family = socket.AF_INET6 if ":" in self.address[0] else socket.AF_INET
+                self._socket = socket.socket(family, socket.SOCK_DGRAM)
+
+        return self._socket
+
+    def insert(self, *request_logs: RequestLog):
+        try:
+            connection = self._connect()
+            if self.tcp:
+                connection.sendall("".join(_json_line(x) + "\n" for x in request_logs).encode())
+            else:
+                for x in request_logs:
+                    connection.sendto(_json_line(x).encode(), self.address)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class RollupSink:
+    def __init__(self, store: RollupStore):
+        self.store = store
+
+    def insert(self, *request_logs: RequestLog):
+        self.store.add(request_logs)
+
+    def close(self):
+        self.store.close()
+
+
+class AsyncSink:
+    """
+    a sink behind its own bounded buffer and thread: `put` never waits, a full buffer drops the logs (and counts them),
+    so one slow sink never holds back the others or the request log queue. the sink is made in that thread (sqlite)
+    """
+
+    def __init__(self, name: str, factory: Callable[[], LogSink], buffer: int = 10000):
+        self.name = name
+        self.factory = factory
+        self.buffer: queue.Queue[RequestLog] = queue.Queue(maxsize=buffer)
+        self.dropped = 0
+        self.errors = 0
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"log_sink_{name}", daemon=True)
+
+    def start(self) -> "AsyncSink":
+        self._thread.start()
+        return self
+
+    def put(self, request_logs: list[RequestLog]):
+        for i, x in enumerate(request_logs):
+            try:
+                self.buffer.put_nowait(x)
+            except queue.Full:
+                self.dropped += len(request_logs) - i
+                return
+
+    def _run(self):
+        try:
+            sink = self.factory()
+        except Exception as e:
+            logger.error(f"log sink {self.name}", exc_info=e)
+            return
+
+        try:
+            while True:
+                try:
+                    items = [self.buffer.get(timeout=0.1)]
+                except queue.Empty:
+                    if self._finished.is_set():
+                        break
+
+                    continue
+
+                while len(items) < __batch__:
+                    try:
+                        items.append(self.buffer.get_nowait())
+                    except queue.Empty:
+                        break
+
+                try:
+                    sink.insert(*items)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"log sink {self.name}", exc_info=e)
+        finally:
+            sink.close()
+
+    def close(self):
+        """the buffered logs are written first"""
+        self._finished.set()
+        self._thread.join()
+        if self.dropped > 0:
+            logger.warning(f"log sink {self.name}: {self.dropped} request logs dropped, the buffer was full")
+
+
+def request_log_sinks(config: RequestLogsConfig) -> list[RequestLogSinkConfig]:
+    """the configured sinks, or the one of `backend`"""
+    if len(config.sinks) > 0:
+        return config.sinks
+
+    return [
+        RequestLogSinkConfig(type=RequestLogSinkType.BINARY if config.backend == RequestLogsBackend.BINARY else RequestLogSinkType.SQLITE)
+    ]
+
+
+def sink_factory(config: RequestLogSinkConfig, directory: Path) -> Callable[[], LogSink]:
+    """`directory` is temp/request_logs in the data dir"""
+    if config.type == RequestLogSinkType.SQLITE:
+        return lambda: RequestLogStore(directory)
+    elif config.type == RequestLogSinkType.BINARY:
+        return lambda: BinaryRequestLogWriter(directory)
+    elif config.type == RequestLogSinkType.JSONL:
+        path = directory.joinpath(config.path or "requests.jsonl")
+        return lambda: JsonLinesSink(path, config.max_bytes, config.backups)
+    elif config.type == RequestLogSinkType.SYSLOG:
+        address = (config.address or "/dev/log") if config.port is None else (config.address or "localhost", config.port)
+        return lambda: SyslogSink(address, config.facility)
+    elif config.type in [RequestLogSinkType.UDP, RequestLogSinkType.TCP]:
+        return lambda: StreamSink(config.address, config.port, config.type == RequestLogSinkType.TCP)
+
+    raise ValueError(f"log sink {config.type}")
@@ -0,0 +1,30 @@
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+
+def is_negative(response_message: dns.message.Message) -> bool:
+    """NXDOMAIN, or NODATA: nothing of the question type in the answer (a cname chain may be there)"""
+    if response_message.rcode() == dns.rcode.NXDOMAIN:
+        return True
+
+    if response_message.rcode() != dns.rcode.NOERROR or len(response_message.question) == 0:
+        return False
+
+    rdtype = response_message.question[0].rdtype
+    return not any(x.rdtype == rdtype for x in response_message.answer)
+
+
+def trim_response(response_message: dns.message.Message) -> dns.message.Message:
+    """
+    what a stub resolver uses of an upstream answer: the answer, and the soa of a negative one (it is cached that long).
+    ns records, glue and the rest of the additional section are dropped, the opt record is not part of it
+    """
+    if is_negative(response_message):
+        response_message.authority = [x for x in response_message.authority if x.rdtype == dns.rdatatype.SOA]
+    else:
+        response_message.authority = []
+
+    response_message.additional = []
+    return response_message
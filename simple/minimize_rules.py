@@ -0,0 +1,173 @@
+import re
+import socket
+from dataclasses import replace
+from typing import Callable, Optional
+
+from simple.ip_rules import rule_network
+from simple.models import AllowedIpItem, AllowedNameItem, BlockedIpItem, BlockedNameItem, DnsServerConfig, DnsServerRules
+from simple.subscriptions import is_url
+
+__glob_chars__ = re.compile(r"[*?\[\]]")
+
+NameItem = AllowedNameItem | BlockedNameItem
+IpItem = AllowedIpItem | BlockedIpItem
+# (ip version, network address, prefix length)
+Prefix = tuple[int, int, int]
+
+
+def _ip_prefix(item: IpItem) -> Optional[Prefix]:
+    if not item.use_glob and "/" not in item.ip and "." in item.ip:
+        # most rules of large lists are plain ipv4 addresses, ip_network is 20 times slower
+        try:
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, item.ip), "big"), 32
+        except OSError:
+            pass
+
+    if (network := rule_network(item.ip, item.use_glob)) is None:
+        return None
+
+    return network.version, int(network.network_address), network.prefixlen
+
+
+class _Minimizer:
+    """
+    `broader` of a group is what can stand in for its rules: the prefix rules of the same group and of `default`,
+    of the same kind, and of the allowed kind for a blocked rule, as (prefixes, whether a prefix equal to the rule counts)
+    """
+
+    def __init__(self, config: DnsServerConfig, rules: dict[str, list]):
+        self.config = config
+        self.rules = rules
+        self._fixed: dict[tuple[str, str], bool] = dict()
+
+    def fixed(self, kind: str, group: str) -> bool:
+        """`temp` rules and the rules of urls change at runtime, they never stand in for others"""
+        if (result := self._fixed.get((kind, group))) is None:
+            result = group != "temp" and not any(is_url(x) for x in getattr(self.config.rules, kind).get(group, []))
+            self._fixed[(kind, group)] = result
+
+        return result
+
+    def broader(self, kinds: list[str], group: str, prefixes: dict[str, dict[str, set]]) -> list[tuple[set, bool]]:
+        result = []
+        for kind in kinds:
+            for group2 in dict.fromkeys([group, "default"]):
+                if (x := prefixes[kind].get(group2)) is not None:
+                    result.append((x, kind != kinds[0] or group2 != group))
+
+        return result
+
+    def names(self, kinds: list[str]) -> list[NameItem]:
+        """the rules of kinds[0] no broader rule covers"""
+        prefixes: dict[str, dict[str, set[str]]] = {kind: dict() for kind in kinds}
+        for kind in kinds:
+            for x in self.rules[kind]:
+                # `like` reads `_` and `%` as a pattern, those rules are left out
+                if not x.use_glob and x.name[0] != "=" and "_" not in x.name and "%" not in x.name and self.fixed(kind, x.group):
+                    prefixes[kind].setdefault(x.group, set()).add(x.name)
+
+        broader: dict[str, list[tuple[set, bool]]] = dict()
+        result = []
+        for x in self.rules[kinds[0]]:
+            if (sets := broader.get(x.group)) is None:
+                sets = broader[x.group] = self.broader(kinds, x.group, prefixes)
+
+            if x.group == "temp" or not self._name_covered(x, sets):
+                result.append(x)
+
+        return result
+
+    @staticmethod
+    def _name_covered(item: NameItem, sets: list[tuple[set, bool]]) -> bool:
+        itself: Optional[bool]
+        if item.use_glob:
+            # every name the glob matches ends with what follows its last wildcard, a parent of it covers them
+            name, itself = __glob_chars__.split(item.name)[-1], None
+        elif item.name[0] == "=":
+            name, itself = item.name[1:], True
+        else:
+            name, itself = item.name, False
+
+        for names, equal in sets:
+            # `=example.com` is covered by `example.com` of its own group, `example.com` is not
+            if itself is not None and (itself or equal) and name in names:
+                return True
+
+            i = name.find(".")
+            while i != -1:
+                if name[i + 1 :] in names:
+                    return True
+
+                i = name.find(".", i + 1)
+
+        return False
+
+    def ips(self, kinds: list[str]) -> list[IpItem]:
+        parsed: dict[str, list[tuple[IpItem, Optional[Prefix]]]] = {kind: [(x, _ip_prefix(x)) for x in self.rules[kind]] for kind in kinds}
+        prefixes: dict[str, dict[str, set[Prefix]]] = {kind: dict() for kind in kinds}
+        for kind in kinds:
+            for x, prefix in parsed[kind]:
+                if prefix is not None and self.fixed(kind, x.group):
+                    prefixes[kind].setdefault(x.group, set()).add(prefix)
+
+        broader: dict[str, list[tuple[list[int], set[Prefix], bool]]] = dict()
+        result = []
+        for x, prefix in parsed[kinds[0]]:
+            if (sets := broader.get(x.group)) is None:
+                sets = broader[x.group] = [(sorted({w[2] for w in s}), s, e) for s, e in self.broader(kinds, x.group, prefixes)]
+
+            if x.group == "temp" or prefix is None or not self._ip_covered(prefix, sets):
+                result.append(x)
+
+        return result
+
+    @staticmethod
+    def _ip_covered(prefix: Prefix, sets: list[tuple[list[int], set[Prefix], bool]]) -> bool:
+        version, address, length = prefix
+        bits = 32 if version == 4 else 128
+        for lengths, networks, equal in sets:
+            for length2 in lengths:
+                # the same network in its own group is the rule itself, or another text of it that stays too
+                if length2 > length or (length2 == length and not equal):
+                    break
+
+                if (version, address >> (bits - length2) << (bits - length2), length2) in networks:
+                    return True
+
+        return False
+
+
+def minimize_rules(config: DnsServerConfig, rules: DnsServerRules) -> tuple[DnsServerRules, dict[str, dict[str, int]]]:
+    """
+    drops the rules that can not change an answer: duplicates, and allowed_names / blocked_names / allowed_ips / blocked_ips
+    rules matching nothing a broader rule (a parent name, a cidr) of the same group or of `default` does not match too.
+    a blocked rule under an allowed one never decides either. `temp` rules are kept. kind -> rules, duplicates, subsumed
+    """
+    report: dict[str, dict[str, int]] = dict()
+    result: dict[str, list] = dict()
+    for kind in ["allowed_ips", "allowed_names", "blocked_ips", "blocked_names", "cloaking_rules", "forwarding_rules"]:
+        items = getattr(rules, kind)
+        result[kind] = list(dict.fromkeys(items))
+        report[kind] = {"rules": len(items), "duplicates": len(items) - len(result[kind]), "subsumed": 0}
+
+    minimizer = _Minimizer(config, result)
+    minimized = {
+        "allowed_names": minimizer.names(["allowed_names"]),
+        "blocked_names": minimizer.names(["blocked_names", "allowed_names"]),
+        "allowed_ips": minimizer.ips(["allowed_ips"]),
+        "blocked_ips": minimizer.ips(["blocked_ips", "allowed_ips"]),
+    }
+    for kind, items in minimized.items():
+        report[kind]["subsumed"] = len(result[kind]) - len(items)
+
+    return replace(rules, **{**result, **minimized}), report
+
+
+def minimize_rules_summary(report: dict[str, dict[str, int]]) -> Optional[str]:
+    """one line for the log, None when nothing was dropped"""
+    parts = [
+        f"{kind} {x['duplicates'] + x['subsumed']} of {x['rules']} ({x['subsumed']} subsumed)"
+        for kind, x in report.items()
+        if x["duplicates"] + x["subsumed"] > 0
+    ]
+    return None if len(parts) == 0 else "rules dropped: " + ", ".join(parts)
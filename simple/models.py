@@ -19,6 +19,8 @@ class DnsServerUpstream:
     name: str
     ip: list[IPv4Address | IPv6Address]
     preferred_protocol: Optional[DnsServerUpstreamProtocol] = None
+    port: Optional[int] = None
+    ca_file: Optional[str] = None
     ipv4: list[str] = field(init=False, compare=False)
     ipv6: list[str] = field(init=False, compare=False)
 
@@ -37,12 +39,126 @@ class DnsServerRulesConfig:
     forwarding_rules: dict[str, list[str]] = field(default_factory=dict)
 
 
+class RequestLogsBackend(Enum):
+    SQLITE = "sqlite"
+    BINARY = "binary"
+
+
+@dataclass(kw_only=True, frozen=True)
+class RequestLogPolicyConfig:
+    sample_noerror: float = 1
+    sample_blocked: float = 1
+    slow_ms: Optional[float] = None
+    skip_clients: list[str] = field(default_factory=list)
+    skip_names: list[str] = field(default_factory=list)
+    max_per_second: Optional[int] = None
+
+
+class RequestLogSinkType(Enum):
+    SQLITE = "sqlite"
+    BINARY = "binary"
+    JSONL = "jsonl"
+    SYSLOG = "syslog"
+    UDP = "udp"
+    TCP = "tcp"
+
+
+@dataclass(kw_only=True, frozen=True)
+class RequestLogSinkConfig:
+    type: RequestLogSinkType
+    # request logs waiting for this sink, more are dropped
+    buffer: int = 10000
+    # jsonl: file in temp/request_logs, rotated at max_bytes, backups kept
+    path: Optional[str] = None
+    max_bytes: int = 64 * 1024 * 1024
+    backups: int = 5
+    # syslog: unix socket, or host with port (udp). udp / tcp: host and port of the collector
+    address: Optional[str] = None
+    port: Optional[int] = None
+    facility: str = "user"
+
+
+@dataclass(kw_only=True, frozen=True)
+class RequestLogsConfig:
+    backend: RequestLogsBackend = RequestLogsBackend.SQLITE
+    retention_days: Optional[int] = 30
+    max_rows: Optional[int] = None
+    rollups: bool = True
+    policy: RequestLogPolicyConfig = field(default_factory=RequestLogPolicyConfig)
+    # queries taking at least this long are written with the time of every stage, see simple.slow_queries
+    slow_query_ms: Optional[int] = None
+    # where request logs go, each with its own buffer and thread, none is the one of `backend`
+    sinks: list[RequestLogSinkConfig] = field(default_factory=list)
+
+
+class RateLimitAction(Enum):
+    DROP = "drop"
+    REFUSED = "refused"
+    TRUNCATE = "truncate"
+
+
+class EcsMode(Enum):
+    STRIP = "strip"
+    SUBNET = "subnet"
+
+
+@dataclass(kw_only=True, frozen=True)
+class EcsConfig:
+    # edns client subnet sent upstream: none, or the same subnet (of our egress address) for every client
+    mode: EcsMode = EcsMode.STRIP
+    address: Optional[str] = None
+    ipv4_prefix: int = 24
+    ipv6_prefix: int = 56
+
+
+@dataclass(kw_only=True, frozen=True)
+class SubscriptionsConfig:
+    # rule entries pointing at http(s) urls, downloaded again after this many minutes (a 304 when unchanged)
+    refresh_minutes: int = 1440
+    timeout: int = 30
+
+
+@dataclass(kw_only=True, frozen=True)
+class RateLimitConfig:
+    # queries per second and burst of a client ip / of its subnet, None is no limit
+    client_qps: Optional[float] = None
+    client_burst: Optional[int] = None
+    subnet_qps: Optional[float] = None
+    subnet_burst: Optional[int] = None
+    ipv4_prefix: int = 24
+    ipv6_prefix: int = 56
+    action: RateLimitAction = RateLimitAction.DROP
+    # identical udp responses (same subnet, name, type and rcode) per second, every `slip`th one over is sent truncated
+    responses_per_second: Optional[float] = None
+    slip: int = 2
+    exempt_clients: list[str] = field(default_factory=list)
+
+
+@dataclass(kw_only=True, frozen=True)
+class AdminConfig:
+    host: str = "127.0.0.1"
+    port: Optional[int] = None
+    # sent as `Authorization: Bearer <token>`, required with `port`
+    token: Optional[str] = None
+
+
 @dataclass(kw_only=True, frozen=True)
 class DnsServerConfig:
     ipv6: Optional[bool]
     default: list[str]
     upstream: dict[str, DnsServerUpstream]
     rules: DnsServerRulesConfig = field(default_factory=DnsServerRulesConfig)
+    request_logs: RequestLogsConfig = field(default_factory=RequestLogsConfig)
+    admin: AdminConfig = field(default_factory=AdminConfig)
+    rate_limit: RateLimitConfig = field(default_factory=RateLimitConfig)
+    # zone origin -> rfc 1035 zone files (relative to the data dir) answered authoritatively, see simple.local_zones
+    zones: dict[str, list[str]] = field(default_factory=dict)
+    ecs: EcsConfig = field(default_factory=EcsConfig)
+    # upstream answers without ns / glue / additional records, the soa is kept for negative answers
+    minimal_responses: bool = False
+    # duplicate rules and rules a broader rule already covers are dropped at startup, see simple.minimize_rules
+    minimize_rules: bool = True
+    subscriptions: SubscriptionsConfig = field(default_factory=SubscriptionsConfig)
 
 
 @dataclass(kw_only=True, frozen=True)
@@ -134,6 +250,7 @@ class AppArgs:
     data_dir: Path
     port: int = 53
     service: Optional[ServiceActionType] = None
+    startup_report: bool = False
 
     def __post_init__(self):
         object.__setattr__(self, "data_dir", self.data_dir.resolve())
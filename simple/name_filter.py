@@ -0,0 +1,83 @@
+import math
+import re
+
+from simple.models import AllowedNameItem, BlockedNameItem
+from simple.sqlite_glob import glob_match
+
+
+class BloomFilter:
+    """
+    a plain bloom filter with double hashing over the builtin (per process) str hash,
+    16 bits per key and 11 probes is about 0.05% false positives, a miss usually stops at the first probe
+    """
+
+    def __init__(self, capacity: int, bits_per_key: int = 16):
+        self.size = max(64, capacity * bits_per_key)
+        self.hashes = max(1, round(bits_per_key * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key: str):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        for i in range(self.hashes):
+            x = (h1 + i * h2) % self.size
+            self.bits[x >> 3] |= 1 << (x & 7)
+
+    def __contains__(self, key: str) -> bool:
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        bits, size = self.bits, self.size
+        for i in range(self.hashes):
+            x = (h1 + i * h2) % size
+            if not bits[x >> 3] & (1 << (x & 7)):
+                return False
+
+        return True
+
+
+class NameFilter:
+    """
+    answers "no rule can match" for allowed_names / blocked_names before the sql lookup, most names match no rule at all.
+    the keys of exact and prefix rules go into a bloom filter, a name passes when one of its label suffixes is there
+    (a false positive only costs the lookup it would have had anyway). globs are checked one by one,
+    like the sql does, and so are the rules that `like` would read as a pattern (`_`, `%`).
+    groups are ignored, a rule of any client passes the name
+    """
+
+    def __init__(self, items: list[AllowedNameItem] | list[BlockedNameItem]):
+        self.bloom = BloomFilter(len(items))
+        self.globs: list[str] = []
+        self.patterns: list[re.Pattern] = []
+        for x in items:
+            self.add(x)
+
+    def add(self, item: AllowedNameItem | BlockedNameItem):
+        """rules removed at runtime stay in, a false positive is harmless"""
+        name = item.name
+        if item.use_glob:
+            self.globs = [*self.globs, name]
+        elif name.startswith("="):
+            self.bloom.add(name[1:])
+        elif "_" in name or "%" in name:
+            # "name" = :name or :name like '%.' || "name"
+            like = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in name)
+            self.patterns = [*self.patterns, re.compile(f"(?:.*\\.)?{like}", re.IGNORECASE | re.DOTALL)]
+        else:
+            self.bloom.add(name)
+
+    def may_match(self, name: str) -> bool:
+        name = name.lower()
+        if name in self.bloom:
+            return True
+
+        i = name.find(".")
+        while i != -1:
+            if name[i + 1 :] in self.bloom:
+                return True
+
+            i = name.find(".", i + 1)
+
+        if any(glob_match(name, x) or glob_match(name, "*." + x) for x in self.globs):
+            return True
+
+        return any(x.fullmatch(name) for x in self.patterns)
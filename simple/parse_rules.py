@@ -1,5 +1,5 @@
 import logging
-from ipaddress import ip_address, IPv4Address
+from ipaddress import ip_address, ip_network, IPv4Address
 from typing import Optional
 
 from simple.models import (
@@ -37,8 +37,23 @@ def _parse_line_2(text: str) -> list[str]:
     return [x.lower() for x in lines if x.find(" ") == -1]
 
 
+def _parse_ips(group: str, text: str) -> list[str]:
+    result = []
+    for x in _parse_line_2(text):
+        if x.find("/") != -1:
+            try:
+                x = str(ip_network(x, strict=False))
+            except ValueError:
+                logger.warning(f"parse_ips {group}, line ignored: {x}")
+                continue
+
+        result.append(x)
+
+    return result
+
+
 def parse_allowed_ips(group: str, text: str) -> list[AllowedIpItem]:
-    return [AllowedIpItem(group=group, ip=x, use_glob=_should_use_glob(x)) for x in _parse_line_2(text)]
+    return [AllowedIpItem(group=group, ip=x, use_glob=_should_use_glob(x)) for x in _parse_ips(group, text)]
 
 
 def parse_allowed_names(group: str, text: str) -> list[AllowedNameItem]:
@@ -46,7 +61,7 @@ def parse_allowed_names(group: str, text: str) -> list[AllowedNameItem]:
 
 
 def parse_blocked_ips(group: str, text: str) -> list[BlockedIpItem]:
-    return [BlockedIpItem(group=group, ip=x, use_glob=_should_use_glob(x)) for x in _parse_line_2(text)]
+    return [BlockedIpItem(group=group, ip=x, use_glob=_should_use_glob(x)) for x in _parse_ips(group, text)]
 
 
 def parse_blocked_names(group: str, text: str) -> list[BlockedNameItem]:
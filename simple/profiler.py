@@ -0,0 +1,156 @@
+import cProfile
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Optional
+
+# collapsed stacks ("root;caller;callee count" per line) are what flamegraph.pl, speedscope and inferno read
+
+
+def _frame_label(code: CodeType) -> str:
+    path = Path(code.co_filename)
+    return f"{code.co_name} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+
+
+def _collapse(frame: Optional[FrameType]) -> tuple[list[str], bool]:
+    labels = []
+    is_request = False
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        # socketserver.ThreadingMixIn, every dns request runs in one of those
+        is_request = is_request or frame.f_code.co_name == "process_request_thread"
+        frame = frame.f_back
+
+    labels.reverse()
+    return labels, is_request
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, all_threads: bool = False) -> Counter[str]:
+    """sample the stacks of the request threads (or every thread) until `seconds` have passed"""
+    stacks: Counter[str] = Counter()
+    ignored = {threading.get_ident()}
+    names = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in ignored:
+                continue
+
+            labels, is_request = _collapse(frame)
+            if not is_request and not all_threads:
+                continue
+
+            if (name := names.get(thread_id)) is None:
+                thread = next((x for x in threading.enumerate() if x.ident == thread_id), None)
+                name = names[thread_id] = "request" if is_request else (thread.name if thread is not None else str(thread_id))
+
+            stacks[";".join([name, *labels])] += 1
+
+        time.sleep(interval)
+
+    return stacks
+
+
+def write_collapsed(stacks: Counter[str], path: Path):
+    path.parent.mkdir(exist_ok=True, parents=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def profile_file(directory: Path, kind: str, suffix: str) -> Path:
+    return directory.joinpath(f"{kind}-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}{suffix}")
+
+
+class RequestProfiler:
+    """
+    cProfile on a share of the requests for a while, one request at a time (cProfile is global since python 3.12),
+    `maybe_start` is a single attribute check while disabled
+    """
+
+    def __init__(self):
+        self.fraction = 0.0
+        self._until = 0.0
+        self._busy = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats: Optional[pstats.Stats] = None
+        self.requests = 0
+
+    def enable(self, seconds: float, fraction: float):
+        if not 0 < fraction <= 1:
+            raise ValueError(f"fraction: {fraction} should be between 0 and 1")
+
+        with self._stats_lock:
+            self._stats = None
+            self.requests = 0
+
+        self._until = time.monotonic() + seconds
+        self.fraction = fraction
+
+    def disable(self) -> Optional[pstats.Stats]:
+        self.fraction = 0.0
+        # a request still being profiled finishes into the stats
+        with self._busy, self._stats_lock:
+            stats, self._stats = self._stats, None
+            return stats
+
+    def maybe_start(self) -> Optional[cProfile.Profile]:
+        if self.fraction == 0.0:
+            return None
+
+        if time.monotonic() > self._until or random.random() >= self.fraction or not self._busy.acquire(blocking=False):
+            return None
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler (a debugger, a coverage tool) is active
+            self._busy.release()
+            return None
+
+        return profile
+
+    def finish(self, profile: cProfile.Profile):
+        profile.disable()
+        try:
+            with self._stats_lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+                self.requests += 1
+        finally:
+            self._busy.release()
+
+
+request_profiler = RequestProfiler()
+
+
+def profile_requests(directory: Path, seconds: float, fraction: float) -> dict:
+    """cProfile a share of the requests for `seconds`, write a .pstats file (snakeviz, pstats, flameprof)"""
+    request_profiler.enable(seconds, fraction)
+    time.sleep(seconds)
+    stats = request_profiler.disable()
+    if stats is None:
+        return {"requests": 0, "file": None}
+
+    path = profile_file(directory, "requests", ".pstats")
+    path.parent.mkdir(exist_ok=True, parents=True)
+    stats.dump_stats(path)
+    return {"requests": request_profiler.requests, "file": str(path)}
+
+
+def profile_stacks(directory: Path, seconds: float, interval: float, all_threads: bool) -> dict:
+    """sample stacks for `seconds`, write a collapsed stacks .folded file"""
+    stacks = sample_stacks(seconds, interval, all_threads)
+    path = profile_file(directory, "stacks", ".folded")
+    write_collapsed(stacks, path)
+    return {"samples": sum(stacks.values()), "file": str(path)}
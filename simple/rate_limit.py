@@ -0,0 +1,175 @@
+import struct
+import threading
+import time
+from collections import Counter
+from ipaddress import ip_address
+from typing import Hashable, Optional
+
+from simple.models import RateLimitAction, RateLimitConfig
+from simple.sqlite_glob import glob_match
+
+# tc / rcode refused on a header copied from the query or the response, the question is kept, nothing else
+__flag_qr__ = 0x8000
+__flag_tc__ = 0x0200
+__rcode_refused__ = 5
+
+
+def minimal_response(data: bytes, truncated: bool = False, refused: bool = False) -> Optional[bytes]:
+    """
+    a response made from the raw query (or response) without parsing it: same id, opcode, rd and question,
+    none for something that is not a dns message with one question
+    """
+    if len(data) < 12 or struct.unpack("!H", data[4:6])[0] != 1:
+        return None
+
+    offset = 12
+    while offset < len(data):
+        length = data[offset]
+        if length == 0:
+            offset += 1
+            break
+
+        if length >= 0xC0:
+            offset += 2
+            break
+
+        offset += length + 1
+    else:
+        return None
+
+    if (end := offset + 4) > len(data):
+        return None
+
+    flags = struct.unpack("!H", data[2:4])[0]
+    flags = (flags & 0x7900) | __flag_qr__ | (__flag_tc__ if truncated else 0) | (__rcode_refused__ if refused else 0)
+    return data[:2] + struct.pack("!HHHHH", flags, 1, 0, 0, 0) + data[12:end]
+
+
+class TokenBuckets:
+    """one token bucket per key, refilled when taken from, full buckets are forgotten once there are too many keys"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: dict[Hashable, list[float]] = dict()
+        self._lock = threading.Lock()
+
+    def take(self, key: Hashable, now: float) -> bool:
+        with self._lock:
+            if (bucket := self._buckets.get(key)) is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._forget(now)
+
+                bucket = self._buckets[key] = [float(self.burst), now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] < 1:
+                return False
+
+            bucket[0] -= 1
+            return True
+
+    def _forget(self, now: float):
+        self._buckets = {k: v for k, v in self._buckets.items() if v[0] + (now - v[1]) * self.rate < self.burst}
+        if len(self._buckets) >= self.max_keys:
+            # spoofed sources, forget everything rather than grow without end
+            self._buckets = dict()
+
+
+class RateLimiter:
+    """
+    per client ip and per subnet token buckets, checked by the servers before a request thread is started,
+    and response rate limiting (rrl) of identical udp responses. both off until configured
+    """
+
+    def __init__(self):
+        self.config = RateLimitConfig()
+        self.clients: Optional[TokenBuckets] = None
+        self.subnets: Optional[TokenBuckets] = None
+        self.responses: Optional[TokenBuckets] = None
+        self._slip = 0
+        # not locked, close enough for a report
+        self.counters = {"client_limited": 0, "subnet_limited": 0, "responses_dropped": 0, "responses_truncated": 0}
+        self.limited_clients: Counter[str] = Counter()
+
+    def configure(self, config: RateLimitConfig):
+        def buckets(rate: Optional[float], burst: Optional[int]) -> Optional[TokenBuckets]:
+            return None if rate is None else TokenBuckets(rate, burst if burst is not None else max(1, int(rate * 2)))
+
+        self.config = config
+        self.clients = buckets(config.client_qps, config.client_burst)
+        self.subnets = buckets(config.subnet_qps, config.subnet_burst)
+        self.responses = buckets(config.responses_per_second, None)
+        self.counters = {k: 0 for k in self.counters}
+        self.limited_clients = Counter()
+
+    @property
+    def limits_queries(self) -> bool:
+        return self.clients is not None or self.subnets is not None
+
+    def _subnet(self, client_ip: str) -> Optional[int]:
+        try:
+            address = ip_address(client_ip)
+        except ValueError:
+            return None
+
+        prefix, bits = (self.config.ipv4_prefix, 32) if address.version == 4 else (self.config.ipv6_prefix, 128)
+        return (int(address) >> (bits - prefix)) << 1 | (address.version == 6)
+
+    def _exempt(self, client_ip: str) -> bool:
+        return any(glob_match(client_ip, x) for x in self.config.exempt_clients)
+
+    def _limited(self, client_ip: str, counter: str) -> bool:
+        self.counters[counter] += 1
+        if len(self.limited_clients) >= 10_000:
+            self.limited_clients = Counter(dict(self.limited_clients.most_common(1000)))
+
+        self.limited_clients[client_ip] += 1
+        return False
+
+    def allow_query(self, client_ip: str) -> bool:
+        if not self.limits_queries or self._exempt(client_ip):
+            return True
+
+        now = time.monotonic()
+        if self.clients is not None and not self.clients.take(client_ip, now):
+            return self._limited(client_ip, "client_limited")
+
+        if self.subnets is not None and not self.subnets.take(self._subnet(client_ip), now):
+            return self._limited(client_ip, "subnet_limited")
+
+        return True
+
+    def limited_response(self, query: bytes) -> Optional[bytes]:
+        """what an over the limit query gets, None is nothing"""
+        if self.config.action == RateLimitAction.DROP:
+            return None
+
+        return minimal_response(
+            query, truncated=self.config.action == RateLimitAction.TRUNCATE, refused=self.config.action == RateLimitAction.REFUSED
+        )
+
+    def allow_response(self, client_ip: str, name: str, rdtype: int, rcode: int) -> Optional[bool]:
+        """True sends the response, False drops it, None sends it truncated (the client can retry over tcp)"""
+        if self.responses is None or self._exempt(client_ip):
+            return True
+
+        if self.responses.take((self._subnet(client_ip), name.lower(), rdtype, rcode), time.monotonic()):
+            return True
+
+        self._slip += 1
+        if self.config.slip > 0 and self._slip % self.config.slip == 0:
+            self.counters["responses_truncated"] += 1
+            return None
+
+        self.counters["responses_dropped"] += 1
+        return False
+
+    def report(self) -> dict:
+        return {**self.counters, "top_limited_clients": dict(self.limited_clients.most_common(20))}
+
+
+rate_limiter = RateLimiter()
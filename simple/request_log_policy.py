@@ -0,0 +1,111 @@
+import json
+import random
+import threading
+import time
+from typing import Optional
+
+from simple.models import RequestLogPolicyConfig
+from simple.sqlite_glob import glob_match
+
+
+def ip_rules_error(allowed: list[str], blocked: list[str]) -> str:
+    """the `error` of a request log whose answer had addresses matched by allowed_ips / blocked_ips"""
+    return json.dumps({"allowed": allowed, "blocked": blocked}, sort_keys=True, ensure_ascii=False)
+
+
+def ip_rules_blocked(error: Optional[str]) -> bool:
+    """whether a logged answer had addresses removed by blocked_ips, for the logs already written (see `ip_rules_error`)"""
+    if error is None or not error.startswith("{"):
+        return False
+
+    try:
+        o = json.loads(error)
+    except ValueError:
+        return False
+
+    return isinstance(o, dict) and len(o.get("blocked") or []) > 0
+
+
+def request_log_outcome(response_status: Optional[str], server: Optional[str], blocked_ips: bool) -> str:
+    """
+    noerror / blocked / error, blocked is refused by blocked_names (no upstream asked)
+    or an answer with addresses removed by blocked_ips (see `DnsRequestHandler._blocked_ips`)
+    """
+    if response_status is None or response_status == "SERVFAIL":
+        return "error"
+
+    if (server is None and response_status == "REFUSED") or blocked_ips:
+        return "blocked"
+
+    return "noerror"
+
+
+class _NameMatcher:
+    """rule file syntax: example.com and its sub domains, =example.com only, or a glob pattern"""
+
+    def __init__(self, rules: list[str]):
+        self.exact = {x[1:] for x in rules if x.startswith("=")}
+        self.suffixes = {x for x in rules if not x.startswith("=") and not any(c in x for c in "*?[")}
+        self.globs = [x for x in rules if not x.startswith("=") and any(c in x for c in "*?[")]
+
+    def __bool__(self):
+        return len(self.exact) > 0 or len(self.suffixes) > 0 or len(self.globs) > 0
+
+    def match(self, name: str) -> bool:
+        name = name.lower()
+        if name in self.exact or name in self.suffixes:
+            return True
+
+        if len(self.suffixes) > 0:
+            labels = name.split(".")
+            if any(".".join(labels[i:]) in self.suffixes for i in range(1, len(labels))):
+                return True
+
+        return any(glob_match(name, x) or glob_match(name, "*." + x) for x in self.globs)
+
+
+class RequestLogPolicy:
+    """
+    decides whether a query is logged before its RequestLog is made.
+    errors and slow queries are always logged: no skip_clients / skip_names, no sampling, and max_per_second
+    (what keeps the writer ahead of the queue) neither counts nor drops them, an upstream outage is all errors
+    """
+
+    def __init__(self, config: RequestLogPolicyConfig):
+        self.config = config
+        self.sample = {"noerror": config.sample_noerror, "blocked": config.sample_blocked}
+        self.skip_names = _NameMatcher(config.skip_names)
+        self._lock = threading.Lock()
+        self._second = 0
+        self._count = 0
+        # not locked, close enough for a report
+        self.dropped = {"skipped": 0, "sampled": 0, "capped": 0}
+
+    def should_log(
+        self, client_ip: str, name: str, response_status: Optional[str], server: Optional[str], ms: float, blocked_ips: bool
+    ) -> bool:
+        outcome = request_log_outcome(response_status, server, blocked_ips)
+        if outcome == "error" or (self.config.slow_ms is not None and ms >= self.config.slow_ms):
+            return True
+
+        if any(glob_match(client_ip, x) for x in self.config.skip_clients) or (self.skip_names and self.skip_names.match(name)):
+            self.dropped["skipped"] += 1
+            return False
+
+        if (rate := self.sample[outcome]) < 1 and random.random() >= rate:
+            self.dropped["sampled"] += 1
+            return False
+
+        if self.config.max_per_second is not None:
+            with self._lock:
+                if (second := int(time.monotonic())) != self._second:
+                    self._second = second
+                    self._count = 0
+
+                if self._count >= self.config.max_per_second:
+                    self.dropped["capped"] += 1
+                    return False
+
+                self._count += 1
+
+        return True
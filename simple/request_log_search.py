@@ -0,0 +1,214 @@
+import argparse
+import json
+import re
+import sys
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from simple.binary_log import read_segment, segment_files
+from simple.models import RequestLog
+from simple.request_logs import created_epoch, RequestLogStore, reversed_name
+from simple.sqlite_glob import glob_match
+
+__relative_pattern__ = re.compile(r"^(\d+)([smhd])$")
+__relative_units__ = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@dataclass(kw_only=True, frozen=True)
+class RequestLogQuery:
+    """
+    `since` inclusive and `until` exclusive, epoch seconds.
+    `name` is an exact name, `*.example.com` for the sub domains of example.com, or any other glob pattern (not indexed)
+    """
+
+    since: Optional[int] = None
+    until: Optional[int] = None
+    client_ip: Optional[str] = None
+    name: Optional[str] = None
+    question_type: Optional[str] = None
+    response_status: Optional[str] = None
+    server: Optional[str] = None
+
+
+def parse_time(value: str, now: Optional[int] = None) -> int:
+    """2h / 30m / 7d ago, or yyyy-mm-dd [hh:mm:ss] in utc"""
+    if (m := __relative_pattern__.match(value)) is not None:
+        now = int(datetime.now(timezone.utc).timestamp()) if now is None else now
+        return now - int(m.group(1)) * __relative_units__[m.group(2)]
+
+    for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]:
+        try:
+            return int(datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            pass
+
+    raise ValueError(f"time: {value} should be like 2h / 30m / 7d or yyyy-mm-dd hh:mm:ss")
+
+
+def _day(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _name_filter(name: str) -> tuple[str, dict]:
+    name = name.lower().rstrip(".")
+    if not any(x in name for x in "*?["):
+        return """ "reversed_name" = :reversed_name """, {"reversed_name": reversed_name(name)}
+
+    if name.startswith("*.") and not any(x in name[2:] for x in "*?["):
+        # "." + 1 == "/", every reversed sub domain sorts in between
+        prefix = reversed_name(name[2:]) + "."
+        return """ "reversed_name" > :name_from and "reversed_name" < :name_to """, {"name_from": prefix, "name_to": prefix[:-1] + "/"}
+
+    return """ lower("name") glob :name """, {"name": name}
+
+
+def _sqlite_rows(
+    store: RequestLogStore, day: str, query: RequestLogQuery, after: Optional[tuple[int, int]]
+) -> Iterator[tuple[str, RequestLog]]:
+    where = []
+    parameters: dict = dict()
+    if query.since is not None:
+        where.append(""" "created_epoch" >= :since """)
+        parameters["since"] = query.since
+
+    if query.until is not None:
+        where.append(""" "created_epoch" < :until """)
+        parameters["until"] = query.until
+
+    if query.name is not None:
+        sql, values = _name_filter(query.name)
+        where.append(sql)
+        parameters.update(values)
+
+    for key in ["client_ip", "question_type", "response_status", "server"]:
+        if (value := getattr(query, key)) is not None:
+            where.append(f""" "{key}" = :{key} """)
+            parameters[key] = value
+
+    if after is not None:
+        where.append(""" ("created_epoch", "id") > (:after_epoch, :after_id) """)
+        parameters.update({"after_epoch": after[0], "after_id": after[1]})
+
+    sql = f"""
+        select "id", "created_epoch", "request_id", "client_ip", "name", "cname", "question_type", "response_status", "server", "ms", "error", "created"
+          from request_logs
+         where {" and ".join(where) if len(where) > 0 else "1"}
+         order by "created_epoch", "id"
+    """
+    db = store.connect(day, readonly=True)
+    try:
+        columns = [x[1] for x in db.execute(""" pragma table_info("request_logs") """).fetchall()]
+        if "created_epoch" not in columns:
+            # a partition written before the indexes, add them once
+            db.close()
+            db = store.connect(day)
+            store.init_partition(db)
+
+        for row in db.execute(sql, parameters):
+            o = dict(row)
+            cursor = f"{day}:s:{o.pop('created_epoch')}:{o.pop('id')}"
+            yield cursor, RequestLog(**o)
+    finally:
+        db.close()
+
+
+def _binary_predicate(query: RequestLogQuery) -> Callable[[RequestLog], bool]:
+    """the same rows as the sql of `_name_filter` and `_sqlite_rows`"""
+    name, name_pattern = None, None
+    if query.name is not None:
+        name = query.name.lower().rstrip(".")
+        # the sub domains are an index range of the reversed names there, at least one label before the dot
+        if name.startswith("*.") and not any(x in name[2:] for x in "*?["):
+            name_pattern = re.compile(r"^.+\.{}$".format(re.escape(name[2:])))
+
+    def predicate(x: RequestLog) -> bool:
+        epoch = created_epoch(x.created)
+        return (
+            (query.since is None or epoch >= query.since)
+            and (query.until is None or epoch < query.until)
+            and (query.client_ip is None or x.client_ip == query.client_ip)
+            and (query.question_type is None or x.question_type == query.question_type)
+            and (query.response_status is None or x.response_status == query.response_status)
+            and (query.server is None or x.server == query.server)
+            and (
+                name is None
+                or (glob_match(x.name.lower(), name) if name_pattern is None else name_pattern.match(x.name.lower()) is not None)
+            )
+        )
+
+    return predicate
+
+
+def _binary_rows(directory: Path, day: str, query: RequestLogQuery, after: Optional[int]) -> Iterator[tuple[str, RequestLog]]:
+    predicate = _binary_predicate(query)
+    seq = 0
+    for _, path in segment_files(directory, day):
+        for x in read_segment(path):
+            seq += 1
+            if (after is None or seq > after) and predicate(x):
+                yield f"{day}:b:0:{seq}", x
+
+
+def search_request_logs(
+    query: RequestLogQuery, directory: Optional[Path] = None, cursor: Optional[str] = None
+) -> Iterator[tuple[str, RequestLog]]:
+    """
+    (cursor, request log) oldest first, pass the cursor of the last item to continue after it.
+    sqlite partitions use the indexes, binary log segments of the same days are scanned after them
+    """
+    store = RequestLogStore(directory)
+    after_day, after_source, after_epoch, after_id = (None, None, 0, 0) if cursor is None else cursor.split(":")
+    first_day = None if query.since is None else _day(query.since)
+    last_day = None if query.until is None else _day(query.until - 1)
+    for day in store.days():
+        if (first_day is not None and day < first_day) or (last_day is not None and day > last_day):
+            continue
+
+        if after_day is not None and day < after_day:
+            continue
+
+        resume = after_day == day
+        if not (resume and after_source == "b") and store.partition_file(day).is_file():
+            yield from _sqlite_rows(store, day, query, (int(after_epoch), int(after_id)) if resume else None)
+
+        yield from _binary_rows(store.directory, day, query, int(after_id) if resume and after_source == "b" else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simple.request_log_search", description="search the request logs, one json per line")
+    parser.add_argument("--data-dir", type=Path, help="directory for config files and temp files. default: data")
+    parser.add_argument("--since", type=str, default="1d", help="2h / 30m / 7d ago, or yyyy-mm-dd [hh:mm:ss] utc, default: 1d")
+    parser.add_argument("--until", type=str, help="same format as --since, default: now")
+    parser.add_argument("--client-ip", type=str)
+    parser.add_argument("--name", type=str, help="example.com, *.example.com for its sub domains, or a glob pattern")
+    parser.add_argument("--question-type", type=str)
+    parser.add_argument("--response-status", type=str)
+    parser.add_argument("--server", type=str)
+    parser.add_argument("--limit", type=int, default=100, help="page size, default: 100, 0 for everything")
+    parser.add_argument("--cursor", type=str, help="continue after this cursor, printed at the end of a full page")
+    args, _ = parser.parse_known_args()
+
+    query = RequestLogQuery(
+        since=parse_time(args.since),
+        until=None if args.until is None else parse_time(args.until),
+        client_ip=args.client_ip,
+        name=args.name,
+        question_type=args.question_type,
+        response_status=args.response_status,
+        server=args.server,
+    )
+    count = 0
+    for cursor, x in search_request_logs(query, cursor=args.cursor):
+        print(json.dumps(asdict(x), ensure_ascii=False))
+        count += 1
+        if count == args.limit:
+            print(f"next page: --cursor {cursor}", file=sys.stderr)
+            break
+
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import logging
+import re
+import sqlite3
+from dataclasses import asdict
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from simple.app_args import app_args
+from simple.binary_log import segment_files, segment_record_count
+from simple.models import RequestLog, RequestLogsConfig
+
+logger = logging.getLogger(__name__)
+
+__partition_pattern__ = re.compile(r"^(\d{4}-\d{2}-\d{2})\.sqlite3$")
+
+
+def reversed_name(name: str) -> str:
+    """www.example.com -> moc.elpmaxe.www, so *.example.com is the index range of the prefix moc.elpmaxe."""
+    return name.lower()[::-1]
+
+
+@lru_cache(maxsize=256)
+def created_epoch(created: str) -> int:
+    return int(datetime.strptime(created, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+
+
+class RequestLogStore:
+    """
+    request logs are partitioned by (utc) day, one sqlite file per day (or binary log segments, see `simple.binary_log`),
+    so dropping a day is deleting files, and it never touches the file the writer is appending to
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = app_args.data_dir.joinpath("temp", "request_logs") if directory is None else directory
+        self._day: Optional[str] = None
+        self._db: Optional[sqlite3.Connection] = None
+
+    def partition_file(self, day: str) -> Path:
+        return self.directory.joinpath(f"{day}.sqlite3")
+
+    def partitions(self) -> list[tuple[str, Path]]:
+        if not self.directory.is_dir():
+            return []
+
+        result = []
+        for w in self.directory.iterdir():
+            if (m := __partition_pattern__.match(w.name)) is not None and w.is_file():
+                result.append((m.group(1), w))
+
+        result.sort()
+        return result
+
+    def days(self) -> list[str]:
+        """days having a sqlite partition or binary log segments"""
+        return sorted({day for day, _ in self.partitions()} | {day for day, _ in segment_files(self.directory)})
+
+    def connect(self, day: str, readonly: bool = False) -> sqlite3.Connection:
+        connection_str = "file:{}?mode={}".format(self.partition_file(day), "ro" if readonly else "rwc")
+        db = sqlite3.connect(connection_str, uri=True, timeout=1)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @staticmethod
+    def init_partition(db: sqlite3.Connection):
+        """
+        `created_epoch` and `reversed_name` back the indexes used by `simple.request_log_search`,
+        the (implicit) id at the end of every index keeps the paging order without a sort
+        """
+        db.create_function("reversed_name", 1, reversed_name, deterministic=True)
+        db.create_function("created_epoch", 1, created_epoch, deterministic=True)
+        user_version = db.execute("pragma user_version").fetchone()[0]
+        sql = """
+            pragma journal_mode=wal;
+
+            create table if not exists request_logs
+            (
+                "id"              integer primary key autoincrement,
+                "request_id"      text not null,
+                "client_ip"       text not null,
+                "name"            text not null,
+                "cname"           text null,
+                "question_type"   text not null,
+                "response_status" text null,
+                "server"          text null,
+                "ms"              real not null,
+                "error"           text null,
+                "created"         text not null default current_timestamp
+            );
+        """
+        db.executescript(sql)
+        if user_version < 1:
+            columns = [x[1] for x in db.execute(""" pragma table_info("request_logs") """).fetchall()]
+            if "created_epoch" not in columns:
+                sql = """
+                    alter table request_logs add column "created_epoch" integer null;
+                    alter table request_logs add column "reversed_name" text null;
+                    update request_logs set "created_epoch" = created_epoch("created"), "reversed_name" = reversed_name("name");
+                """
+                db.executescript(sql)
+
+            sql = """
+                create index if not exists "request_logs_created_epoch" on request_logs ("created_epoch");
+                create index if not exists "request_logs_client_ip" on request_logs ("client_ip", "created_epoch");
+                create index if not exists "request_logs_reversed_name" on request_logs ("reversed_name", "created_epoch");
+                pragma user_version = 1;
+            """
+            db.executescript(sql)
+
+        db.commit()
+
+    def _writer(self, day: str) -> sqlite3.Connection:
+        if self._day != day or self._db is None:
+            self.close()
+            self.directory.mkdir(exist_ok=True, parents=True)
+            self._db = self.connect(day)
+            self.init_partition(self._db)
+            self._day = day
+
+        return self._db
+
+    def insert(self, *request_logs: RequestLog):
+        # sqlite3.OperationalError: database is locked
+        sql = """
+            insert into request_logs
+                        ("request_id", "client_ip", "name", "cname", "response_status", "question_type", "server", "ms", "error", "created",
+                         "created_epoch", "reversed_name")
+                 values (:request_id, :client_ip, :name, :cname, :response_status, :question_type, :server, :ms, :error, :created,
+                         :created_epoch, :reversed_name)
+        """
+        by_day: dict[str, list[RequestLog]] = dict()
+        for x in request_logs:
+            by_day.setdefault(x.created[:10], []).append(x)
+
+        for day, value in by_day.items():
+            db = self._writer(day)
+            db.executemany(
+                sql, [asdict(x) | {"created_epoch": created_epoch(x.created), "reversed_name": reversed_name(x.name)} for x in value]
+            )
+            db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+
+        self._db = None
+        self._day = None
+
+    def rows(self, day: str) -> int:
+        segments = sum(segment_record_count(path) for _, path in segment_files(self.directory, day))
+        if not self.partition_file(day).is_file():
+            return segments
+
+        # ids are never deleted within a partition
+        db = self.connect(day, readonly=True)
+        try:
+            row = db.execute(""" select coalesce(max(id) - min(id) + 1, 0) as "rows" from request_logs """).fetchone()
+            return row["rows"] + segments
+        except sqlite3.OperationalError:
+            return segments
+        finally:
+            db.close()
+
+    def drop(self, day: str) -> bool:
+        try:
+            for w in ["", "-wal", "-shm"]:
+                Path(f"{self.partition_file(day)}{w}").unlink(missing_ok=True)
+
+            for _, path in segment_files(self.directory, day):
+                path.unlink(missing_ok=True)
+        except OSError as e:
+            # still opened by some reader on windows, next round then
+            logger.warning(f"request_logs: can not drop {day}: {e}")
+            return False
+
+        return True
+
+    def prune(self, config: RequestLogsConfig, today: Optional[date] = None) -> list[str]:
+        """drop whole days older than `retention_days`, then the oldest days while there are more than `max_rows` rows"""
+        today = datetime.now(timezone.utc).date() if today is None else today
+        today_str = today.isoformat()
+        partitions = [day for day in self.days() if day < today_str]
+        dropped = []
+
+        if config.retention_days is not None:
+            cutoff = (today - timedelta(days=config.retention_days - 1)).isoformat()
+            for day in [x for x in partitions if x < cutoff]:
+                if self.drop(day):
+                    dropped.append(day)
+
+            partitions = [x for x in partitions if x >= cutoff]
+
+        if config.max_rows is not None:
+            total = self.rows(today_str)
+            rows = {day: self.rows(day) for day in partitions}
+            total += sum(rows.values())
+            for day in partitions:
+                if total <= config.max_rows:
+                    break
+
+                if self.drop(day):
+                    dropped.append(day)
+                    total -= rows[day]
+
+        return dropped
@@ -0,0 +1,307 @@
+import argparse
+import json
+import math
+import sqlite3
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from simple.models import RequestLog, RequestLogsConfig
+from simple.request_log_policy import ip_rules_blocked, request_log_outcome
+from simple.request_logs import created_epoch, RequestLogStore
+
+__periods__ = (60, 3600)
+__dimensions__ = ("name", "client_ip", "response_status", "server")
+__minute_rollup_days__ = 2
+# how long a request may go on to the next upstream of `default` after one gave no answer
+__next_upstream_seconds__ = 60
+
+
+class LatencySketch:
+    """
+    log-scale histogram, every bin is `gamma` times wider than the previous one,
+    quantiles come back within (gamma - 1) / 2 relative error and sketches merge by adding bins
+    """
+
+    gamma = 1.1
+    min_ms = 0.01
+
+    def __init__(self, bins: Optional[dict[int, int]] = None):
+        self.bins: dict[int, int] = dict() if bins is None else bins
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def add(self, ms: float, count: int = 1):
+        index = 0 if ms <= self.min_ms else math.ceil(math.log(ms / self.min_ms, self.gamma))
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other: "LatencySketch") -> "LatencySketch":
+        for k, v in other.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + v
+
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        if (total := self.count) == 0:
+            return None
+
+        rank = q * (total - 1)
+        seen = 0
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            if seen > rank:
+                return round(self.min_ms * self.gamma**k * 2 / (1 + self.gamma), 3) if k > 0 else self.min_ms
+
+        return None
+
+    def dumps(self) -> str:
+        return json.dumps(self.bins, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, text: Optional[str]) -> "LatencySketch":
+        return cls() if not text else cls({int(k): v for k, v in json.loads(text).items()})
+
+
+def is_blocked(request_log: RequestLog) -> bool:
+    return request_log_outcome(request_log.response_status, request_log.server, ip_rules_blocked(request_log.error)) == "blocked"
+
+
+@dataclass
+class _Counts:
+    count: int = 0
+    blocked: int = 0
+    errors: int = 0
+
+
+@dataclass
+class _Latency:
+    count: int = 0
+    sum_ms: float = 0
+    sketch: LatencySketch = field(default_factory=LatencySketch)
+
+
+class RollupStore:
+    """
+    per-minute and per-hour aggregates of the request logs, maintained by the log writer batch by batch.
+    a request trying the upstreams of `default` one by one logs every attempt, only its last log is counted
+    """
+
+    def __init__(self, file: Path, readonly: bool = False):
+        self.file = file
+        # request_id -> the log of an upstream without an answer, counted unless a later log of the request comes
+        self._no_answer: dict[str, RequestLog] = dict()
+        if not readonly:
+            file.parent.mkdir(exist_ok=True, parents=True)
+
+        self.db = sqlite3.connect("file:{}?mode={}".format(file, "ro" if readonly else "rwc"), uri=True, timeout=1)
+        self.db.row_factory = sqlite3.Row
+        if not readonly:
+            self.__init_db_schema()
+
+    def __init_db_schema(self):
+        sql = """
+            pragma journal_mode=wal;
+
+            create table if not exists rollups
+            (
+                "period"    integer not null,
+                "bucket"    integer not null,
+                "dimension" text    not null,
+                "key"       text    not null,
+                "count"     integer not null,
+                "blocked"   integer not null,
+                "errors"    integer not null,
+                primary key ("period", "bucket", "dimension", "key")
+            ) without rowid;
+
+            create table if not exists latency_rollups
+            (
+                "period" integer not null,
+                "bucket" integer not null,
+                "server" text    not null,
+                "count"  integer not null,
+                "sum_ms" real    not null,
+                "sketch" text    not null,
+                primary key ("period", "bucket", "server")
+            ) without rowid;
+        """
+        self.db.executescript(sql)
+        self.db.commit()
+
+    def add(self, request_logs: Iterable[RequestLog]):
+        final = []
+        newest = None
+        for x in request_logs:
+            newest = max(newest or 0, created_epoch(x.created))
+            if x.response_status is None:
+                self._no_answer[x.request_id] = x
+            else:
+                self._no_answer.pop(x.request_id, None)
+                final.append(x)
+
+        if newest is not None:
+            for request_id, x in list(self._no_answer.items()):
+                if created_epoch(x.created) < newest - __next_upstream_seconds__:
+                    final.append(self._no_answer.pop(request_id))
+
+        self._add(final)
+
+    def _add(self, request_logs: list[RequestLog]):
+        counts: dict[tuple[int, int, str, str], _Counts] = defaultdict(_Counts)
+        latencies: dict[tuple[int, int, str], _Latency] = defaultdict(_Latency)
+        for x in request_logs:
+            epoch = created_epoch(x.created)
+            blocked = is_blocked(x)
+            error = x.response_status is None or x.response_status == "SERVFAIL"
+            for period in __periods__:
+                bucket = epoch - epoch % period
+                for dimension in __dimensions__:
+                    if (key := getattr(x, dimension)) is None:
+                        continue
+
+                    item = counts[(period, bucket, dimension, key)]
+                    item.count += 1
+                    item.blocked += blocked
+                    item.errors += error
+
+                if x.server is not None and x.response_status is not None:
+                    latency = latencies[(period, bucket, x.server)]
+                    latency.count += 1
+                    latency.sum_ms += x.ms
+                    latency.sketch.add(x.ms)
+
+        sql = """
+            insert into rollups ("period", "bucket", "dimension", "key", "count", "blocked", "errors")
+                 values (?, ?, ?, ?, ?, ?, ?)
+                on conflict do update set "count"   = "count" + excluded."count",
+                                          "blocked" = "blocked" + excluded."blocked",
+                                          "errors"  = "errors" + excluded."errors"
+        """
+        self.db.executemany(sql, [(*k, v.count, v.blocked, v.errors) for k, v in counts.items()])
+
+        sql = """ select "sketch" from latency_rollups where "period" = ? and "bucket" = ? and "server" = ? """
+        for k, v in latencies.items():
+            if (row := self.db.execute(sql, k).fetchone()) is not None:
+                v.sketch.merge(LatencySketch.loads(row["sketch"]))
+
+        sql = """
+            insert into latency_rollups ("period", "bucket", "server", "count", "sum_ms", "sketch")
+                 values (?, ?, ?, ?, ?, ?)
+                on conflict do update set "count"  = "count" + excluded."count",
+                                          "sum_ms" = "sum_ms" + excluded."sum_ms",
+                                          "sketch" = excluded."sketch"
+        """
+        self.db.executemany(sql, [(*k, v.count, v.sum_ms, v.sketch.dumps()) for k, v in latencies.items()])
+        self.db.commit()
+
+    def prune(self, period: int, before: int) -> int:
+        deleted = self.db.execute(""" delete from rollups where "period" = ? and "bucket" < ? """, (period, before)).rowcount
+        deleted += self.db.execute(""" delete from latency_rollups where "period" = ? and "bucket" < ? """, (period, before)).rowcount
+        self.db.commit()
+        return deleted
+
+    def top(self, dimension: str, since: int, until: Optional[int] = None, order_by: str = "count", limit: int = 20) -> list[dict]:
+        """e.g. top("name", today, order_by="blocked") for the top blocked domains today"""
+        if dimension not in __dimensions__ or order_by not in ("count", "blocked", "errors"):
+            raise ValueError(f"top: {dimension} / {order_by}")
+
+        period = self._period(since, until)
+        sql = f"""
+            select "key", sum("count") as "count", sum("blocked") as "blocked", sum("errors") as "errors"
+              from rollups
+             where "period" = :period and "bucket" >= :since and "bucket" < :until and "dimension" = :dimension
+             group by "key"
+            having sum("{order_by}") > 0
+             order by sum("{order_by}") desc, "key"
+             limit :limit
+        """
+        parameters = {"period": period, "since": since, "until": until or 2**62, "dimension": dimension, "limit": limit}
+        return [dict(row) for row in self.db.execute(sql, parameters).fetchall()]
+
+    def latency(self, since: int, until: Optional[int] = None, quantiles: tuple[float, ...] = (0.5, 0.95, 0.99)) -> list[dict]:
+        """per upstream server, e.g. latency(this_hour) for the p95 latency per upstream this hour"""
+        period = self._period(since, until)
+        sql = """
+            select "server", "count", "sum_ms", "sketch"
+              from latency_rollups
+             where "period" = :period and "bucket" >= :since and "bucket" < :until
+        """
+        merged: dict[str, _Latency] = defaultdict(_Latency)
+        for row in self.db.execute(sql, {"period": period, "since": since, "until": until or 2**62}).fetchall():
+            item = merged[row["server"]]
+            item.count += row["count"]
+            item.sum_ms += row["sum_ms"]
+            item.sketch.merge(LatencySketch.loads(row["sketch"]))
+
+        result = []
+        for server, item in sorted(merged.items()):
+            o = {"server": server, "count": item.count, "mean_ms": round(item.sum_ms / item.count, 3) if item.count else None}
+            o.update({"p{:g}".format(q * 100): item.sketch.quantile(q) for q in quantiles})
+            result.append(o)
+
+        return result
+
+    @staticmethod
+    def _period(since: int, until: Optional[int]) -> int:
+        # hourly rows when the range is made of whole hours, minute rows otherwise
+        return 3600 if since % 3600 == 0 and (until is None or until % 3600 == 0) else 60
+
+    def close(self):
+        if len(self._no_answer) > 0:
+            self._add(list(self._no_answer.values()))
+            self._no_answer.clear()
+
+        self.db.close()
+
+
+def rollups_file(directory: Optional[Path] = None) -> Path:
+    """next to the request log partitions"""
+    return (RequestLogStore().directory if directory is None else directory).joinpath("rollups.sqlite3")
+
+
+def prune_rollups(config: RequestLogsConfig, now: Optional[int] = None, directory: Optional[Path] = None) -> int:
+    """minute rows are kept for `__minute_rollup_days__`, hour rows as long as the request logs"""
+    if not (file := rollups_file(directory)).is_file():
+        return 0
+
+    now = int(datetime.now(timezone.utc).timestamp()) if now is None else now
+    store = RollupStore(file)
+    try:
+        deleted = store.prune(60, now - now % 86400 - (__minute_rollup_days__ - 1) * 86400)
+        if config.retention_days is not None:
+            deleted += store.prune(3600, now - now % 86400 - (config.retention_days - 1) * 86400)
+
+        return deleted
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simple.rollups", description="reports from the request log rollups")
+    parser.add_argument("--data-dir", type=Path, help="directory for config files and temp files. default: data")
+    parser.add_argument("--top", type=str, choices=list(__dimensions__), help="top names / clients / response status / servers")
+    parser.add_argument("--order-by", type=str, choices=["count", "blocked", "errors"], default="count")
+    parser.add_argument("--latency", action="store_true", help="latency per upstream server")
+    parser.add_argument("--minutes", type=int, default=60 * 24, help="how far back, default: 1440 (whole hours use hourly rollups)")
+    parser.add_argument("--limit", type=int, default=20)
+    args, _ = parser.parse_known_args()
+
+    now = int(datetime.now(timezone.utc).timestamp())
+    since = now - args.minutes * 60
+    since = since - since % 3600 if args.minutes % 60 == 0 else since - since % 60
+    store = RollupStore(rollups_file(), readonly=True)
+    try:
+        result = store.latency(since) if args.latency else store.top(args.top or "name", since, order_by=args.order_by, limit=args.limit)
+    finally:
+        store.close()
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
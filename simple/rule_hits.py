@@ -0,0 +1,194 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from simple.app_args import app_args
+from simple.models import DnsServerConfig
+from simple.parse_rules import parse_forwarding_rules
+from simple.temp_rules import __parsers__, temp_rule_text
+
+__kinds__: dict[str, Callable[[str, str], list]] = {**__parsers__, "forwarding_rules": parse_forwarding_rules}
+
+
+class RuleHits:
+    """
+    how often every rule matched. a query only appends to a deque (thread safe without a lock),
+    the flush thread counts what piled up and adds it to the stats table
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._pending: deque[tuple[str, object]] = deque()
+
+    def hit(self, kind: str, item: object):
+        if self.enabled:
+            self._pending.append((kind, item))
+
+    def hit_many(self, kind: str, items: Iterable[object]):
+        """a rule matching several records of one answer is one hit"""
+        if self.enabled:
+            self._pending.extend((kind, x) for x in dict.fromkeys(items))
+
+    def drain(self) -> dict[tuple[str, str, str], int]:
+        """(kind, group, rule) -> hits since the last drain"""
+        counts: Counter[tuple[str, object]] = Counter()
+        for _ in range(len(self._pending)):
+            counts[self._pending.popleft()] += 1
+
+        result: Counter[tuple[str, str, str]] = Counter()
+        for (kind, item), count in counts.items():
+            result[(kind, getattr(item, "group"), temp_rule_text(item))] += count
+
+        return result
+
+    def flush(self, store: "RuleHitStore", now: Optional[int] = None) -> int:
+        counts = self.drain()
+        store.add(counts, int(time.time()) if now is None else now)
+        return sum(counts.values())
+
+
+rule_hits = RuleHits()
+
+
+class RuleHitStore:
+    """the hits of every rule with the last time it matched, kept across restarts in temp/rule_hits.sqlite3"""
+
+    def __init__(self, file: Path, readonly: bool = False):
+        self.file = file
+        if not readonly:
+            file.parent.mkdir(exist_ok=True, parents=True)
+
+        self.db = sqlite3.connect("file:{}?mode={}".format(file, "ro" if readonly else "rwc"), uri=True, timeout=1)
+        self.db.row_factory = sqlite3.Row
+        if not readonly:
+            self.__init_db_schema()
+
+    def __init_db_schema(self):
+        sql = """
+            pragma journal_mode=wal;
+
+            create table if not exists rule_hits
+            (
+                "kind"      text    not null,
+                "group"     text    not null,
+                "rule"      text    not null,
+                "hits"      integer not null,
+                "first_hit" integer not null,
+                "last_hit"  integer not null,
+                primary key ("kind", "group", "rule")
+            ) without rowid;
+
+            create table if not exists tracking
+            (
+                "since" integer not null
+            );
+        """
+        self.db.executescript(sql)
+        self.db.execute(""" insert into tracking ("since") select ? where not exists (select 1 from tracking) """, (int(time.time()),))
+        self.db.commit()
+
+    def add(self, counts: dict[tuple[str, str, str], int], now: int):
+        sql = """
+            insert into rule_hits ("kind", "group", "rule", "hits", "first_hit", "last_hit")
+                 values (?, ?, ?, ?, ?, ?)
+                on conflict do update set "hits"     = "hits" + excluded."hits",
+                                          "last_hit" = excluded."last_hit"
+        """
+        self.db.executemany(sql, [(*k, v, now, now) for k, v in counts.items()])
+        self.db.commit()
+
+    def since(self) -> Optional[int]:
+        """when hits were first counted, a rule can only be called unused for that long"""
+        row = self.db.execute(""" select min("since") as "since" from tracking """).fetchone()
+        return row["since"]
+
+    def hits(self, kind: str) -> dict[tuple[str, str], tuple[int, int]]:
+        """(group, rule) -> (hits, last_hit)"""
+        sql = """ select "group", "rule", "hits", "last_hit" from rule_hits where "kind" = ? """
+        return {(row["group"], row["rule"]): (row["hits"], row["last_hit"]) for row in self.db.execute(sql, (kind,)).fetchall()}
+
+    def close(self):
+        self.db.close()
+
+
+def rule_hits_file(data_dir: Optional[Path] = None) -> Path:
+    return (app_args.data_dir if data_dir is None else data_dir).joinpath("temp", "rule_hits.sqlite3")
+
+
+def unused_rules(
+    config: DnsServerConfig,
+    rule_text: Callable[[str], Optional[str]],
+    store: RuleHitStore,
+    days: int,
+    kinds: Optional[list[str]] = None,
+    limit: Optional[int] = None,
+    now: Optional[int] = None,
+) -> dict:
+    """
+    every rule file / url of config.json with its hits and the rules that did not match in `days` days.
+    a rule in two files is counted in both
+    """
+    now = int(time.time()) if now is None else now
+    cutoff = now - days * 86400
+    sources = []
+    for kind, parse in __kinds__.items():
+        if kinds is not None and kind not in kinds:
+            continue
+
+        hits = store.hits(kind)
+        for group, values in getattr(config.rules, kind).items():
+            for value in values:
+                if (text := rule_text(value)) is None:
+                    continue
+
+                rules = list(dict.fromkeys(temp_rule_text(x) for x in parse(group, text)))
+                found = [hits.get((group, x), (0, 0)) for x in rules]
+                unused = [x for x, (_, last_hit) in zip(rules, found) if last_hit < cutoff]
+                sources.append(
+                    {
+                        "kind": kind,
+                        "group": group,
+                        "source": value,
+                        "rules": len(rules),
+                        "hits": sum(x for x, _ in found),
+                        "unused": len(unused),
+                        "unused_rules": unused if limit is None else unused[:limit],
+                    }
+                )
+
+    since = store.since()
+    return {"days": days, "since": since, "complete": since is not None and since <= cutoff, "sources": sources}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simple.rule_hits", description="rules that did not match any query lately")
+    parser.add_argument("--data-dir", type=Path, help="directory for config files and temp files. default: data")
+    parser.add_argument("--days", type=int, default=30, help="no hit in this many days, default: 30")
+    parser.add_argument("--kind", type=str, action="append", choices=list(__kinds__), help="only these kinds, default: all")
+    parser.add_argument("--limit", type=int, default=100, help="unused rules listed per file, default: 100, 0 for all of them")
+    args, _ = parser.parse_known_args()
+
+    from simple.config import ConfigFile
+
+    config_file = ConfigFile(app_args)
+    config = config_file.read_config_from_config_file()
+    if not (file := rule_hits_file()).is_file():
+        print(f"no hits recorded yet: {file} is written by the running server")
+        return
+
+    store = RuleHitStore(file, readonly=True)
+    try:
+        result = unused_rules(config, config_file.rule_text, store, args.days, args.kind, args.limit or None)
+    finally:
+        store.close()
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
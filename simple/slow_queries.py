@@ -0,0 +1,124 @@
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, ContextManager, Iterator, Optional
+
+from simple.app_args import app_args
+
+logger = logging.getLogger(__name__)
+
+__day_pattern__ = re.compile(r"^(\d{4}-\d{2}-\d{2})\.jsonl$")
+
+
+class QueryTimings:
+    """the stages of one query, from the moment the server accepted it (before the request thread started)"""
+
+    def __init__(self, started: float):
+        self.started = started
+        # (stage, ms, detail), appended by the happy eyeballs threads too, list.append is atomic
+        self.stages: list[tuple[str, float, Optional[str]]] = []
+
+    @contextmanager
+    def stage(self, name: str, detail: Optional[str] = None) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, (time.perf_counter() - start) * 1000, detail))
+
+    def add(self, name: str, start: float, detail: Optional[str] = None):
+        self.stages.append((name, (time.perf_counter() - start) * 1000, detail))
+
+    def offset(self, start: float) -> str:
+        """when something started, from the start of the query"""
+        return f"+{(start - self.started) * 1000:.1f}ms"
+
+    @property
+    def elapsed_milliseconds(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+
+class _NoTimings(QueryTimings):
+    """what every query gets while the slow query log is off"""
+
+    def stage(self, name: str, detail: Optional[str] = None) -> ContextManager[None]:  # type: ignore[override]
+        return nullcontext()
+
+    def add(self, name: str, start: float, detail: Optional[str] = None):
+        pass
+
+
+__no_timings__ = _NoTimings(0.0)
+
+
+class SlowQueryLog:
+    """queries taking at least `threshold_ms` with their timings, one json per line in temp/slow_queries/<utc day>.jsonl"""
+
+    def __init__(self, directory: Optional[Path] = None, threshold_ms: Optional[int] = None):
+        self._directory = directory
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+        # id(request) -> when the server accepted it, taken back by the request thread
+        self._accepted: dict[int, float] = dict()
+
+    @property
+    def directory(self) -> Path:
+        return app_args.data_dir.joinpath("temp", "slow_queries") if self._directory is None else self._directory
+
+    def configure(self, threshold_ms: Optional[int]):
+        self.threshold_ms = threshold_ms
+        self._accepted = dict()
+
+    def accepted(self, request: Any):
+        if self.threshold_ms is not None:
+            self._accepted[id(request)] = time.perf_counter()
+
+    def timings(self, request: Any) -> QueryTimings:
+        if self.threshold_ms is None:
+            return __no_timings__
+
+        timings = QueryTimings(self._accepted.pop(id(request), time.perf_counter()))
+        timings.add("thread_wait", timings.started)
+        return timings
+
+    def finish(self, timings: QueryTimings, **kwargs):
+        """written by the request thread after the response was sent, slow queries are rare"""
+        if self.threshold_ms is None or timings is __no_timings__ or (ms := timings.elapsed_milliseconds) < self.threshold_ms:
+            return
+
+        now = datetime.now(timezone.utc)
+        o = {
+            "created": now.strftime("%Y-%m-%d %H:%M:%S"),
+            **kwargs,
+            "ms": round(ms, 2),
+            "stages": [{"stage": name, "ms": round(x, 2), "detail": detail} for name, x, detail in timings.stages],
+        }
+        try:
+            with self._lock:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                with open(self.directory.joinpath(f"{now.date().isoformat()}.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(o, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error("slow_query_log", exc_info=e)
+
+    def prune(self, retention_days: Optional[int], today: Optional[date] = None) -> list[str]:
+        if retention_days is None or not self.directory.is_dir():
+            return []
+
+        today = datetime.now(timezone.utc).date() if today is None else today
+        cutoff = (today - timedelta(days=retention_days - 1)).isoformat()
+        dropped = []
+        for w in self.directory.iterdir():
+            if (m := __day_pattern__.match(w.name)) is not None and m.group(1) < cutoff:
+                w.unlink(missing_ok=True)
+                dropped.append(m.group(1))
+
+        return sorted(dropped)
+
+
+slow_query_log = SlowQueryLog()
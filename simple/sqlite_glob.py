@@ -0,0 +1,62 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+
+@lru_cache(maxsize=4096)
+def _compile(pattern: str) -> Optional[re.Pattern]:
+    """
+    sqlite glob as a regex: `*`, `?` and sets, `[^...]` negates a set (fnmatch reads `[!...]` as that, sqlite as a `!`),
+    `]` first in a set and `-` first or last are plain chars. a set without its `]` matches nothing, None then
+    """
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            result.append(".*")
+        elif c == "?":
+            result.append(".")
+        elif c == "[":
+            negate = i < n and pattern[i] == "^"
+            i += negate
+            chars = []
+            prior: Optional[str] = None
+            if i < n and pattern[i] == "]":
+                chars.append(re.escape("]"))
+                prior = "]"
+                i += 1
+
+            while i < n and pattern[i] != "]":
+                if pattern[i] == "-" and prior is not None and i + 1 < n and pattern[i + 1] != "]":
+                    # a range backwards matches nothing
+                    if prior <= pattern[i + 1]:
+                        chars[-1] = f"{re.escape(prior)}-{re.escape(pattern[i + 1])}"
+                    else:
+                        chars.pop()
+
+                    prior = None
+                    i += 2
+                else:
+                    chars.append(re.escape(pattern[i]))
+                    prior = pattern[i]
+                    i += 1
+
+            if i >= n:
+                return None
+
+            i += 1
+            if len(chars) == 0:
+                result.append("." if negate else "(?!)")
+            else:
+                result.append("[{}{}]".format("^" if negate else "", "".join(chars)))
+        else:
+            result.append(re.escape(c))
+
+    return re.compile("".join(result), re.DOTALL)
+
+
+def glob_match(text: str, pattern: str) -> bool:
+    """`text glob pattern` of sqlite, for the in-memory rules that stand in for the sql"""
+    return (compiled := _compile(pattern)) is not None and compiled.fullmatch(text) is not None
@@ -0,0 +1,54 @@
+import sys
+import time
+from contextlib import contextmanager
+
+from simple.models import DnsServerConfig, DnsServerUpstreamProtocol
+
+
+class StartupReport:
+    """how long every step of the start took, printed by `--startup-report`"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = dict()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + (time.perf_counter() - start) * 1000
+
+    def report(self, **kwargs) -> dict:
+        return {
+            "stages_ms": {k: round(v, 2) for k, v in self.stages.items()},
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            **kwargs,
+        }
+
+
+startup_report = StartupReport()
+
+
+def uses_https(config: DnsServerConfig) -> bool:
+    # no preferred_protocol means https, see DnsRequestHandler._dns_query_with_upstream
+    return any(x.preferred_protocol in [None, DnsServerUpstreamProtocol.HTTPS] for x in config.upstream.values())
+
+
+def load_protocols(config: DnsServerConfig):
+    """
+    dns.query imports httpx / httpcore (and trio, when installed) whenever they are installed, about half of the import time.
+    they are left out when no upstream uses https, this has to run before the first import of dns.query.
+    dnspython has no public switch for it: `dns._features.force` is private, that is why dnspython is pinned in Pipfile.
+    another version without it only costs the import time
+    """
+    if "dns.query" not in sys.modules and not uses_https(config):
+        try:
+            from dns._features import force
+        except ImportError:
+            pass
+        else:
+            force("doh", False)
+
+    import simple.threading_server
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from simple import USER_AGENT
+from simple.app_args import app_args
+from simple.models import DnsServerConfig
+
+logger = logging.getLogger(__name__)
+
+# the kinds a url can be used for, the ones rules can be added to / removed from at runtime (see simple.temp_rules)
+__kinds__ = ("allowed_ips", "allowed_names", "blocked_ips", "blocked_names", "cloaking_rules")
+__max_size__ = 64 * 1024 * 1024
+# a failed download is tried again after this many seconds, not at the next refresh
+__retry_seconds__ = 600
+
+
+def is_url(value: str) -> bool:
+    return value.startswith("http://") or value.startswith("https://")
+
+
+def subscriptions(config: DnsServerConfig) -> list[tuple[str, str, str]]:
+    """(kind, group, url) of the rule entries pointing at a url"""
+    result = []
+    for kind in __kinds__:
+        for group, values in getattr(config.rules, kind).items():
+            result.extend((kind, group, x) for x in values if is_url(x))
+
+    return result
+
+
+class SubscriptionStore:
+    """the last download of every url and its validators (etag / last-modified), in temp/subscriptions"""
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = app_args.data_dir.joinpath("temp", "subscriptions") if directory is None else directory
+
+    def _file(self, url: str, suffix: str) -> Path:
+        return self.directory.joinpath(hashlib.sha256(url.encode()).hexdigest()[:24] + suffix)
+
+    def read(self, url: str) -> Optional[str]:
+        """the text of the last download, None before the first one"""
+        return p.read_text(encoding="utf-8") if (p := self._file(url, ".txt")).is_file() else None
+
+    def meta(self, url: str) -> dict:
+        if not (p := self._file(url, ".json")).is_file():
+            return dict()
+
+        try:
+            return json.loads(p.read_text(encoding="utf-8"))
+        except ValueError:
+            return dict()
+
+    def _write(self, url: str, suffix: str, text: str):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp = self._file(url, suffix + ".tmp")
+        temp.write_text(text, encoding="utf-8")
+        temp.replace(self._file(url, suffix))
+
+    def fetch(self, url: str, timeout: float) -> Optional[tuple[str, dict]]:
+        """a conditional get: the new text and its validators, kept once it is applied (`save`), None for a 304"""
+        import urllib.error
+        import urllib.request
+
+        meta = self.meta(url)
+        headers = {"User-Agent": USER_AGENT}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+                data = response.read(__max_size__ + 1)
+                etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+
+            self._write(url, ".json", json.dumps({**meta, "checked": time.time(), "failed": None}))
+            return None
+
+        if len(data) > __max_size__:
+            raise ValueError(f"{url}: more than {__max_size__} bytes")
+
+        return data.decode("utf-8", errors="replace"), {"url": url, "etag": etag, "last_modified": last_modified, "checked": time.time()}
+
+    def save(self, url: str, text: str, meta: dict):
+        self._write(url, ".txt", text)
+        self._write(url, ".json", json.dumps(meta))
+
+    def failed(self, url: str):
+        self._write(url, ".json", json.dumps({**self.meta(url), "failed": time.time()}))
+
+
+class SubscriptionRefresher:
+    """
+    downloads the due subscriptions and applies what changed, like runtime rule changes: the rows and the in memory
+    indexes change in place, queries are answered the whole time. a rule another file or url of the same kind
+    and group has too is neither added twice nor removed
+    """
+
+    def __init__(self, config: DnsServerConfig, rule_text: Callable[[str], Optional[str]], store: Optional[SubscriptionStore] = None):
+        self.config = config
+        self.rule_text = rule_text
+        self.store = SubscriptionStore() if store is None else store
+
+    def due(self, now: Optional[float] = None) -> list[tuple[str, str, str]]:
+        now = time.time() if now is None else now
+        refresh = self.config.subscriptions.refresh_minutes * 60
+        result = []
+        for x in subscriptions(self.config):
+            meta = self.store.meta(x[2])
+            if (meta.get("checked") or 0) + refresh <= now and (meta.get("failed") or 0) + __retry_seconds__ <= now:
+                result.append(x)
+
+        return result
+
+    def refresh(self, kind: str, group: str, url: str) -> Optional[dict]:
+        """the changes, None when the list did not change"""
+        from simple.db import TheDbJob
+        from simple.temp_rules import __parsers__, rules_lock
+
+        old_text = self.store.read(url)
+        if (fetched := self.store.fetch(url, self.config.subscriptions.timeout)) is None:
+            return None
+
+        text, meta = fetched
+
+        parse = __parsers__[kind]
+        old, new = set(parse(group, old_text or "")), set(parse(group, text))
+        others = set()
+        for value in getattr(self.config.rules, kind)[group]:
+            if value != url and (other_text := self.rule_text(value)) is not None:
+                others.update(parse(group, other_text))
+
+        added, removed = list(new - old - others), list(old - new - others)
+        with rules_lock:
+            db_job = TheDbJob()
+            try:
+                db_job.remove_rules(kind, removed)
+                db_job.add_rules(kind, added)
+            finally:
+                db_job.db.close()
+
+            self.store.save(url, text, meta)
+
+        return {"kind": kind, "group": group, "url": url, "rules": len(new), "added": len(added), "removed": len(removed)}
+
+    def run(self, now: Optional[float] = None) -> list[dict]:
+        result = []
+        for kind, group, url in self.due(now):
+            try:
+                if (changes := self.refresh(kind, group, url)) is not None:
+                    logger.info(f"subscription {kind} -> {group}: {url}, {changes['added']} added, {changes['removed']} removed")
+                    result.append(changes)
+            except Exception as e:
+                logger.warning(f"subscription {kind} -> {group}: {url}, {type(e).__name__}: {e}")
+                self.store.failed(url)
+
+        return result
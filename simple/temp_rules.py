@@ -0,0 +1,95 @@
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from simple.db import TheDbJob
+from simple.models import CloakingItem, DnsServerConfig
+from simple.parse_rules import (
+    parse_allowed_ips,
+    parse_allowed_names,
+    parse_blocked_ips,
+    parse_blocked_names,
+    parse_cloaking_rules,
+    parse_line,
+)
+
+# group `temp` applies to every client like `default`, it is the one meant for quick changes
+__group__ = "temp"
+
+__parsers__: dict[str, Callable[[str, str], list]] = {
+    "allowed_ips": parse_allowed_ips,
+    "allowed_names": parse_allowed_names,
+    "blocked_ips": parse_blocked_ips,
+    "blocked_names": parse_blocked_names,
+    "cloaking_rules": parse_cloaking_rules,
+}
+
+# one writer at a time, for the database and the rule files (simple.subscriptions too)
+rules_lock = threading.Lock()
+
+
+def parse_temp_rule(kind: str, rule: str) -> list:
+    """a line of a rule file, `name mapped` for cloaking_rules"""
+    if (parse := __parsers__.get(kind)) is None:
+        raise ValueError(f"kind: {kind} should be one of {', '.join(__parsers__)}")
+
+    if not isinstance(rule, str) or len(items := parse(__group__, rule)) == 0:
+        raise ValueError(f"rule: {rule} is not a valid {kind} rule")
+
+    return items
+
+
+def temp_rule_text(item) -> str:
+    if isinstance(item, CloakingItem):
+        return f"{item.name} {item.mapped}"
+
+    return item.ip if hasattr(item, "ip") else item.name
+
+
+def temp_rule_file(config: DnsServerConfig, data_dir: Path, kind: str) -> Optional[Path]:
+    """the first file of the `temp` key of this kind in config.json"""
+    files = getattr(config.rules, kind).get(__group__, [])
+    return data_dir.joinpath(files[0]).resolve() if len(files) > 0 else None
+
+
+def _persist(path: Path, kind: str, items: list, add: bool):
+    lines = path.read_text().splitlines() if path.is_file() else []
+    if add:
+        known = {x for line in lines for x in __parsers__[kind](__group__, line)}
+        lines.extend(temp_rule_text(x) for x in items if x not in known)
+    else:
+        lines = [line for line in lines if not parse_line(line) or not set(__parsers__[kind](__group__, line)) & set(items)]
+
+    path.parent.mkdir(exist_ok=True, parents=True)
+    path.write_text("".join(f"{x}\n" for x in lines))
+
+
+def change_temp_rule(config: DnsServerConfig, data_dir: Path, kind: str, rule: str, add: bool, persist: bool = False) -> dict:
+    """
+    add or remove a temp rule of the running server without `init_db`: one row in data.sqlite3 and, for ips and cloaking,
+    the in memory index changed in place. `persist` writes the rule file too, otherwise the change is gone with the next start
+    """
+    items = parse_temp_rule(kind, rule)
+    path = temp_rule_file(config, data_dir, kind) if persist else None
+    if persist and path is None:
+        raise ValueError(f"rules -> {kind}: no {__group__} file to persist to")
+
+    with rules_lock:
+        db_job = TheDbJob()
+        try:
+            changed = db_job.add_rules(kind, items) if add else db_job.remove_rules(kind, items)
+        finally:
+            db_job.db.close()
+
+        if path is not None:
+            _persist(path, kind, items, add)
+
+    return {"kind": kind, "rules": [temp_rule_text(x) for x in items], "changed": changed, "file": None if path is None else str(path)}
+
+
+def list_temp_rules() -> dict[str, list[str]]:
+    db_job = TheDbJob(readonly=True)
+    try:
+        return {kind: [temp_rule_text(x) for x in db_job.rules_by_group(kind, __group__)] for kind in __parsers__}
+    finally:
+        db_job.db.close()
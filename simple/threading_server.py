@@ -1,14 +1,15 @@
-import json
 import logging
 import random
 import socket
 import socketserver
 import struct
+import time
 import uuid
 from ipaddress import ip_address, IPv4Address
-from typing import Any, cast, Optional
+from typing import Any, Callable, cast, Optional, TYPE_CHECKING
 
 import dns.exception
+import dns.flags
 import dns.message
 import dns.query
 import dns.rdata
@@ -16,32 +17,46 @@ import dns.rdtypes
 import dns.rdtypes.IN
 import dns.rdtypes.IN.A
 import dns.rdtypes.IN.AAAA
-import dns.resolver
-import httpx
 
+from simple import is_running_in_windows
 from simple.db import TheDbJob
+from simple.ecs import client_response, parse_request, udp_payload, upstream_query
+from simple.happy_eyeballs import family_health, happy_eyeballs
+from simple.local_zones import local_zones
+from simple.minimal_responses import trim_response
 from simple.models import (
     AllowedIpItem,
     BlockedIpItem,
     BlockedNameItem,
     CloakingItemRecordType,
     DnsServerConfig,
+    DnsServerUpstream,
     DnsServerUpstreamProtocol,
     RequestLog,
 )
+from simple.profiler import request_profiler
+from simple.rate_limit import minimal_response, rate_limiter
+from simple.request_log_policy import ip_rules_error
+from simple.rule_hits import rule_hits
+from simple.slow_queries import QueryTimings, slow_query_log
 from simple.stopwatch import Stopwatch
 
+if TYPE_CHECKING:
+    import httpx
+
 logger = logging.getLogger(__name__)
 
 
 class DnsRequestHandler(socketserver.BaseRequestHandler):
     def __init__(self, request: Any, client_address: Any, server: socketserver.BaseServer):
         self.config = cast(DnsServerConfig, None)
-        self.doh_client = cast(httpx.Client, None)
+        self.doh_client = cast(Optional["httpx.Client"], None)
         self.db = TheDbJob(readonly=True)
         self.request_id: str = str(uuid.uuid4())
         self._request_domain: Optional[str] = None
         self.request_domain_cname: Optional[str] = None
+        self.timings: QueryTimings = slow_query_log.timings(request)
+        self.udp_payload = 512
         super().__init__(request, client_address, server)
         self.upstream_server_used: Optional[str] = None
 
@@ -97,6 +112,22 @@ class DnsRequestHandler(socketserver.BaseRequestHandler):
             connection.sendall(response_data)
         elif self.server.socket_type == socket.SOCK_DGRAM:
             _, connection = cast(tuple[bytes, socket.socket], self.request)
+            if rate_limiter.responses is not None and len(response_message.question) > 0:
+                question = response_message.question[0]
+                if (
+                    allowed := rate_limiter.allow_response(
+                        self.client_ip, question.name.to_text(), question.rdtype, response_message.rcode()
+                    )
+                ) is False:
+                    return
+
+                if allowed is None and (truncated := minimal_response(response_data, truncated=True)) is not None:
+                    response_data = truncated
+
+            # e.g. an upstream answer over tcp / https, the client retries over tcp
+            if len(response_data) > self.udp_payload and (truncated := minimal_response(response_data, truncated=True)) is not None:
+                response_data = truncated
+
             connection.sendto(response_data, self.client_address)
 
     def _make_response(self, request_message: dns.message.Message, rcode: Optional[dns.rcode.Rcode]) -> dns.message.Message:
@@ -112,7 +143,11 @@ class DnsRequestHandler(socketserver.BaseRequestHandler):
         if question.rdtype == dns.rdatatype.ANY:
             response_message = self._make_response(request_message, dns.rcode.REFUSED)
         else:
-            if (item := self.db.block_names_ex(client_ip=self.client_ip, name=domain)) is not None:
+            with self.timings.stage("names", domain):
+                item = self.db.block_names_ex(client_ip=self.client_ip, name=domain)
+
+            if item is not None:
+                rule_hits.hit("blocked_names" if isinstance(item, BlockedNameItem) else "allowed_names", item)
                 if isinstance(item, BlockedNameItem):
                     response_message = self._make_response(request_message, dns.rcode.REFUSED)
 
@@ -120,19 +155,29 @@ class DnsRequestHandler(socketserver.BaseRequestHandler):
 
     def _cloaking(self, domain: str, request_message: dns.message.Message) -> dns.message.Message:
         question: dns.rrset.RRset = request_message.question[0]
-        cloaking_items = self.db.cloaking_rules_ex(domain)
+        with self.timings.stage("cloaking", domain):
+            cloaking_records = self.db.cloaking_records(domain)
+
+        rule_hits.hit_many("cloaking_rules", (x for x, _ in cloaking_records))
         record_type = CloakingItemRecordType.A if question.rdtype == dns.rdatatype.A else CloakingItemRecordType.AAAA
-        records = [
-            dns.rdata.from_text(dns.rdataclass.IN, question.rdtype, x.mapped) for x in cloaking_items if x.record_type == record_type
-        ]
+        records = [rdata for x, rdata in cloaking_records if x.record_type == record_type and rdata is not None]
         if len(records) == 0:
-            if (cname := next((x for x in cloaking_items if x.record_type == CloakingItemRecordType.CNAME), None)) is None:
+            if (cname := next((x for x, _ in cloaking_records if x.record_type == CloakingItemRecordType.CNAME), None)) is None:
                 response_message = self._proxy_request(name=domain, request_message=request_message)
             else:
                 self.request_domain_cname = cname.mapped
-                request_message2: Optional[dns.message.Message] = dns.message.from_text(request_message.to_text())
-                question2: dns.rrset.RRset = request_message2.question[0]
-                question2.name = dns.name.from_text(self.request_domain_cname)
+                request_message2 = dns.message.make_query(
+                    self.request_domain_cname,
+                    question.rdtype,
+                    question.rdclass,
+                    use_edns=request_message.edns,
+                    want_dnssec=bool(request_message.ednsflags & dns.flags.DO),
+                    ednsflags=request_message.ednsflags,
+                    payload=request_message.payload,
+                    options=request_message.options,
+                    id=request_message.id,
+                    flags=request_message.flags,
+                )
                 if (response_message := self._blocked_names(self.request_domain_cname, request_message2)) is None:
                     response_message = self._proxy_request(self.request_domain_cname, request_message2)
                     response_message.question[0].name = question.name
@@ -155,7 +200,15 @@ class DnsRequestHandler(socketserver.BaseRequestHandler):
 
         return response_message
 
-    def _insert_request_log(self, question_type: str, response_status: Optional[str], ms: float, error: Optional[str] = None):
+    def _insert_request_log(
+        self, question_type: str, response_status: Optional[str], ms: float, error: Optional[str] = None, blocked_ips: bool = False
+    ):
+        policy = TheDbJob.request_log_policy
+        if policy is not None and not policy.should_log(
+            self.client_ip, self.request_domain, response_status, self.upstream_server_used, ms, blocked_ips
+        ):
+            return
+
         self.db.insert_request_log_into_queue(
             RequestLog(
                 request_id=self.request_id,
@@ -171,29 +224,42 @@ class DnsRequestHandler(socketserver.BaseRequestHandler):
         )
 
     def _blocked_ips(self, response_message: dns.message.Message) -> list[AllowedIpItem | BlockedIpItem]:
-        has_removed_any_items = False
-        matched_items: list[AllowedIpItem | BlockedIpItem] = []
+        if not self.db.has_ip_rules(self.client_ip):
+            return []
+
+        rrsets: list[dns.rrset.RRset] = []
         for item in response_message.answer:
             item = cast(dns.rrset.RRset, item)
-            if item.rdtype != dns.rdatatype.A and item.rdtype != dns.rdatatype.AAAA:
-                continue
+            if item.rdtype == dns.rdatatype.A or item.rdtype == dns.rdatatype.AAAA:
+                rrsets.append(item)
+
+        addresses = [str(x.address) for item in rrsets for x in item if isinstance(x, dns.rdtypes.IN.A.A | dns.rdtypes.IN.AAAA.AAAA)]
+        if len(addresses) == 0:
+            return []
 
+        decisions = self.db.block_ips_many(client_ip=self.client_ip, ips=addresses)
+        if len(decisions) == 0:
+            return []
+
+        has_removed_any_items = False
+        matched_items: list[AllowedIpItem | BlockedIpItem] = []
+        for item in rrsets:
             items_to_remove = []
             for x in item:
                 if not isinstance(x, dns.rdtypes.IN.A.A | dns.rdtypes.IN.AAAA.AAAA):
                     continue
 
-                if (item2 := self.db.block_ips_ex(client_ip=self.client_ip, ip=str(x.address))) is not None:
-                    if isinstance(item2, AllowedIpItem):
-                        matched_items.append(item2)
-                    elif isinstance(item2, BlockedIpItem):
-                        matched_items.append(item2)
+                if (item2 := decisions.get(str(x.address))) is not None:
+                    matched_items.append(item2)
+                    if isinstance(item2, BlockedIpItem):
                         items_to_remove.append(x)
 
             for w in items_to_remove:
                 has_removed_any_items = True
                 item.remove(w)
 
+        rule_hits.hit_many("allowed_ips", (x for x in matched_items if isinstance(x, AllowedIpItem)))
+        rule_hits.hit_many("blocked_ips", (x for x in matched_items if isinstance(x, BlockedIpItem)))
         if has_removed_any_items:
             response_message.answer = [x for x in response_message.answer if len(cast(dns.rrset.RRset, x)) != 0]
             if len(response_message.answer) == 0 or (
@@ -207,14 +273,27 @@ class DnsRequestHandler(socketserver.BaseRequestHandler):
         return matched_items
 
     def handle(self):
+        if (profile := request_profiler.maybe_start()) is None:
+            self._handle()
+            return
+
+        try:
+            self._handle()
+        finally:
+            request_profiler.finish(profile)
+
+    def _handle(self):
         if (data := self._get_request()) is None:
             return
 
         try:
-            request_message = dns.message.from_wire(data, question_only=True, one_rr_per_rrset=False)
+            with self.timings.stage("parse"):
+                request_message = parse_request(data)
         except Exception:
             return
 
+        self.udp_payload = udp_payload(request_message)
+
         if self.config.ipv6 is False and self.server.address_family == socket.AF_INET6:
             response_message = self._make_response(request_message, dns.rcode.NOTIMP)
             self._send_response(response_message)
@@ -252,45 +331,103 @@ class DnsRequestHandler(socketserver.BaseRequestHandler):
             response_message = self._make_response(request_message, dns.rcode.SERVFAIL)
 
         # ///////////////////////////////////
-        self._send_response(response_message)
+        with self.timings.stage("send"):
+            self._send_response(response_message)
+
+        if slow_query_log.threshold_ms is not None:
+            question = cast(Optional[dns.rrset.RRset], request_message.question[0] if len(request_message.question) > 0 else None)
+            slow_query_log.finish(
+                self.timings,
+                request_id=self.request_id,
+                client_ip=self.client_ip,
+                name=self._request_domain,
+                cname=self.request_domain_cname,
+                question_type=None if question is None else dns.rdatatype.to_text(question.rdtype),
+                response_status=dns.rcode.to_text(response_message.rcode()),
+                server=self.upstream_server_used,
+            )
 
     def _dns_query(
-        self, request_message: dns.message.Message, server_ip: str, preferred_protocol: DnsServerUpstreamProtocol
+        self,
+        request_message: dns.message.Message,
+        server_ip: str,
+        upstream: DnsServerUpstream,
+        preferred_protocol: DnsServerUpstreamProtocol,
+        timeout: float = 2,
     ) -> dns.message.Message:
+        kwargs: dict[str, Any] = {} if upstream.port is None else {"port": upstream.port}
         if preferred_protocol == DnsServerUpstreamProtocol.UDP:
-            response_message = dns.query.udp_with_fallback(request_message, where=server_ip, timeout=2, one_rr_per_rrset=False)
+            response_message = dns.query.udp_with_fallback(
+                request_message, where=server_ip, timeout=timeout, one_rr_per_rrset=False, **kwargs
+            )
             return response_message[0] if isinstance(response_message, tuple) else response_message
         elif preferred_protocol == DnsServerUpstreamProtocol.TCP:
-            return dns.query.tcp(request_message, where=server_ip, timeout=2, one_rr_per_rrset=False)
+            return dns.query.tcp(request_message, where=server_ip, timeout=timeout, one_rr_per_rrset=False, **kwargs)
         elif preferred_protocol == DnsServerUpstreamProtocol.HTTPS:
-            return dns.query.https(request_message, where=server_ip, timeout=2, one_rr_per_rrset=False, session=self.doh_client)
+            return dns.query.https(
+                request_message, where=server_ip, timeout=timeout, one_rr_per_rrset=False, session=self.doh_client, **kwargs
+            )
         elif preferred_protocol == DnsServerUpstreamProtocol.TLS:
-            return dns.query.tls(request_message, where=server_ip, timeout=2, one_rr_per_rrset=False)
+            verify = True if upstream.ca_file is None else upstream.ca_file
+            return dns.query.tls(request_message, where=server_ip, timeout=timeout, one_rr_per_rrset=False, verify=verify, **kwargs)
 
         raise ValueError("!!!!!!!!!!")
 
     def _dns_query_with_upstream(self, request_message: dns.message.Message, upstream_name: str) -> Optional[dns.message.Message]:
         upstream = self.config.upstream[upstream_name]
         preferred_protocol = DnsServerUpstreamProtocol.HTTPS if upstream.preferred_protocol is None else upstream.preferred_protocol
-        if self.server.address_family == socket.AF_INET:
-            where = upstream.ipv4
-        elif self.server.address_family == socket.AF_INET6:
-            where = upstream.ipv6
-        else:
-            return None
-
-        if len(where) == 0:
+        # any listener uses both families of the upstream, the one answering faster first (see simple.happy_eyeballs)
+        where = {4: upstream.ipv4, 6: upstream.ipv6 if self.config.ipv6 is not False else []}
+        families = [x for x in family_health.order(upstream_name, [6, 4]) if len(where[x]) > 0]
+        if len(families) == 0:
             logger.warning(f"no where for upstream {upstream_name}")
             return None
 
-        ip = where[0] if len(where) == 1 else random.choice(where)
-        self.upstream_server_used = f"{preferred_protocol.value}://{ip}"
+        ips = [where[x][0] if len(where[x]) == 1 else random.choice(where[x]) for x in families]
+        # a hedge to another ip of the first family, after the other family: it starts one more delay (the p95 rtt) later
+        if len(hedges := [x for x in where[families[0]] if x != ips[0]]) > 0:
+            families, ips = [*families, families[0]], [*ips, random.choice(hedges)]
+
+        query_message = upstream_query(request_message, self.config.ecs)
+        self.upstream_server_used = f"{preferred_protocol.value}://{ips[0]}"
         upstream_server_error: Optional[str] = None
         response_message: Optional[dns.message.Message] = None
 
+        def attempt(family: int, ip: str) -> Callable[[], dns.message.Message]:
+            def run() -> dns.message.Message:
+                timeout = family_health.timeout(upstream_name, family)
+                start = time.perf_counter()
+                try:
+                    result = self._dns_query(query_message, ip, upstream, preferred_protocol, timeout)
+                except dns.exception.Timeout:
+                    family_health.failure(upstream_name, family, timeout)
+                    self.timings.add(
+                        "attempt", start, f"{preferred_protocol.value}://{ip} {self.timings.offset(start)} timeout {timeout:g}s"
+                    )
+                    raise
+                except Exception as e:
+                    family_health.failure(upstream_name, family)
+                    self.timings.add("attempt", start, f"{preferred_protocol.value}://{ip} {self.timings.offset(start)} {type(e).__name__}")
+                    raise
+
+                family_health.success(upstream_name, family, (time.perf_counter() - start) * 1000)
+                self.timings.add("attempt", start, f"{preferred_protocol.value}://{ip} {self.timings.offset(start)}")
+                return result
+
+            return run
+
         try:
             with Stopwatch() as stopwatch:
-                response_message = self._dns_query(request_message, ip, preferred_protocol)
+                attempts = [attempt(family, ip) for family, ip in zip(families, ips)]
+                # attempts still running when the first answer came are not in the timings
+                with self.timings.stage("upstream", upstream_name):
+                    i, response_message = happy_eyeballs(attempts, family_health.attempt_delay(upstream_name, families))
+
+                response_message = client_response(request_message, response_message)
+                if self.config.minimal_responses:
+                    response_message = trim_response(response_message)
+
+                self.upstream_server_used = f"{preferred_protocol.value}://{ips[i]}"
         except Exception as e:
             e1 = e
             error_list = []
@@ -302,30 +439,67 @@ class DnsRequestHandler(socketserver.BaseRequestHandler):
         finally:
             question: dns.rrset.RRset = request_message.question[0]
             is_a_aaaa_question = question.rdtype == dns.rdatatype.A or question.rdtype == dns.rdatatype.AAAA
+            blocked_ips = False
             if response_message is not None and is_a_aaaa_question and response_message.rcode() == dns.rcode.NOERROR:
-                matched_items = self._blocked_ips(response_message)
+                with self.timings.stage("ip_rules"):
+                    matched_items = self._blocked_ips(response_message)
+
                 matched_items1 = [x.ip for x in matched_items if isinstance(x, AllowedIpItem)]
                 matched_items2 = [x.ip for x in matched_items if isinstance(x, BlockedIpItem)]
+                blocked_ips = len(matched_items2) > 0
                 if len(matched_items1) > 0 or len(matched_items2) > 0:
-                    o = {"allowed": matched_items1, "blocked": matched_items2}
-                    upstream_server_error = json.dumps(o, sort_keys=True, ensure_ascii=False)
+                    upstream_server_error = ip_rules_error(matched_items1, matched_items2)
 
             self._insert_request_log(
                 question_type=dns.rdatatype.RdataType(question.rdtype).name,
                 response_status=None if response_message is None else dns.rcode.Rcode(response_message.rcode()).name,
                 ms=stopwatch.elapsed_milliseconds,
                 error=upstream_server_error,
+                blocked_ips=blocked_ips,
             )
 
         return response_message
 
+    def _local_zones(self, request_message: dns.message.Message) -> Optional[dns.message.Message]:
+        with self.timings.stage("local_zones"):
+            response_message = local_zones.answer(request_message)
+
+        if response_message is None:
+            return None
+
+        question: dns.rrset.RRset = request_message.question[0]
+        last = cast(Optional[dns.rrset.RRset], response_message.answer[-1] if len(response_message.answer) > 0 else None)
+        if last is None or last.rdtype != dns.rdatatype.CNAME or question.rdtype == dns.rdatatype.CNAME:
+            return response_message
+
+        if local_zones.zone_of(target := last[0].target) is not None:
+            return response_message
+
+        # a local name pointing outside of the local zones, the rest of the chain comes from the upstreams
+        self.request_domain_cname = str(target).rstrip(".")
+        request_message2 = dns.message.make_query(
+            target, question.rdtype, question.rdclass, id=request_message.id, flags=request_message.flags
+        )
+        if (response_message2 := self._blocked_names(self.request_domain_cname, request_message2)) is None:
+            response_message2 = self._proxy_request(self.request_domain_cname, request_message2)
+
+        response_message.set_rcode(response_message2.rcode())
+        response_message.answer.extend(response_message2.answer)
+        return response_message
+
     def _proxy_request(self, name: str, request_message: dns.message.Message) -> dns.message.Message:
-        response_message: Optional[dns.message.Message] = None
-        if (forwarding_item := self.db.forwarding_rules(name)) is None:
+        if (response_message := self._local_zones(request_message)) is not None:
+            return response_message
+
+        with self.timings.stage("forwarding_rules", name):
+            forwarding_item = self.db.forwarding_rules(name)
+
+        if forwarding_item is None:
             for w in self.config.default:
                 if (response_message := self._dns_query_with_upstream(request_message, w)) is not None:
                     break
         else:
+            rule_hits.hit("forwarding_rules", forwarding_item)
             response_message = self._dns_query_with_upstream(request_message, forwarding_item.group)
 
         if response_message is None:
@@ -343,8 +517,26 @@ def _get_address_family_from_host(host: str) -> Optional[socket.AddressFamily]:
         return socket.AF_INET if isinstance(a, IPv4Address) else socket.AF_INET6
 
 
+def _verify_request(server: socketserver.BaseServer, request: Any, client_address: Any) -> bool:
+    """token buckets of simple.rate_limit, before a request thread is started or anything is parsed"""
+    if rate_limiter.allow_query(client_address[0]):
+        slow_query_log.accepted(request)
+        return True
+
+    if server.socket_type == socket.SOCK_DGRAM and (response := rate_limiter.limited_response(request[0])) is not None:
+        try:
+            request[1].sendto(response, client_address)
+        except OSError:
+            pass
+
+    return False
+
+
 class ThreadingDnsTCPServer(socketserver.ThreadingTCPServer):
-    def __init__(self, server_address: tuple[str, int], config: DnsServerConfig, doh_client: httpx.Client):
+    # SO_REUSEADDR lets another process take over the port on windows
+    allow_reuse_address = not is_running_in_windows
+
+    def __init__(self, server_address: tuple[str, int], config: DnsServerConfig, doh_client: Optional["httpx.Client"]):
         self.daemon_threads = True
         self.config = config
         self.doh_client = doh_client
@@ -354,9 +546,19 @@ class ThreadingDnsTCPServer(socketserver.ThreadingTCPServer):
         # noinspection PyTypeChecker
         super().__init__(server_address, DnsRequestHandler)
 
+    def server_bind(self):
+        # "::" would also take the ipv4 port on linux, the ipv4 server is bound separately
+        if self.address_family == socket.AF_INET6:
+            self.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+
+        super().server_bind()
+
+    def verify_request(self, request: Any, client_address: Any) -> bool:
+        return _verify_request(self, request, client_address)
+
 
 class ThreadingDnsUDPServer(socketserver.ThreadingUDPServer):
-    def __init__(self, server_address: tuple[str, int], config: DnsServerConfig, doh_client: httpx.Client):
+    def __init__(self, server_address: tuple[str, int], config: DnsServerConfig, doh_client: Optional["httpx.Client"]):
         self.daemon_threads = True
         self.config = config
         self.doh_client = doh_client
@@ -365,3 +567,13 @@ class ThreadingDnsUDPServer(socketserver.ThreadingUDPServer):
 
         # noinspection PyTypeChecker
         super().__init__(server_address, DnsRequestHandler)
+
+    def server_bind(self):
+        # "::" would also take the ipv4 port on linux, the ipv4 server is bound separately
+        if self.address_family == socket.AF_INET6:
+            self.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+
+        super().server_bind()
+
+    def verify_request(self, request: Any, client_address: Any) -> bool:
+        return _verify_request(self, request, client_address)
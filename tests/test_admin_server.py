@@ -0,0 +1,145 @@
+import dataclasses
+import http.client
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from typing import final, Optional
+from unittest import mock
+
+from simple.admin_server import AdminServer
+from simple.app_args import app_args
+from simple.config import parse_admin_config
+from simple.db import TheDbJob
+from simple.models import AdminConfig, DnsServerConfig, DnsServerRules, DnsServerRulesConfig
+from simple.profiler import request_profiler
+
+
+@final
+class AdminServerTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        rules = DnsServerRulesConfig(blocked_names={"temp": ["blocked-names-temp.txt"]})
+        admin = AdminConfig(port=5380, token="0123456789abcdef")
+        config = DnsServerConfig(ipv6=False, default=[], upstream={}, rules=rules, admin=admin)
+        self.server = AdminServer(("127.0.0.1", 0), config, Path(self.temp_dir.name))
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def _request(self, method: str, path: str, body: dict = None, headers: Optional[dict] = None) -> tuple[int, dict]:
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+        if headers is None:
+            headers = {"Authorization": "Bearer 0123456789abcdef", "Content-Type": "application/json"}
+
+        try:
+            connection.request(method, path, None if body is None else json.dumps(body), headers)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def test_profile_stacks(self):
+        status, result = self._request("POST", "/profile/stacks?seconds=0.2&threads=all")
+        self.assertEqual(status, 200)
+        self.assertGreater(result["samples"], 0)
+        lines = Path(result["file"]).read_text(encoding="utf-8").splitlines()
+        self.assertTrue(all(int(x.rsplit(" ", 1)[1]) > 0 for x in lines))
+
+    def test_profile_requests(self):
+        def requests():
+            while not finished.is_set():
+                if (profile := request_profiler.maybe_start()) is not None:
+                    sum(range(1000))
+                    request_profiler.finish(profile)
+
+        finished = threading.Event()
+        thread = threading.Thread(target=requests, daemon=True)
+        thread.start()
+        try:
+            status, result = self._request("POST", "/profile/requests?seconds=0.2&fraction=1")
+        finally:
+            finished.set()
+            thread.join()
+
+        self.assertEqual(status, 200)
+        self.assertGreater(result["requests"], 0)
+        self.assertTrue(Path(result["file"]).is_file())
+        self.assertIsNone(request_profiler.maybe_start())
+
+    def test_temp_rules(self):
+        data_dir = Path(self.temp_dir.name)
+        with mock.patch("simple.db.app_args", dataclasses.replace(app_args, data_dir=data_dir)):
+            db_job = TheDbJob()
+            db_job.init_db(DnsServerRules())
+            db_job.db.close()
+            try:
+                # what a web page could post: refused, nothing changed or written
+                body = {"kind": "cloaking_rules", "rule": "bank.example 203.0.113.5", "persist": True}
+                self.assertEqual(self._request("POST", "/rules/temp", body, {"Content-Type": "text/plain"})[0], 401)
+                self.assertListEqual(self._request("GET", "/rules/temp")[1]["cloaking_rules"], [])
+
+                with self.assertLogs("simple.admin_server", "WARNING"):
+                    status, result = self._request(
+                        "POST", "/rules/temp", {"kind": "blocked_names", "rule": "Ads.Example.com", "persist": True}
+                    )
+
+                self.assertEqual(status, 200)
+                self.assertEqual(result["changed"], 1)
+                self.assertEqual(data_dir.joinpath("blocked-names-temp.txt").read_text(), "ads.example.com\n")
+
+                status, result = self._request("POST", "/rules/temp", {"kind": "blocked_ips", "rule": "10.0.0.0/8"})
+                self.assertIsNone(result["file"])
+                self.assertIsNotNone(TheDbJob.blocked_ip_rules.match("127.0.0.1", "10.1.2.3"))
+
+                status, result = self._request("GET", "/rules/temp")
+                self.assertListEqual(result["blocked_names"], ["ads.example.com"])
+                self.assertListEqual(result["blocked_ips"], ["10.0.0.0/8"])
+
+                status, result = self._request(
+                    "DELETE", "/rules/temp", {"kind": "blocked_names", "rule": "ads.example.com", "persist": True}
+                )
+                self.assertEqual(result["changed"], 1)
+                self.assertEqual(data_dir.joinpath("blocked-names-temp.txt").read_text(), "")
+
+                # no temp file for cloaking_rules in this config
+                self.assertEqual(
+                    self._request("POST", "/rules/temp", {"kind": "cloaking_rules", "rule": "a.com 1.2.3.4", "persist": True})[0], 400
+                )
+                self.assertEqual(self._request("POST", "/rules/temp", {"kind": "forwarding_rules", "rule": "a.com"})[0], 400)
+                self.assertEqual(self._request("POST", "/rules/temp", {"kind": "cloaking_rules", "rule": "a.com"})[0], 400)
+            finally:
+                TheDbJob.allowed_ip_rules = TheDbJob.blocked_ip_rules = TheDbJob.cloaking = None
+                TheDbJob.allowed_name_filter = TheDbJob.blocked_name_filter = None
+
+    def test_errors(self):
+        self.assertEqual(self._request("GET", "/nowhere")[0], 404)
+        self.assertEqual(self._request("POST", "/profile/stacks?seconds=abc")[0], 400)
+
+    def test_refused(self):
+        token = "Bearer 0123456789abcdef"
+        # a web page posting text/plain needs no cors preflight, it has no token either
+        body = {"kind": "blocked_names", "rule": "ads.example.com", "persist": True}
+        self.assertEqual(self._request("POST", "/rules/temp", body, {"Content-Type": "text/plain"})[0], 401)
+        self.assertEqual(self._request("POST", "/rules/temp", body, {"Authorization": token, "Content-Type": "text/plain"})[0], 415)
+        self.assertEqual(self._request("GET", "/upstreams", None, {"Authorization": "Bearer wrong"})[0], 401)
+        self.assertEqual(self._request("GET", "/upstreams", None, {"Authorization": token, "Host": "rebind.example.com"})[0], 403)
+        self.assertEqual(self._request("GET", "/upstreams", None, {"Authorization": token})[0], 200)
+
+    def test_config(self):
+        self.assertEqual(parse_admin_config(None), AdminConfig())
+        token = "0123456789abcdef"
+        self.assertEqual(parse_admin_config({"port": 5380, "token": token}), AdminConfig(port=5380, token=token))
+        self.assertRaises(ValueError, parse_admin_config, {"port": 5380})
+        self.assertRaises(ValueError, parse_admin_config, {"port": 5380, "token": "short"})
+        self.assertRaises(ValueError, parse_admin_config, {"host": "localhost", "port": 5380, "token": token})
+        self.assertRaises(ValueError, parse_admin_config, {"port": 70000, "token": token})
+
+
+if __name__ == "__main__":
+    unittest.main()
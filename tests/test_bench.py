@@ -0,0 +1,92 @@
+import argparse
+import tempfile
+import unittest
+from pathlib import Path
+from typing import final
+
+import dns.exception
+import dns.message
+import dns.query
+import dns.rcode
+
+from simple.bench import percentile
+from simple.bench.__main__ import prepare_data_dir
+from simple.bench.fake_upstream import FakeUpstreamOptions, start_fake_upstream
+from simple.bench.rules import check_conformance, generate_rules_dataset, reference_matcher, server_matcher
+from simple.models import DnsServerUpstreamProtocol
+
+
+@final
+class BenchTests(unittest.TestCase):
+    def test_percentile(self):
+        values = [float(x) for x in range(1, 1001)]
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile(values, 50), 500)
+        self.assertEqual(percentile(values, 99), 990)
+        self.assertEqual(percentile(values, 99.9), 999)
+        self.assertEqual(percentile(values, 100), 1000)
+        self.assertEqual(percentile([3.0], 99.9), 3)
+
+    def test_fake_upstream(self):
+        protocols = [DnsServerUpstreamProtocol.UDP, DnsServerUpstreamProtocol.TCP]
+        with start_fake_upstream(FakeUpstreamOptions(), protocols) as ports:
+            request_message = dns.message.make_query("www.example.com", "A")
+            r1 = dns.query.udp(request_message, where="127.0.0.1", port=ports[DnsServerUpstreamProtocol.UDP], timeout=2)
+            r2 = dns.query.tcp(request_message, where="127.0.0.1", port=ports[DnsServerUpstreamProtocol.TCP], timeout=2)
+
+        self.assertEqual(r1.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(len(r1.answer), 1)
+        self.assertEqual(r1.answer, r2.answer)
+
+        with start_fake_upstream(FakeUpstreamOptions(loss=1), [DnsServerUpstreamProtocol.UDP]) as ports:
+            request_message = dns.message.make_query("www.example.com", "A")
+            with self.assertRaises(dns.exception.Timeout):
+                dns.query.udp(request_message, where="127.0.0.1", port=ports[DnsServerUpstreamProtocol.UDP], timeout=0.2)
+
+    def test_rules_conformance(self):
+        dataset = generate_rules_dataset(500, glob_share=0.2, samples=50)
+        self.assertGreater(len(dataset.rules.blocked_names), 0)
+        self.assertTrue(any(x.use_glob for x in dataset.rules.blocked_names))
+
+        reference = reference_matcher(dataset.rules)
+        report = check_conformance(dataset, reference, server_matcher(dataset.rules))
+        self.assertGreater(report["checks"], 0)
+        self.assertEqual(report["mismatches"], 0)
+
+        class NeverMatches:
+            def block_names_ex(self, client_ip, name):
+                return None
+
+            def block_ips_ex(self, client_ip, ip):
+                return None
+
+            def cloaking_rules_ex(self, name):
+                return []
+
+            def forwarding_rules(self, name):
+                return None
+
+        report = check_conformance(dataset, reference, NeverMatches())
+        self.assertGreater(report["mismatches"], 0)
+        self.assertGreater(len(report["examples"]), 0)
+
+    def test_prepare_data_dir(self):
+        args = argparse.Namespace(blocked_rules=10, cloaking_rules=10, hot_names=10)
+        upstream = {"ip": ["127.0.0.1"], "preferred_protocol": "udp", "port": 5300}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # a fresh install: data.sqlite3 without config.json is still somebody's data dir
+            data_dir = Path(temp_dir, "data")
+            data_dir.mkdir()
+            data_dir.joinpath("data.sqlite3").write_bytes(b"")
+            self.assertRaises(ValueError, prepare_data_dir, data_dir, args, upstream)
+            self.assertTrue(data_dir.joinpath("data.sqlite3").exists())
+
+            data_dir = Path(temp_dir, "bench")
+            prepare_data_dir(data_dir, args, upstream)
+            # a directory of a previous run is reused
+            hot_names, _, _ = prepare_data_dir(data_dir, args, upstream)
+            self.assertEqual(len(hot_names), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+from typing import final
+
+from simple.binary_log import (
+    BinaryRequestLogWriter,
+    convert_to_csv,
+    convert_to_sqlite,
+    read_request_logs,
+    read_segment,
+    segment_files,
+    segment_record_count,
+)
+from simple.models import RequestLog, RequestLogsConfig
+from simple.request_logs import RequestLogStore
+
+
+def _request_log(i: int, created: str) -> RequestLog:
+    return RequestLog(
+        request_id="00000000-0000-4000-8000-{:012x}".format(i),
+        client_ip="192.168.1.{}".format(i % 3),
+        name="www{}.example.com".format(i % 5),
+        cname=None if i % 2 else "cname.example.com",
+        question_type="A",
+        response_status="NOERROR",
+        server="https://1.1.1.1",
+        ms=i + 0.25,
+        error=None if i % 7 else "timeout",
+        created=created,
+    )
+
+
+@final
+class BinaryLogTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        items = [_request_log(i, "2026-10-01 23:59:59") for i in range(50)] + [_request_log(i, "2026-10-02 00:00:01") for i in range(30)]
+        writer = BinaryRequestLogWriter(self.directory)
+        writer.insert(*items[:10])
+        writer.insert(*items[10:])
+
+        # the open segment can be read already
+        self.assertListEqual(list(read_request_logs(self.directory, since="2026-10-02")), items[50:])
+        writer.close()
+
+        self.assertListEqual(list(read_request_logs(self.directory)), items)
+        self.assertListEqual([x for x, _ in segment_files(self.directory)], ["2026-10-01", "2026-10-02"])
+        self.assertListEqual([segment_record_count(x) for _, x in segment_files(self.directory)], [50, 30])
+
+        store = RequestLogStore(self.directory)
+        self.assertEqual(store.rows("2026-10-01"), 50)
+        self.assertListEqual(store.prune(RequestLogsConfig(retention_days=1), today=date(2026, 10, 2)), ["2026-10-01"])
+        self.assertListEqual([x for x, _ in segment_files(self.directory)], ["2026-10-02"])
+
+    def test_rotation_and_truncated_tail(self):
+        writer = BinaryRequestLogWriter(self.directory, max_segment_bytes=1)
+        writer.insert(*[_request_log(i, "2026-10-01 10:00:00") for i in range(3)])
+        writer.insert(*[_request_log(i, "2026-10-01 10:00:00") for i in range(3, 6)])
+        writer.close()
+        self.assertEqual(len(segment_files(self.directory)), 2)
+
+        _, path = segment_files(self.directory)[-1]
+        data = path.read_bytes()
+        path.write_bytes(data[: len(data) - 20])
+        self.assertLess(len(list(read_segment(path))), 3)
+
+    def test_convert(self):
+        items = [_request_log(i, "2026-10-01 10:00:00") for i in range(20)]
+        writer = BinaryRequestLogWriter(self.directory)
+        writer.insert(*items)
+        writer.close()
+
+        count = convert_to_sqlite(read_request_logs(self.directory), self.directory.joinpath("out.sqlite3"))
+        self.assertEqual(count, 20)
+        count = convert_to_csv(read_request_logs(self.directory), self.directory.joinpath("out.csv"))
+        self.assertEqual(count, 20)
+        self.assertEqual(len(self.directory.joinpath("out.csv").read_text().splitlines()), 21)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from typing import final
+
+import dns.rdatatype
+
+from simple.cloaking_rules import CloakingRules
+from simple.models import CloakingItemRecordType
+from simple.parse_rules import parse_cloaking_rules
+
+
+@final
+class CloakingRulesTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        text = """
+            =example.com        10.0.0.1
+            =example.com        10.0.0.2
+            example.com         10.0.0.3
+            www.example.com     example.com
+            a.example.com       b.example.com
+            b.example.com       c.example.com
+            c.example.com       ::1
+            loop1.com           loop2.com
+            loop2.com           loop1.com
+            *.cdn.net           10.0.0.4
+            x.cdn.net           nowhere.org
+        """
+        cls.rules = CloakingRules(parse_cloaking_rules("default", text))
+
+    def _mapped(self, name: str) -> list[str]:
+        return sorted(x.mapped for x, _ in self.rules.lookup(name))
+
+    def test_precedence(self):
+        self.assertListEqual(self._mapped("example.com"), ["10.0.0.1", "10.0.0.2"])
+        self.assertListEqual(self._mapped("EXAMPLE.com"), ["10.0.0.1", "10.0.0.2"])
+        self.assertListEqual(self._mapped("abc.example.com"), ["10.0.0.3"])
+        self.assertListEqual(self._mapped("y.cdn.net"), ["10.0.0.4"])
+        self.assertListEqual(self._mapped("x.cdn.net"), ["nowhere.org"])
+        self.assertListEqual(self._mapped("example.org"), [])
+
+    def test_cname_chain(self):
+        self.assertListEqual(self._mapped("www.example.com"), ["10.0.0.1", "10.0.0.2"])
+
+        records = self.rules.lookup("a.example.com")
+        self.assertEqual(len(records), 1)
+        item, rdata = records[0]
+        self.assertEqual(item.record_type, CloakingItemRecordType.AAAA)
+        self.assertEqual(rdata.rdtype, dns.rdatatype.AAAA)
+
+        # stops where the loop closes
+        self.assertListEqual(self._mapped("loop1.com"), ["loop1.com"])
+        with self.assertLogs("simple.cloaking_rules", "WARNING") as logs:
+            CloakingRules(parse_cloaking_rules("default", "a.com b.com\nb.com c.com\nc.com a.com\n"))
+
+        self.assertIn("cname loop a.com -> b.com -> c.com -> a.com", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
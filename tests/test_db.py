@@ -148,6 +148,16 @@ xmpp-service-prod.ol.epicgames.com                      xmpp-service-prod-weight
         result = self.db_job.block_ips_ex(self.group_default, "10.10.10.10")
         self.assertEqual(BlockedIpItem(group=self.group_default, ip="10.10.10.10", use_glob=False), result)
 
+        result = self.db_job.block_ips_many(self.group_ip_1, ["10.10.10.10", "10.10.10.11", "10.10.10.13", "10.10.10.10"])
+        self.assertDictEqual(
+            {
+                "10.10.10.10": AllowedIpItem(group=self.group_ip_1, ip="10.10.10.10", use_glob=False),
+                "10.10.10.11": AllowedIpItem(group=self.group_default, ip="10.10.10.1[1-2]", use_glob=True),
+            },
+            result,
+        )
+        self.assertTrue(self.db_job.has_ip_rules(self.group_default))
+
     def test_blocked_names(self):
         result = self.db_job.block_names_ex(self.group_ip_1, "abc.co")
         self.assertEqual(AllowedNameItem(group=self.group_default, name="co", use_glob=False), result)
@@ -201,3 +211,33 @@ xmpp-service-prod.ol.epicgames.com                      xmpp-service-prod-weight
 
         result = self.db_job.forwarding_rules("a.xyz.com")
         self.assertEqual(result, ForwardingItem(group=self.forwarding_group1, name="xyz.com", use_glob=False))
+
+    def test_temp_rules(self):
+        blocked_ips = parse_blocked_ips("temp", "172.16.0.0/12")
+        self.assertEqual(self.db_job.add_rules("blocked_ips", blocked_ips), 1)
+        self.assertEqual(self.db_job.add_rules("blocked_ips", blocked_ips), 0)
+        self.assertEqual(self.db_job.blocked_ips("192.168.0.100", "172.20.1.1"), blocked_ips[0])
+        self.assertListEqual(self.db_job.rules_by_group("blocked_ips", "temp"), blocked_ips)
+
+        # a cname rule picks up the changed name without a rebuild
+        name = "xmpp-service-prod.ol.epicgames.com"
+        cloaking_rules = parse_cloaking_rules("temp", "ol.epicgames.com 10.0.0.1")
+        self.assertListEqual([x.mapped for x in self.db_job.cloaking_rules_ex(name)], ["xmpp-service-prod-weighted.ol.epicgames.com"])
+        self.assertEqual(self.db_job.add_rules("cloaking_rules", cloaking_rules), 1)
+        self.assertListEqual([x.mapped for x in self.db_job.cloaking_rules_ex(name)], ["10.0.0.1"])
+
+        blocked_names = parse_blocked_names("temp", "ads.example.org")
+        self.db_job.add_rules("blocked_names", blocked_names)
+        self.assertEqual(self.db_job.blocked_names("192.168.0.100", "x.ads.example.org"), blocked_names[0])
+
+        self.assertEqual(self.db_job.remove_rules("blocked_ips", blocked_ips), 1)
+        self.assertEqual(self.db_job.remove_rules("cloaking_rules", cloaking_rules), 1)
+        self.assertEqual(self.db_job.remove_rules("blocked_names", blocked_names), 1)
+        self.assertIsNone(self.db_job.blocked_ips("192.168.0.100", "172.20.1.1"))
+        self.assertListEqual([x.mapped for x in self.db_job.cloaking_rules_ex(name)], ["xmpp-service-prod-weighted.ol.epicgames.com"])
+        self.assertIsNone(self.db_job.blocked_names("192.168.0.100", "x.ads.example.org"))
+        self.assertListEqual(self.db_job.rules_by_group("cloaking_rules", "temp"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from typing import final
+
+import dns.edns
+import dns.message
+
+from simple.config import parse_ecs_config
+from simple.ecs import client_response, parse_request, udp_payload, upstream_query
+from simple.models import EcsConfig, EcsMode
+
+
+@final
+class EcsTests(unittest.TestCase):
+    def test_upstream_query(self):
+        client_subnet = dns.edns.ECSOption("192.168.1.7", 32)
+        request_message = dns.message.make_query("example.com", "A", use_edns=0, options=[client_subnet])
+        request_message.id = 42
+
+        query_message = upstream_query(request_message, EcsConfig())
+        self.assertEqual(query_message.id, 42)
+        self.assertEqual(query_message.options, ())
+        # nothing to strip, nothing to copy
+        plain = dns.message.make_query("example.com", "A")
+        self.assertIs(upstream_query(plain, EcsConfig()), plain)
+
+        config = EcsConfig(mode=EcsMode.SUBNET, address="203.0.113.77")
+        for message in [request_message, plain]:
+            query_message = upstream_query(message, config)
+            self.assertEqual([x.to_text() for x in query_message.options], ["ECS 203.0.113.0/24 scope/0"])
+            self.assertEqual(query_message.question, message.question)
+
+        query_message = upstream_query(plain, EcsConfig(mode=EcsMode.SUBNET, address="2001:db8:1:2:3::1"))
+        self.assertEqual([x.to_text() for x in query_message.options], ["ECS 2001:db8:1::/56 scope/0"])
+
+    def test_client_response(self):
+        request_message = dns.message.make_query("example.com", "A", use_edns=0)
+        response_message = dns.message.make_response(request_message)
+        response_message.use_edns(0, options=[dns.edns.ECSOption("203.0.113.0", 24, 20)])
+        self.assertEqual(client_response(request_message, response_message).options, ())
+        self.assertEqual(response_message.edns, 0)
+
+        # the opt record was only there for the subnet
+        plain = dns.message.make_query("example.com", "A")
+        response_message = dns.message.make_response(upstream_query(plain, EcsConfig(mode=EcsMode.SUBNET, address="203.0.113.77")))
+        self.assertEqual(response_message.edns, 0)
+        self.assertEqual(client_response(plain, response_message).edns, -1)
+
+    def test_parse_request(self):
+        request_message = dns.message.make_query("example.com", "A", use_edns=0, payload=4096)
+        self.assertEqual(udp_payload(parse_request(request_message.to_wire())), 4096)
+        self.assertEqual(udp_payload(parse_request(dns.message.make_query("example.com", "A").to_wire())), 512)
+        self.assertEqual(udp_payload(parse_request(dns.message.make_query("example.com", "A", use_edns=0, payload=256).to_wire())), 512)
+
+    def test_parse_ecs_config(self):
+        self.assertEqual(parse_ecs_config(None), EcsConfig())
+        config = parse_ecs_config({"mode": "subnet", "address": "203.0.113.77", "ipv4_prefix": 20})
+        self.assertEqual(config, EcsConfig(mode=EcsMode.SUBNET, address="203.0.113.77", ipv4_prefix=20))
+        self.assertRaises(ValueError, parse_ecs_config, {"mode": "subnet"})
+        self.assertRaises(ValueError, parse_ecs_config, {"mode": "pass"})
+        self.assertRaises(ValueError, parse_ecs_config, {"ipv4_prefix": 33})
@@ -0,0 +1,77 @@
+import time
+import unittest
+from typing import final
+from unittest import mock
+
+from simple.happy_eyeballs import FamilyHealth, happy_eyeballs
+
+
+@final
+class HappyEyeballsTests(unittest.TestCase):
+    def test_happy_eyeballs(self):
+        def answer(value: str, seconds: float = 0):
+            def run():
+                time.sleep(seconds)
+                return value
+
+            return run
+
+        def fail():
+            raise TimeoutError("no route")
+
+        self.assertEqual(happy_eyeballs([answer("a")], 10), (0, "a"))
+        # the slow first attempt loses to the second one started after the delay
+        start = time.perf_counter()
+        self.assertEqual(happy_eyeballs([answer("a", 1), answer("b")], 0.05), (1, "b"))
+        self.assertLess(time.perf_counter() - start, 0.5)
+        # a failure starts the next one without waiting
+        start = time.perf_counter()
+        self.assertEqual(happy_eyeballs([fail, answer("b")], 10), (1, "b"))
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertRaises(TimeoutError, happy_eyeballs, [fail, fail], 10)
+
+    def test_family_health(self):
+        health = FamilyHealth()
+        self.assertListEqual(health.order("google", [6, 4]), [6, 4])
+        self.assertEqual(health.attempt_delay("google", [6, 4]), 0.25)
+
+        with mock.patch("simple.happy_eyeballs.time.monotonic", return_value=100.0):
+            health.failure("google", 6)
+            health.success("google", 4, 20)
+            self.assertListEqual(health.order("google", [6, 4]), [4, 6])
+            self.assertEqual(health.attempt_delay("google", [4, 6]), 0.04)
+            self.assertEqual(health.attempt_delay("google", [6, 4]), 0.04)
+            self.assertDictEqual(
+                health.report()["google/ipv6"], {"srtt_ms": None, "p95_ms": None, "timeout_ms": 2000, "failures": 1, "down": True}
+            )
+
+        # the backoff is over, measured families are ordered by latency
+        with mock.patch("simple.happy_eyeballs.time.monotonic", return_value=102.0):
+            health.success("google", 6, 10)
+            self.assertListEqual(health.order("google", [6, 4]), [6, 4])
+            self.assertListEqual(health.order("quad9", [6, 4]), [6, 4])
+
+    def test_adaptive_timeout(self):
+        health = FamilyHealth()
+        self.assertEqual(health.timeout("google", 4), 2.0)
+        for ms in [10, 12, 11, 9, 10, 13, 10, 40]:
+            health.success("google", 4, ms)
+
+        # 4 x the p95 rtt, never under 0.5 s, the hedge starts at the p95
+        self.assertEqual(health.timeout("google", 4), 0.5)
+        self.assertEqual(health.attempt_delay("google", [4, 6]), 0.013)
+        for ms in [300] * 8:
+            health.success("google", 4, ms)
+
+        self.assertEqual(health.timeout("google", 4), 1.2)
+        self.assertEqual(health.attempt_delay("google", [4, 6]), 0.3)
+        # timeouts count as samples of at least the timeout, the next ones grow
+        for _ in range(8):
+            health.failure("google", 4, 1.2)
+
+        self.assertEqual(health.timeout("google", 4), 4.8)
+        self.assertEqual(health.report()["google/ipv4"]["timeout_ms"], 4800)
+
+
+if __name__ == "__main__":
+    unittest.main()
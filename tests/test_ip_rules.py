@@ -0,0 +1,72 @@
+import random
+import unittest
+from ipaddress import ip_address, ip_network, IPv4Address
+from typing import final
+
+from simple.ip_rules import IpRules, RadixTree
+from simple.models import BlockedIpItem
+from simple.parse_rules import parse_blocked_ips
+
+
+@final
+class IpRulesTests(unittest.TestCase):
+    def test_radix_tree(self):
+        r = random.Random(7)
+        tree: RadixTree[str] = RadixTree(32)
+        networks = [ip_network((r.getrandbits(32), r.randint(0, 32)), strict=False) for _ in range(500)]
+        networks.extend([ip_network("0.0.0.0/0"), ip_network("10.0.0.0/8"), ip_network("10.1.0.0/16"), ip_network("10.1.2.3/32")])
+        for x in networks:
+            tree.insert(int(x.network_address), x.prefixlen, str(x))
+
+        addresses = [IPv4Address(r.getrandbits(32)) for _ in range(500)] + [ip_address("10.1.2.3")]
+        for address in addresses:
+            expected = sorted(str(x) for x in networks if address in x)
+            self.assertListEqual(sorted(tree.lookup(int(address))), expected)
+
+    def test_match(self):
+        text = """
+            10.0.0.0/8
+            10.1.2.3
+            192.168.1.*
+            172.16.1[0-9].1
+            2001:DB8::/32
+            bad/99
+        """
+        items = parse_blocked_ips("default", text)
+        items.extend(parse_blocked_ips("192.168.1.*", "10.0.0.0/16"))
+        self.assertIn(BlockedIpItem(group="default", ip="2001:db8::/32", use_glob=False), items)
+        self.assertEqual(len(items), 6)
+
+        rules = IpRules(items)
+        self.assertEqual(rules.match("127.0.0.1", "10.200.0.1").ip, "10.0.0.0/8")
+        self.assertEqual(rules.match("127.0.0.1", "10.1.2.3").ip, "10.1.2.3")
+        self.assertEqual(rules.match("127.0.0.1", "192.168.1.77").ip, "192.168.1.*")
+        self.assertEqual(rules.match("127.0.0.1", "172.16.15.1").ip, "172.16.1[0-9].1")
+        self.assertEqual(rules.match("127.0.0.1", "2001:db8:ffff::1").ip, "2001:db8::/32")
+        self.assertIsNone(rules.match("127.0.0.1", "2001:db9::1"))
+        self.assertIsNone(rules.match("127.0.0.1", "11.0.0.1"))
+
+        # a client group comes before the default group, an identical text before both
+        self.assertEqual(rules.match("192.168.1.5", "10.0.0.1"), BlockedIpItem(group="192.168.1.*", ip="10.0.0.0/16", use_glob=False))
+        self.assertEqual(rules.match("192.168.1.5", "10.1.2.3").group, "default")
+
+    def test_match_many(self):
+        rules = IpRules(parse_blocked_ips("192.168.1.*", "10.0.0.0/8"))
+        self.assertFalse(rules.applies_to("127.0.0.1"))
+        self.assertDictEqual(rules.match_many("127.0.0.1", ["10.0.0.1"]), {})
+        self.assertTrue(rules.applies_to("192.168.1.5"))
+        self.assertListEqual(
+            list(rules.match_many("192.168.1.5", ["10.0.0.1", "11.0.0.1", "10.0.0.2", "10.0.0.1"])), ["10.0.0.1", "10.0.0.2"]
+        )
+
+    def test_groups_like_sql(self):
+        # sqlite glob negates with [^...] and reads [!...] as a set with !, not the way fnmatch does
+        rules = IpRules(parse_blocked_ips("192.168.1.[^5]", "10.0.0.0/8") + parse_blocked_ips("192.168.2.[!5]", "11.0.0.0/8"))
+        self.assertTrue(rules.applies_to("192.168.1.6"))
+        self.assertFalse(rules.applies_to("192.168.1.5"))
+        self.assertTrue(rules.applies_to("192.168.2.!"))
+        self.assertFalse(rules.applies_to("192.168.2.6"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from typing import final
+
+import dns.flags
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.zone
+
+from simple.config import parse_zones_config
+from simple.local_zones import LocalZones
+
+__zone__ = """
+$TTL 300
+@ IN SOA ns.corp.example. admin.corp.example. 1 3600 600 86400 60
+@ IN NS ns
+ns IN A 10.0.0.1
+web IN A 10.0.0.2
+www IN CNAME web
+cdn IN CNAME cdn.example.com.
+_ldap._tcp IN SRV 0 0 389 dc
+*.apps IN A 10.0.0.3
+lab IN NS ns.lab.other.
+"""
+
+
+@final
+class LocalZonesTests(unittest.TestCase):
+    def setUp(self):
+        self.zones = LocalZones()
+        self.zones.set_zones([dns.zone.from_text(__zone__, origin="corp.example.", relativize=False)])
+
+    def answer(self, name: str, rdtype: str = "A") -> dns.message.Message:
+        response_message = self.zones.answer(dns.message.make_query(name, rdtype))
+        assert response_message is not None
+        self.assertTrue(response_message.flags & dns.flags.AA)
+        return response_message
+
+    def test_answer(self):
+        response_message = self.answer("WEB.corp.example")
+        self.assertEqual(response_message.rcode(), dns.rcode.NOERROR)
+        self.assertEqual([x.to_text() for x in response_message.answer], ["web.corp.example. 300 IN A 10.0.0.2"])
+
+        response_message = self.answer("www.corp.example")
+        self.assertEqual([x.rdtype for x in response_message.answer], [dns.rdatatype.CNAME, dns.rdatatype.A])
+        # the cname leaving the local zones is the last record, the caller resolves the rest
+        response_message = self.answer("cdn.corp.example")
+        self.assertEqual([str(x[0].target) for x in response_message.answer], ["cdn.example.com."])
+
+        response_message = self.answer("_ldap._tcp.corp.example", "SRV")
+        self.assertEqual(len(response_message.answer), 1)
+        response_message = self.answer("x.apps.corp.example")
+        self.assertEqual([x.to_text() for x in response_message.answer], ["x.apps.corp.example. 300 IN A 10.0.0.3"])
+
+    def test_negative(self):
+        # NODATA: an existing name, an empty non-terminal
+        for name in ["web.corp.example", "_tcp.corp.example"]:
+            response_message = self.answer(name, "AAAA")
+            self.assertEqual(response_message.rcode(), dns.rcode.NOERROR)
+            self.assertEqual(len(response_message.answer), 0)
+            self.assertEqual(response_message.authority[0].rdtype, dns.rdatatype.SOA)
+
+        response_message = self.answer("nothing.corp.example")
+        self.assertEqual(response_message.rcode(), dns.rcode.NXDOMAIN)
+        self.assertEqual(response_message.authority[0].ttl, 60)
+
+    def test_outside(self):
+        for name in ["example.com", "corp.example.com", "host.lab.corp.example"]:
+            self.assertIsNone(self.zones.answer(dns.message.make_query(name, "A")))
+
+    def test_parse_zones_config(self):
+        self.assertDictEqual(parse_zones_config(None), {})
+        self.assertDictEqual(parse_zones_config({"Corp.Example.": "corp.zone"}), {"corp.example": ["corp.zone"]})
+        self.assertRaises(ValueError, parse_zones_config, {"corp.example": []})
+        self.assertRaises(ValueError, parse_zones_config, ["corp.zone"])
@@ -0,0 +1,100 @@
+import json
+import socket
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from typing import final
+
+from simple.config import parse_request_logs_config
+from simple.log_sinks import AsyncSink, JsonLinesSink, request_log_sinks, StreamSink
+from simple.models import RequestLog, RequestLogsConfig, RequestLogSinkType
+
+
+def _request_log(name: str) -> RequestLog:
+    return RequestLog(
+        request_id="1", client_ip="127.0.0.1", name=name, cname=None, question_type="A", response_status="NOERROR", server=None, ms=1.5
+    )
+
+
+@final
+class LogSinksTests(unittest.TestCase):
+    def test_json_lines_sink(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory).joinpath("requests.jsonl")
+            sink = JsonLinesSink(path, max_bytes=400, backups=2)
+            for i in range(10):
+                sink.insert(_request_log(f"{i}.example.com"), _request_log(f"{i}.example.org"))
+
+            sink.close()
+            # only `backups` rotated files are kept
+            names = {x.name for x in Path(directory).iterdir()}
+            self.assertLessEqual({"requests.jsonl.1", "requests.jsonl.2"}, names)
+            self.assertNotIn("requests.jsonl.3", names)
+            lines = path.with_name("requests.jsonl.1").read_text().splitlines()
+            self.assertEqual(json.loads(lines[0])["question_type"], "A")
+
+    def test_stream_sink(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
+            server.bind(("127.0.0.1", 0))
+            server.settimeout(5)
+            sink = StreamSink("127.0.0.1", server.getsockname()[1])
+            sink.insert(_request_log("example.com"), _request_log("example.org"))
+            sink.close()
+            self.assertEqual(json.loads(server.recv(4096))["name"], "example.com")
+            self.assertEqual(json.loads(server.recv(4096))["name"], "example.org")
+
+        with socket.create_server(("127.0.0.1", 0)) as server:
+            server.settimeout(5)
+            sink = StreamSink("127.0.0.1", server.getsockname()[1], tcp=True)
+            sink.insert(_request_log("example.com"), _request_log("example.org"))
+            connection, _ = server.accept()
+            with connection:
+                connection.settimeout(5)
+                data = b""
+                while data.count(b"\n") < 2:
+                    data += connection.recv(4096)
+
+            sink.close()
+            self.assertListEqual([json.loads(x)["name"] for x in data.splitlines()], ["example.com", "example.org"])
+
+    def test_async_sink(self):
+        released = threading.Event()
+        received = []
+
+        class SlowSink:
+            def insert(self, *request_logs: RequestLog):
+                released.wait(5)
+                received.extend(request_logs)
+
+            def close(self):
+                pass
+
+        # a stuck sink fills its own buffer and drops, put never waits
+        sink = AsyncSink("slow", SlowSink, buffer=2).start()
+        sink.put([_request_log("a.example.com")])
+        while not sink.buffer.empty():
+            pass
+
+        sink.put([_request_log(f"{i}.example.com") for i in range(5)])
+        self.assertEqual(sink.dropped, 3)
+        released.set()
+        sink.close()
+        self.assertListEqual([x.name for x in received], ["a.example.com", "0.example.com", "1.example.com"])
+
+    def test_config(self):
+        self.assertListEqual([x.type for x in request_log_sinks(RequestLogsConfig())], [RequestLogSinkType.SQLITE])
+        config = parse_request_logs_config(
+            {"backend": "binary", "sinks": [{"type": "jsonl", "buffer": 100}, {"type": "udp", "address": "::1", "port": 5140}]}
+        )
+        self.assertListEqual([x.type for x in request_log_sinks(config)], [RequestLogSinkType.JSONL, RequestLogSinkType.UDP])
+        self.assertListEqual(
+            [x.type for x in request_log_sinks(parse_request_logs_config({"backend": "binary"}))], [RequestLogSinkType.BINARY]
+        )
+        self.assertRaises(ValueError, parse_request_logs_config, {"sinks": [{"type": "kafka"}]})
+        self.assertRaises(ValueError, parse_request_logs_config, {"sinks": [{"type": "tcp", "address": "127.0.0.1"}]})
+        self.assertRaises(ValueError, parse_request_logs_config, {"sinks": [{"type": "syslog", "facility": "nope"}]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from typing import final
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+from simple.config import parse_config_from_object
+from simple.minimal_responses import trim_response
+
+
+@final
+class MinimalResponsesTests(unittest.TestCase):
+    def response(self, rdtype: str, answer: list[str], rcode: dns.rcode.Rcode = dns.rcode.NOERROR) -> dns.message.Message:
+        response_message = dns.message.make_response(dns.message.make_query("www.example.com", rdtype))
+        response_message.set_rcode(rcode)
+        response_message.answer = [dns.rrset.from_text(*x.split(" ", 4)) for x in answer]
+        response_message.authority = [
+            dns.rrset.from_text("example.com.", 300, "IN", "NS", "ns1.example.com."),
+            dns.rrset.from_text("example.com.", 300, "IN", "SOA", "ns1.example.com. admin.example.com. 1 3600 600 86400 60"),
+        ]
+        response_message.additional = [dns.rrset.from_text("ns1.example.com.", 300, "IN", "A", "192.0.2.53")]
+        return response_message
+
+    def test_trim_response(self):
+        response_message = trim_response(self.response("A", ["www.example.com. 300 IN A 192.0.2.1"]))
+        self.assertEqual(len(response_message.answer), 1)
+        self.assertEqual((response_message.authority, response_message.additional), ([], []))
+
+        # negative answers keep the soa, a cname chain to nothing of the type is NODATA
+        for response_message in [
+            self.response("A", [], dns.rcode.NXDOMAIN),
+            self.response("AAAA", ["www.example.com. 300 IN CNAME web.example.com."]),
+        ]:
+            response_message = trim_response(response_message)
+            self.assertEqual([x.rdtype for x in response_message.authority], [dns.rdatatype.SOA])
+            self.assertEqual(response_message.additional, [])
+
+    def test_config(self):
+        o = {"default": ["google"], "upstream": {"google": ["8.8.8.8"]}}
+        self.assertFalse(parse_config_from_object(dict(o)).minimal_responses)
+        self.assertTrue(parse_config_from_object({**o, "minimal_responses": True}).minimal_responses)
+        self.assertRaises(ValueError, parse_config_from_object, {**o, "minimal_responses": "yes"})
+
+
+if __name__ == "__main__":
+    unittest.main()
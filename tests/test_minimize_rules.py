@@ -0,0 +1,95 @@
+import unittest
+from typing import final
+
+from simple.config import parse_config_from_object
+from simple.db import TheDbJob
+from simple.minimize_rules import minimize_rules
+from simple.models import DnsServerRules
+from simple.parse_rules import parse_allowed_ips, parse_allowed_names, parse_blocked_ips, parse_blocked_names
+
+
+@final
+class MinimizeRulesTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        o = {
+            "default": ["google"],
+            "upstream": {"google": ["8.8.8.8"]},
+            "rules": {"blocked_names": {"default": "a.txt", "192.168.1.*": "b.txt", "feed": "https://example.com/feed.txt"}},
+        }
+        cls.config = parse_config_from_object(o)
+        blocked_names = parse_blocked_names("default", "example.com\nads.example.com\n=www.example.com\nad*.example.com\n")
+        blocked_names += parse_blocked_names("default", "ads.example.com\n=tracker.example.org\ntracker.example.org\n")
+        blocked_names += parse_blocked_names("192.168.1.*", "example.com\nexample.net\ncdn.example.net\n")
+        blocked_names += parse_blocked_names("feed", "example.org\nx.example.org\n")
+        blocked_names += parse_blocked_names("temp", "ads.example.com\n")
+        blocked_names += parse_blocked_names("default", "example.info\nx.allowed.example.info\nads.example_x.info\nexample_x.info\n")
+        allowed_names = parse_allowed_names("default", "allowed.example.info\n=ok.example.com\n")
+        blocked_ips = parse_blocked_ips("default", "10.0.0.0/8\n10.1.2.3\n10.1.0.0/16\n192.168.0.1\n10.*\n")
+        blocked_ips += parse_blocked_ips("192.168.1.*", "10.2.3.4\n172.16.0.0/12\n172.16.1.1\n")
+        allowed_ips = parse_allowed_ips("default", "172.16.0.0/16\n")
+        cls.rules = DnsServerRules(
+            allowed_names=allowed_names, blocked_names=blocked_names, allowed_ips=allowed_ips, blocked_ips=blocked_ips
+        )
+        cls.minimized, cls.report = minimize_rules(cls.config, cls.rules)
+
+    def test_names(self):
+        self.assertListEqual(
+            sorted((x.group, x.name) for x in self.minimized.blocked_names),
+            [
+                ("192.168.1.*", "example.net"),
+                ("default", "ads.example_x.info"),
+                ("default", "example.com"),
+                ("default", "example.info"),
+                ("default", "example_x.info"),
+                ("default", "tracker.example.org"),
+                ("feed", "example.org"),
+                ("feed", "x.example.org"),
+                ("temp", "ads.example.com"),
+            ],
+        )
+        self.assertDictEqual(self.report["blocked_names"], {"rules": 17, "duplicates": 1, "subsumed": 7})
+        self.assertEqual(self.report["allowed_names"]["subsumed"], 0)
+
+    def test_ips(self):
+        self.assertListEqual(
+            sorted((x.group, x.ip) for x in self.minimized.blocked_ips),
+            [("192.168.1.*", "172.16.0.0/12"), ("default", "10.*"), ("default", "10.0.0.0/8"), ("default", "192.168.0.1")],
+        )
+
+    def test_same_answers(self):
+        db_jobs = []
+        for rules in [self.rules, self.minimized]:
+            db_job = TheDbJob(in_memory=True)
+            db_job.init_db(rules)
+            db_jobs.append(db_job)
+
+        clients = ["127.0.0.1", "192.168.1.100"]
+        names = [
+            "example.com",
+            "ads.example.com",
+            "www.example.com",
+            "ok.example.com",
+            "x.cdn.example.net",
+            "x.example.org",
+            "tracker.example.org",
+            "allowed.example.info",
+            "x.allowed.example.info",
+            "ads.exampleyx.info",
+            "example.dev",
+        ]
+        ips = ["10.1.2.3", "10.2.3.4", "11.0.0.1", "172.16.1.1", "172.17.0.1", "192.168.0.1"]
+        for client_ip in clients:
+            for name in names:
+                results = [type(x.block_names_ex(client_ip, name)) for x in db_jobs]
+                self.assertEqual(results[0], results[1], f"{client_ip} {name}")
+
+            results = [{k: type(v) for k, v in x.block_ips_many(client_ip, ips).items()} for x in db_jobs]
+            self.assertDictEqual(results[0], results[1], client_ip)
+
+        for db_job in db_jobs:
+            db_job.db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
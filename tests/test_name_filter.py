@@ -0,0 +1,67 @@
+import unittest
+from typing import final
+
+from simple.db import TheDbJob
+from simple.models import DnsServerRules
+from simple.name_filter import BloomFilter, NameFilter
+from simple.parse_rules import parse_blocked_names
+
+
+@final
+class NameFilterTests(unittest.TestCase):
+    text = """
+        example.com
+        =www.example.org
+        ads*.example.net
+        _dmarc.example.io
+        tracker
+    """
+
+    def test_bloom(self):
+        bloom = BloomFilter(1000)
+        keys = [f"name{i}.example.com" for i in range(1000)]
+        for x in keys:
+            bloom.add(x)
+
+        self.assertTrue(all(x in bloom for x in keys))
+        false_positives = sum(f"other{i}.example.org" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_may_match(self):
+        name_filter = NameFilter(parse_blocked_names("default", self.text))
+        self.assertTrue(name_filter.may_match("example.com"))
+        self.assertTrue(name_filter.may_match("a.b.EXAMPLE.com"))
+        self.assertTrue(name_filter.may_match("www.example.org"))
+        self.assertTrue(name_filter.may_match("ads1.example.net"))
+        self.assertTrue(name_filter.may_match("x.ads1.example.net"))
+        self.assertTrue(name_filter.may_match("a.tracker"))
+        # sql like reads _ as any character
+        self.assertTrue(name_filter.may_match("x.-dmarc.example.io"))
+        self.assertFalse(name_filter.may_match("example.org"))
+        self.assertFalse(name_filter.may_match("notexample.com"))
+        self.assertFalse(name_filter.may_match("dmarc.example.io"))
+
+        # sqlite glob negates a set with ^
+        name_filter = NameFilter(parse_blocked_names("default", "[^a]*.com"))
+        self.assertTrue(name_filter.may_match("b.com"))
+        self.assertFalse(name_filter.may_match("a.com"))
+        self.assertFalse(name_filter.may_match("anything.org"))
+
+    def test_same_as_sql(self):
+        rules = DnsServerRules(blocked_names=parse_blocked_names("default", self.text))
+        reference = TheDbJob(in_memory=True)
+        reference.init_db(rules, in_memory_rules=False)
+        db_job = TheDbJob(in_memory=True)
+        db_job.init_db(rules)
+        try:
+            names = ["example.com", "x.example.com", "www.example.org", "a.www.example.org", "example.org", "ads.example.net"]
+            names += ["ads2.x.example.net", "_dmarc.example.io", "x.xdmarc.example.io", "tracker", "tracker.com", "com", ""]
+            for name in names:
+                self.assertEqual(db_job.blocked_names("127.0.0.1", name), reference.blocked_names("127.0.0.1", name), name)
+        finally:
+            reference.db.close()
+            db_job.db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from typing import final
+from unittest import mock
+
+import dns.flags
+import dns.message
+import dns.rcode
+
+from simple.config import parse_rate_limit_config
+from simple.models import RateLimitAction, RateLimitConfig
+from simple.rate_limit import minimal_response, RateLimiter, TokenBuckets
+
+
+@final
+class RateLimitTests(unittest.TestCase):
+    def test_minimal_response(self):
+        query = dns.message.make_query("www.example.com", "AAAA", use_edns=True)
+        response = dns.message.from_wire(minimal_response(query.to_wire(), refused=True))
+        self.assertEqual(response.id, query.id)
+        self.assertEqual(response.rcode(), dns.rcode.REFUSED)
+        self.assertTrue(response.flags & dns.flags.QR and response.flags & dns.flags.RD)
+        self.assertEqual(response.question, query.question)
+        self.assertEqual(len(response.additional), 0)
+
+        response = dns.message.from_wire(minimal_response(query.to_wire(), truncated=True))
+        self.assertTrue(response.flags & dns.flags.TC)
+        self.assertEqual(response.rcode(), dns.rcode.NOERROR)
+
+        self.assertIsNone(minimal_response(b"\x00" * 11))
+        self.assertIsNone(minimal_response(query.to_wire()[:20]))
+
+    def test_token_buckets(self):
+        buckets = TokenBuckets(rate=2, burst=3, max_keys=2)
+        self.assertListEqual([buckets.take("a", 10.0) for _ in range(4)], [True, True, True, False])
+        self.assertTrue(buckets.take("a", 10.5))
+        self.assertFalse(buckets.take("a", 10.5))
+        self.assertTrue(buckets.take("b", 10.5))
+        # c forgets the full b (empty a stays)
+        self.assertTrue(buckets.take("c", 11.0))
+        self.assertSetEqual(set(buckets._buckets), {"a", "c"})
+
+    def test_allow_query(self):
+        limiter = RateLimiter()
+        self.assertTrue(all(limiter.allow_query("192.168.1.10") for _ in range(100)))
+
+        exempt_clients = ["127.0.0.1", "10.0.0.[^5]"]
+        limiter.configure(RateLimitConfig(client_qps=1, client_burst=2, subnet_qps=1, subnet_burst=3, exempt_clients=exempt_clients))
+        with mock.patch("simple.rate_limit.time.monotonic", return_value=100.0):
+            self.assertListEqual([limiter.allow_query("192.168.1.10") for _ in range(3)], [True, True, False])
+            # same /24
+            self.assertListEqual([limiter.allow_query("192.168.1.20") for _ in range(2)], [True, False])
+            self.assertTrue(limiter.allow_query("192.168.2.10"))
+            self.assertTrue(all(limiter.allow_query("127.0.0.1") for _ in range(10)))
+            # a client group is a sqlite glob, [^...] negates
+            self.assertTrue(all(limiter.allow_query("10.0.0.6") for _ in range(10)))
+
+        report = limiter.report()
+        self.assertEqual(report["client_limited"], 1)
+        self.assertEqual(report["subnet_limited"], 1)
+        self.assertDictEqual(report["top_limited_clients"], {"192.168.1.10": 1, "192.168.1.20": 1})
+
+    def test_allow_response(self):
+        limiter = RateLimiter()
+        limiter.configure(RateLimitConfig(responses_per_second=2, slip=2))
+        with mock.patch("simple.rate_limit.time.monotonic", return_value=100.0):
+            result = [limiter.allow_response("10.0.0.1", "Example.com.", 1, 0) for _ in range(8)]
+            self.assertTrue(limiter.allow_response("10.0.0.1", "example.org.", 1, 0))
+
+        self.assertListEqual(result, [True, True, True, True, False, None, False, None])
+        self.assertEqual(limiter.counters["responses_truncated"], 2)
+
+    def test_limited_response(self):
+        limiter = RateLimiter()
+        query = dns.message.make_query("example.com", "A").to_wire()
+        self.assertIsNone(limiter.limited_response(query))
+        limiter.configure(RateLimitConfig(client_qps=1, action=RateLimitAction.REFUSED))
+        self.assertEqual(dns.message.from_wire(limiter.limited_response(query)).rcode(), dns.rcode.REFUSED)
+
+    def test_config(self):
+        self.assertEqual(parse_rate_limit_config(None), RateLimitConfig())
+        config = parse_rate_limit_config({"client_qps": 20, "subnet_qps": 100.5, "action": "truncate", "exempt_clients": ["127.0.0.1"]})
+        self.assertEqual(config.action, RateLimitAction.TRUNCATE)
+        self.assertEqual(config.subnet_qps, 100.5)
+        self.assertRaises(ValueError, parse_rate_limit_config, {"client_qps": 0})
+        self.assertRaises(ValueError, parse_rate_limit_config, {"action": "ignore"})
+        self.assertRaises(ValueError, parse_rate_limit_config, {"ipv4_prefix": 33})
+        self.assertRaises(ValueError, parse_rate_limit_config, {"slip": -1})
+
+
+if __name__ == "__main__":
+    unittest.main()
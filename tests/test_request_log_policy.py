@@ -0,0 +1,78 @@
+import unittest
+from typing import final
+from unittest import mock
+
+from simple.config import parse_request_log_policy_config
+from simple.models import RequestLogPolicyConfig
+from simple.request_log_policy import ip_rules_blocked, ip_rules_error, request_log_outcome, RequestLogPolicy
+
+
+@final
+class RequestLogPolicyTests(unittest.TestCase):
+    def test_outcome(self):
+        self.assertEqual(request_log_outcome("NOERROR", "google", False), "noerror")
+        self.assertEqual(request_log_outcome("NXDOMAIN", "google", False), "noerror")
+        self.assertEqual(request_log_outcome("REFUSED", None, False), "blocked")
+        self.assertEqual(request_log_outcome("NOERROR", "google", True), "blocked")
+        self.assertEqual(request_log_outcome(None, "google", False), "error")
+        self.assertEqual(request_log_outcome("SERVFAIL", None, False), "error")
+
+        # the logs already written only have the error text
+        self.assertTrue(ip_rules_blocked(ip_rules_error([], ["1.2.3.4"])))
+        self.assertTrue(ip_rules_blocked('{"blocked":["1.2.3.4"],"allowed":[]}'))
+        self.assertFalse(ip_rules_blocked(ip_rules_error(["1.2.3.4"], [])))
+        self.assertFalse(ip_rules_blocked("TimeoutError: {"))
+
+    def test_should_log(self):
+        config = parse_request_log_policy_config(
+            {
+                "sample": {"noerror": 0, "blocked": 1},
+                "max_per_second": 5,
+                "slow_ms": 500,
+                "skip_clients": ["192.168.1.*"],
+                "skip_names": ["local", "=ads.example.com"],
+            }
+        )
+        policy = RequestLogPolicy(config)
+        self.assertFalse(policy.should_log("127.0.0.1", "example.com", "NOERROR", "google", 10, False))
+        self.assertTrue(policy.should_log("127.0.0.1", "example.com", "NOERROR", "google", 600, False))
+        self.assertTrue(policy.should_log("127.0.0.1", "example.com", "REFUSED", None, 0, False))
+        self.assertTrue(policy.should_log("127.0.0.1", "example.com", "NOERROR", "google", 10, True))
+        self.assertFalse(policy.should_log("192.168.1.5", "example.com", "REFUSED", None, 0, False))
+        self.assertFalse(policy.should_log("127.0.0.1", "printer.local", "REFUSED", None, 0, False))
+        self.assertFalse(policy.should_log("127.0.0.1", "ads.example.com", "REFUSED", None, 0, False))
+        self.assertTrue(policy.should_log("127.0.0.1", "x.ads.example.com", "REFUSED", None, 0, False))
+
+        # errors and slow queries are neither skipped nor capped
+        for _ in range(10):
+            self.assertTrue(policy.should_log("192.168.1.5", "printer.local", None, "google", 10, False))
+            self.assertTrue(policy.should_log("192.168.1.5", "printer.local", "NOERROR", "google", 600, False))
+
+        self.assertDictEqual(policy.dropped, {"skipped": 3, "sampled": 1, "capped": 0})
+
+        # client groups are sqlite globs like the keys of rules: [^...] negates, [!...] is a set with !
+        policy = RequestLogPolicy(parse_request_log_policy_config({"skip_clients": ["10.0.0.[^5]", "10.0.1.[!5]"]}))
+        self.assertFalse(policy.should_log("10.0.0.6", "example.com", "REFUSED", None, 0, False))
+        self.assertTrue(policy.should_log("10.0.0.5", "example.com", "REFUSED", None, 0, False))
+        self.assertTrue(policy.should_log("10.0.1.6", "example.com", "REFUSED", None, 0, False))
+
+    def test_max_per_second(self):
+        policy = RequestLogPolicy(RequestLogPolicyConfig(max_per_second=3))
+        with mock.patch("simple.request_log_policy.time.monotonic", return_value=100.5):
+            result = [policy.should_log("127.0.0.1", "example.com", "NOERROR", "google", 1, False) for _ in range(5)]
+
+        self.assertListEqual(result, [True, True, True, False, False])
+        with mock.patch("simple.request_log_policy.time.monotonic", return_value=101.0):
+            self.assertTrue(policy.should_log("127.0.0.1", "example.com", "NOERROR", "google", 1, False))
+
+    def test_config(self):
+        self.assertEqual(parse_request_log_policy_config(None), RequestLogPolicyConfig())
+        self.assertRaises(ValueError, parse_request_log_policy_config, {"sample": {"noerror": 2}})
+        self.assertRaises(ValueError, parse_request_log_policy_config, {"sample": {"nxdomain": 1}})
+        self.assertRaises(ValueError, parse_request_log_policy_config, {"sample": {"error": 0.5}})
+        self.assertRaises(ValueError, parse_request_log_policy_config, {"skip_names": "local"})
+        self.assertRaises(ValueError, parse_request_log_policy_config, {"max_per_second": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import sqlite3
+import tempfile
+import unittest
+from itertools import islice
+from pathlib import Path
+from typing import final
+
+from simple.binary_log import BinaryRequestLogWriter
+from simple.models import RequestLog
+from simple.request_log_search import parse_time, RequestLogQuery, search_request_logs
+from simple.request_logs import RequestLogStore
+
+
+def _request_log(created: str, client_ip: str, name: str) -> RequestLog:
+    return RequestLog(
+        request_id="1",
+        client_ip=client_ip,
+        name=name,
+        cname=None,
+        question_type="A",
+        response_status="NOERROR",
+        server="google",
+        ms=1,
+        created=created,
+    )
+
+
+@final
+class RequestLogSearchTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temp_dir.name)
+        store = RequestLogStore(self.directory)
+        store.insert(
+            _request_log("2026-10-09 23:00:00", "192.168.1.50", "www.TikTok.com"),
+            _request_log("2026-10-10 08:00:00", "192.168.1.50", "tiktok.com"),
+            _request_log("2026-10-10 09:00:00", "192.168.1.51", "v16.tiktok.com"),
+            _request_log("2026-10-10 10:00:00", "192.168.1.50", "v16.tiktok.com"),
+            _request_log("2026-10-10 10:00:01", "192.168.1.50", "nottiktok.com"),
+        )
+        store.close()
+
+        writer = BinaryRequestLogWriter(self.directory)
+        writer.insert(_request_log("2026-10-10 11:00:00", "192.168.1.50", "m.tiktok.com"))
+        writer.close()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _names(self, query: RequestLogQuery, cursor=None) -> list[str]:
+        return [x.name for _, x in search_request_logs(query, self.directory, cursor)]
+
+    def test_search(self):
+        query = RequestLogQuery(client_ip="192.168.1.50", name="*.tiktok.com")
+        self.assertListEqual(self._names(query), ["www.TikTok.com", "v16.tiktok.com", "m.tiktok.com"])
+
+        query = RequestLogQuery(since=parse_time("2026-10-10 09:00"), until=parse_time("2026-10-10 10:00:01"))
+        self.assertListEqual(self._names(query), ["v16.tiktok.com", "v16.tiktok.com"])
+
+        self.assertListEqual(self._names(RequestLogQuery(name="TIKTOK.com.")), ["tiktok.com"])
+        self.assertListEqual(self._names(RequestLogQuery(name="*tiktok.com", client_ip="192.168.1.51")), ["v16.tiktok.com"])
+        # a set is a set in both backends, the last name is in the binary log
+        self.assertListEqual(self._names(RequestLogQuery(name="[mw]*.tiktok.com")), ["www.TikTok.com", "m.tiktok.com"])
+        self.assertListEqual(self._names(RequestLogQuery(name="[^vw]*.tiktok.com")), ["m.tiktok.com"])
+
+    def test_paging(self):
+        query = RequestLogQuery(client_ip="192.168.1.50")
+        names = []
+        cursor = None
+        while len(page := list(islice(search_request_logs(query, self.directory, cursor), 2))) > 0:
+            names.extend(x.name for _, x in page)
+            cursor = page[-1][0]
+
+        self.assertListEqual(names, ["www.TikTok.com", "tiktok.com", "v16.tiktok.com", "nottiktok.com", "m.tiktok.com"])
+
+    def test_index(self):
+        db = sqlite3.connect(self.directory.joinpath("2026-10-10.sqlite3"))
+        sql = """ explain query plan select * from request_logs where "client_ip" = ? and "created_epoch" >= ? order by "created_epoch", "id" """
+        plan = " ".join(x[-1] for x in db.execute(sql, ("192.168.1.50", 0)).fetchall())
+        db.close()
+        self.assertIn("request_logs_client_ip", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_upgrade_partition(self):
+        db = sqlite3.connect(self.directory.joinpath("2026-10-01.sqlite3"))
+        sql = """
+            create table request_logs
+            (
+                "id"              integer primary key autoincrement,
+                "request_id"      text not null,
+                "client_ip"       text not null,
+                "name"            text not null,
+                "cname"           text null,
+                "question_type"   text not null,
+                "response_status" text null,
+                "server"          text null,
+                "ms"              real not null,
+                "error"           text null,
+                "created"         text not null default current_timestamp
+            );
+            insert into request_logs ("request_id", "client_ip", "name", "question_type", "ms", "created")
+                 values ('1', '192.168.1.50', 'old.tiktok.com', 'A', 1, '2026-10-01 00:00:00');
+        """
+        db.executescript(sql)
+        db.close()
+
+        self.assertListEqual(self._names(RequestLogQuery(until=parse_time("2026-10-02"), name="*.tiktok.com")), ["old.tiktok.com"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+from typing import final
+
+from simple.config import parse_request_logs_config
+from simple.db import TheDbJob
+from simple.models import RequestLog, RequestLogsConfig
+from simple.request_logs import RequestLogStore
+
+
+def _request_log(created: str) -> RequestLog:
+    return RequestLog(
+        request_id="1",
+        client_ip="127.0.0.1",
+        name="example.com",
+        cname=None,
+        question_type="A",
+        response_status="NOERROR",
+        server=None,
+        ms=1,
+        created=created,
+    )
+
+
+@final
+class RequestLogStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = RequestLogStore(Path(self.temp_dir.name))
+        for day, count in [("2026-10-01", 3), ("2026-10-02", 2), ("2026-10-09", 4), ("2026-10-10", 1)]:
+            self.store.insert(*[_request_log(f"{day} 10:00:00") for _ in range(count)])
+
+        self.store.close()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_partitions(self):
+        self.assertListEqual([x for x, _ in self.store.partitions()], ["2026-10-01", "2026-10-02", "2026-10-09", "2026-10-10"])
+        self.assertEqual(self.store.rows("2026-10-09"), 4)
+
+    def test_prune_retention_days(self):
+        dropped = self.store.prune(RequestLogsConfig(retention_days=2), today=date(2026, 10, 10))
+        self.assertListEqual(dropped, ["2026-10-01", "2026-10-02"])
+        self.assertListEqual([x for x, _ in self.store.partitions()], ["2026-10-09", "2026-10-10"])
+
+    def test_prune_max_rows(self):
+        dropped = self.store.prune(RequestLogsConfig(retention_days=None, max_rows=5), today=date(2026, 10, 10))
+        self.assertListEqual(dropped, ["2026-10-01", "2026-10-02"])
+
+        # today is never dropped
+        dropped = self.store.prune(RequestLogsConfig(retention_days=None, max_rows=1), today=date(2026, 10, 10))
+        self.assertListEqual(dropped, ["2026-10-09"])
+        self.assertListEqual([x for x, _ in self.store.partitions()], ["2026-10-10"])
+
+    def test_migrate_legacy(self):
+        db_job = TheDbJob(in_memory=True)
+        sql = """
+            create table request_logs
+            (
+                "id"              integer primary key autoincrement,
+                "request_id"      text not null,
+                "client_ip"       text not null,
+                "name"            text not null,
+                "cname"           text null,
+                "question_type"   text not null,
+                "response_status" text null,
+                "server"          text null,
+                "ms"              real not null,
+                "error"           text null,
+                "created"         text not null default current_timestamp
+            );
+        """
+        db_job.db.executescript(sql)
+        for created in ["2026-09-01 10:00:00", "2026-10-05 10:00:00", "2026-10-05 11:00:00", "2026-10-11 10:00:00"]:
+            sql = """ insert into request_logs ("request_id", "client_ip", "name", "question_type", "ms", "created") values (?, ?, ?, ?, ?, ?) """
+            db_job.db.execute(sql, ("1", "127.0.0.1", "example.com", "A", 1, created))
+
+        # past retention_days only deleted, the rest moved to the day partitions, two per round
+        self.assertEqual(db_job.migrate_legacy_request_logs(self.store, "2026-10-01 00:00:00", chunk=2), 1)
+        self.assertEqual(db_job.migrate_legacy_request_logs(self.store, "2026-10-01 00:00:00", chunk=2), 2)
+        self.assertEqual(db_job.migrate_legacy_request_logs(self.store, "2026-10-01 00:00:00", chunk=2), 1)
+        self.assertIsNone(db_job.migrate_legacy_request_logs(self.store, "2026-10-01 00:00:00", chunk=2))
+        self.store.close()
+        db_job.db.close()
+
+        self.assertListEqual(
+            [x for x, _ in self.store.partitions()], ["2026-10-01", "2026-10-02", "2026-10-05", "2026-10-09", "2026-10-10", "2026-10-11"]
+        )
+        self.assertEqual(self.store.rows("2026-10-05"), 2)
+
+    def test_config(self):
+        self.assertEqual(parse_request_logs_config(None), RequestLogsConfig())
+        self.assertEqual(parse_request_logs_config({"retention_days": None}), RequestLogsConfig(retention_days=None))
+        self.assertEqual(parse_request_logs_config({"max_rows": 10}), RequestLogsConfig(max_rows=10))
+        self.assertEqual(parse_request_logs_config({"rollups": False}), RequestLogsConfig(rollups=False))
+        self.assertRaises(ValueError, parse_request_logs_config, {"retention_days": 0})
+        self.assertRaises(ValueError, parse_request_logs_config, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import tempfile
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from typing import final, Optional
+
+from simple.models import RequestLog, RequestLogsConfig
+from simple.request_logs import created_epoch
+from simple.rollups import LatencySketch, prune_rollups, rollups_file, RollupStore
+
+
+def _request_log(created: str, name: str, response_status: Optional[str], server: Optional[str], ms: float) -> RequestLog:
+    return RequestLog(
+        request_id="1",
+        client_ip="127.0.0.1",
+        name=name,
+        cname=None,
+        question_type="A",
+        response_status=response_status,
+        server=server,
+        ms=ms,
+        created=created,
+    )
+
+
+@final
+class RollupStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = RollupStore(rollups_file(Path(self.temp_dir.name)))
+        # the writer adds batch by batch, rows of the same bucket are merged
+        self.store.add([_request_log("2026-10-10 10:00:01", "ads.example.com", "REFUSED", None, 0.1) for _ in range(3)])
+        self.store.add([_request_log("2026-10-10 10:00:02", "example.com", "NOERROR", "google", ms) for ms in range(1, 101)])
+        self.store.add([_request_log("2026-10-10 10:30:00", "example.com", "NOERROR", "google", 200)])
+        self.store.add([_request_log("2026-10-10 10:30:00", "example.org", "NOERROR", "cloudflare", 10)])
+
+    def tearDown(self):
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_top(self):
+        hour = created_epoch("2026-10-10 10:00:00")
+        self.assertListEqual(
+            self.store.top("name", hour),
+            [
+                {"key": "example.com", "count": 101, "blocked": 0, "errors": 0},
+                {"key": "ads.example.com", "count": 3, "blocked": 3, "errors": 0},
+                {"key": "example.org", "count": 1, "blocked": 0, "errors": 0},
+            ],
+        )
+        self.assertListEqual([x["key"] for x in self.store.top("name", hour, order_by="blocked")], ["ads.example.com"])
+        self.assertListEqual([x["count"] for x in self.store.top("client_ip", hour)], [105])
+
+        # not a whole hour, minute rows then
+        self.assertListEqual([x["key"] for x in self.store.top("name", hour + 60)], ["example.com", "example.org"])
+
+    def test_latency(self):
+        result = self.store.latency(created_epoch("2026-10-10 10:00:00"))
+        self.assertListEqual([x["server"] for x in result], ["cloudflare", "google"])
+        google = result[1]
+        self.assertEqual(google["count"], 101)
+        self.assertAlmostEqual(google["p50"], 51, delta=51 * 0.05)
+        self.assertAlmostEqual(google["p95"], 96, delta=96 * 0.05)
+
+    def test_attempts(self):
+        hour = created_epoch("2026-10-11 10:00:00")
+        # the first upstream of `default` times out, the second answers: one query
+        failed = replace(_request_log("2026-10-11 10:00:01", "example.net", None, None, 2000), request_id="2")
+        self.store.add([failed])
+        self.store.add([replace(_request_log("2026-10-11 10:00:03", "example.net", "NOERROR", "cloudflare", 10), request_id="2")])
+        # no upstream answers: counted once no other log of it came for a while, or when the store closes
+        self.store.add([replace(failed, request_id="3"), replace(failed, request_id="3")])
+        self.assertListEqual(self.store.top("name", hour), [{"key": "example.net", "count": 1, "blocked": 0, "errors": 0}])
+
+        self.store.add([_request_log("2026-10-11 10:02:00", "example.org", "NOERROR", "google", 10)])
+        self.assertListEqual(
+            [(x["key"], x["count"], x["errors"]) for x in self.store.top("name", hour)], [("example.net", 2, 1), ("example.org", 1, 0)]
+        )
+
+    def test_sketch(self):
+        sketch = LatencySketch()
+        for ms in range(1, 1001):
+            sketch.add(ms)
+
+        sketch = LatencySketch.loads(sketch.dumps()).merge(LatencySketch.loads(None))
+        self.assertEqual(sketch.count, 1000)
+        self.assertAlmostEqual(sketch.quantile(0.99), 990, delta=990 * 0.05)
+
+    def test_prune(self):
+        directory = Path(self.temp_dir.name)
+        now = created_epoch("2026-10-12 00:00:00")
+        prune_rollups(RequestLogsConfig(retention_days=30), now=now, directory=directory)
+        self.assertEqual(len(self.store.top("name", created_epoch("2026-10-10 10:01:00"))), 0)
+        self.assertEqual(len(self.store.top("name", created_epoch("2026-10-10 10:00:00"))), 3)
+
+        prune_rollups(RequestLogsConfig(retention_days=1), now=now, directory=directory)
+        self.assertEqual(len(self.store.top("name", created_epoch("2026-10-10 10:00:00"))), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
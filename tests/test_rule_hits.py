@@ -0,0 +1,64 @@
+import tempfile
+import unittest
+from pathlib import Path
+from typing import final
+
+from simple.config import ConfigFile, parse_config_from_object
+from simple.models import AppArgs, BlockedIpItem, BlockedNameItem
+from simple.rule_hits import rule_hits_file, RuleHits, RuleHitStore, unused_rules
+
+
+@final
+class RuleHitsTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.temp_dir.name)
+        self.store = RuleHitStore(rule_hits_file(self.data_dir))
+
+    def tearDown(self):
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_flush(self):
+        hits = RuleHits()
+        ads = BlockedNameItem(group="default", name="ads.example.com", use_glob=False)
+        hits.hit("blocked_names", ads)
+        self.assertDictEqual(hits.drain(), {})
+
+        hits.enabled = True
+        hits.hit("blocked_names", ads)
+        hits.hit("blocked_names", BlockedNameItem(group="default", name="ads.example.com", use_glob=False))
+        # one answer, one hit
+        ip = BlockedIpItem(group="192.168.0.*", ip="10.0.0.1", use_glob=False)
+        hits.hit_many("blocked_ips", [ip, ip])
+        self.assertEqual(hits.flush(self.store, now=1000), 3)
+        hits.hit("blocked_names", ads)
+        self.assertEqual(hits.flush(self.store, now=2000), 1)
+
+        self.assertDictEqual(self.store.hits("blocked_names"), {("default", "ads.example.com"): (3, 2000)})
+        self.assertDictEqual(self.store.hits("blocked_ips"), {("192.168.0.*", "10.0.0.1"): (1, 1000)})
+
+    def test_unused_rules(self):
+        self.data_dir.joinpath("blocked-names.txt").write_text("ads.example.com\ntracker.example.com\n")
+        self.data_dir.joinpath("blocked-names-2.txt").write_text("ads.example.com\n")
+        o = {
+            "default": ["google"],
+            "upstream": {"google": ["8.8.8.8"]},
+            "rules": {"blocked_names": ["blocked-names.txt", "blocked-names-2.txt"], "allowed_names": ["missing.txt"]},
+        }
+        config = parse_config_from_object(o)
+        self.store.add({("blocked_names", "default", "ads.example.com"): 5, ("blocked_names", "default", "old.example.com"): 1}, 100)
+        self.store.add({("blocked_names", "default", "tracker.example.com"): 2}, 100 - 31 * 86400)
+        rule_text = ConfigFile(AppArgs(data_dir=self.data_dir)).rule_text
+
+        result = unused_rules(config, rule_text, self.store, 30, now=100)
+        self.assertFalse(result["complete"])
+        self.assertListEqual(
+            [(x["source"], x["rules"], x["hits"], x["unused_rules"]) for x in result["sources"]],
+            [("blocked-names.txt", 2, 7, ["tracker.example.com"]), ("blocked-names-2.txt", 1, 5, [])],
+        )
+        self.assertListEqual(unused_rules(config, rule_text, self.store, 30, kinds=["blocked_ips"], now=100)["sources"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
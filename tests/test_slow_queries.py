@@ -0,0 +1,51 @@
+import json
+import tempfile
+import time
+import unittest
+from datetime import date
+from pathlib import Path
+from typing import final
+
+from simple.slow_queries import SlowQueryLog
+
+
+@final
+class SlowQueriesTests(unittest.TestCase):
+    def test_slow_query_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = SlowQueryLog(Path(directory))
+            request = object()
+            log.accepted(request)
+            timings = log.timings(request)
+            # off: nothing is timed
+            self.assertEqual(timings.stages, [])
+            with timings.stage("parse"):
+                pass
+
+            log.finish(timings, name="example.com")
+            self.assertEqual(list(Path(directory).iterdir()), [])
+
+            log.configure(5)
+            for sleep in [0, 0.01]:
+                log.accepted(request)
+                timings = log.timings(request)
+                with timings.stage("names", "example.com"):
+                    time.sleep(sleep)
+
+                log.finish(timings, name="example.com")
+
+            (file,) = Path(directory).iterdir()
+            (line,) = file.read_text().splitlines()
+            o = json.loads(line)
+            self.assertEqual(o["name"], "example.com")
+            self.assertGreaterEqual(o["ms"], 5)
+            self.assertEqual([x["stage"] for x in o["stages"]], ["thread_wait", "names"])
+            self.assertEqual(o["stages"][1]["detail"], "example.com")
+
+            Path(directory).joinpath("2020-01-01.jsonl").write_text("")
+            self.assertEqual(log.prune(30, date(2020, 3, 1)), ["2020-01-01"])
+            self.assertEqual(log.prune(None), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
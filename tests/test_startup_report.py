@@ -0,0 +1,37 @@
+import unittest
+from ipaddress import ip_address
+from typing import final
+
+from simple.models import DnsServerConfig, DnsServerUpstream, DnsServerUpstreamProtocol
+from simple.startup_report import StartupReport, uses_https
+
+
+@final
+class StartupReportTests(unittest.TestCase):
+    def test_report(self):
+        report = StartupReport()
+        with report.stage("config"):
+            pass
+
+        with report.stage("config"):
+            pass
+
+        result = report.report(first_answer_ms=1.5)
+        self.assertListEqual(list(result["stages_ms"]), ["config"])
+        self.assertGreaterEqual(result["total_ms"], result["stages_ms"]["config"])
+        self.assertEqual(result["first_answer_ms"], 1.5)
+
+    def test_uses_https(self):
+        def config(*protocols) -> DnsServerConfig:
+            upstream = {
+                f"u{i}": DnsServerUpstream(name=f"u{i}", ip=[ip_address("8.8.8.8")], preferred_protocol=x) for i, x in enumerate(protocols)
+            }
+            return DnsServerConfig(ipv6=False, default=list(upstream), upstream=upstream)
+
+        self.assertFalse(uses_https(config(DnsServerUpstreamProtocol.UDP, DnsServerUpstreamProtocol.TLS)))
+        self.assertTrue(uses_https(config(DnsServerUpstreamProtocol.UDP, None)))
+        self.assertTrue(uses_https(config(DnsServerUpstreamProtocol.HTTPS)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import dataclasses
+import http.server
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from typing import final
+from unittest import mock
+
+from simple.app_args import app_args
+from simple.config import ConfigFile, parse_config_from_object
+from simple.db import TheDbJob
+from simple.models import AppArgs
+from simple.subscriptions import SubscriptionRefresher, SubscriptionStore
+
+
+class _ListHandler(http.server.BaseHTTPRequestHandler):
+    """a blocklist server stand-in: the body of the server, its etag, 304 when the client has it"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.headers.get("If-None-Match"))
+        etag = f'"{hash(server.body) & 0xFFFF:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        data = server.body.encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@final
+class SubscriptionsTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _ListHandler)
+        self.server.body = "ads.example.com\nshared.example.com\n"
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def test_refresh(self):
+        data_dir = Path(self.temp_dir.name)
+        data_dir.joinpath("blocked-names.txt").write_text("shared.example.com\n")
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/blocked-names.txt"
+        o = {"default": ["google"], "upstream": {"google": ["8.8.8.8"]}, "rules": {"blocked_names": [url, "blocked-names.txt"]}}
+        config = parse_config_from_object(o)
+        config_file = ConfigFile(AppArgs(data_dir=data_dir))
+        refresher = SubscriptionRefresher(config, config_file.rule_text, SubscriptionStore(data_dir.joinpath("temp", "subscriptions")))
+
+        with mock.patch("simple.db.app_args", dataclasses.replace(app_args, data_dir=data_dir)):
+            # not downloaded yet, the server starts with what there is
+            db_job = TheDbJob()
+            db_job.init_db(config_file.read_dns_server_rules(config))
+            self.assertListEqual([x.name for x in db_job.rules_by_group("blocked_names", "default")], ["shared.example.com"])
+
+            self.assertListEqual([(x["added"], x["removed"]) for x in refresher.run()], [(1, 0)])
+            self.assertIsNotNone(db_job.blocked_names("192.168.0.100", "x.ads.example.com"))
+            self.assertEqual(config_file.rule_text(url), self.server.body)
+
+            # not due yet, then a 304
+            self.assertListEqual(refresher.run(), [])
+            self.assertListEqual(refresher.run(now=4102444800), [])
+            self.assertEqual(len(self.server.requests), 2)
+            self.assertIsNotNone(self.server.requests[1])
+
+            self.server.body = "tracker.example.com\n"
+            self.assertListEqual([(x["added"], x["removed"]) for x in refresher.run(now=4102444800)], [(1, 1)])
+            self.assertIsNone(db_job.blocked_names("192.168.0.100", "x.ads.example.com"))
+            self.assertIsNotNone(db_job.blocked_names("192.168.0.100", "tracker.example.com"))
+            # the rule of the file stays, even though the list dropped it
+            self.assertIsNotNone(db_job.blocked_names("192.168.0.100", "shared.example.com"))
+
+            # the next start reads the download
+            self.assertListEqual(
+                sorted(x.name for x in config_file.read_dns_server_rules(config).blocked_names),
+                ["shared.example.com", "tracker.example.com"],
+            )
+            db_job.db.close()
+
+    def test_config(self):
+        o = {"default": ["google"], "upstream": {"google": ["8.8.8.8"]}, "subscriptions": {"refresh_minutes": 60}}
+        self.assertEqual(parse_config_from_object(dict(o)).subscriptions.refresh_minutes, 60)
+        o["rules"] = {"forwarding_rules": {"google": "https://example.com/forwarding-rules.txt"}}
+        self.assertRaises(ValueError, parse_config_from_object, o)
+
+
+if __name__ == "__main__":
+    unittest.main()